@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark da montagem do corpo de GET /sessions/{session_id}/history.
+
+Compara o caminho anterior (mensagens gravadas -> ChatMessage ->
+ChatMessageRequest -> ConversationHistory -> JSON) com o atual (corpo montado
+com as mensagens no JSON da API, copiadas como estão quando gravadas em
+"json"). Mede apenas a CPU de montagem, sem Redis e sem rede.
+
+Usage: python bench_history.py [--requests 500] [--messages 40]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+from pydantic import BaseModel, TypeAdapter
+
+from sub_crew import fast_json
+from sub_crew.memory import ChatMessage
+from sub_crew.message_codec import decode_message, encode_message, to_wire
+
+QUESTION = "O síndico pode contratar um contador sem aprovação da assembleia?"
+ANSWER = (
+    "De acordo com o Código Civil (Lei nº 10.406/2002), o síndico é o representante legal "
+    "do condomínio e deve prestar contas à assembleia. É importante verificar o que dispõe "
+    "a convenção do condomínio. Espero ter ajudado! Se tiver mais dúvidas, estou à disposição."
+)
+
+
+# Modelos da API (sub_crew.api), copiados para não subir o app nem conectar ao Redis
+class ChatMessageRequest(BaseModel):
+    content: str
+    sender: str
+    timestamp: Optional[datetime] = None
+
+
+class ConversationHistory(BaseModel):
+    session_id: str
+    messages: List[ChatMessageRequest]
+
+
+_history_adapter = TypeAdapter(ConversationHistory)
+
+
+def previous_body(session_id: str, entries: List[bytes]) -> bytes:
+    """Caminho anterior: objetos intermediários e serialização pelo FastAPI/Pydantic."""
+    conversation = [ChatMessage(**decode_message(raw)) for raw in entries]
+    history = ConversationHistory(
+        session_id=session_id,
+        messages=[
+            ChatMessageRequest(content=msg.content, sender=msg.sender, timestamp=msg.timestamp)
+            for msg in conversation
+        ]
+    )
+    return _history_adapter.dump_json(history)
+
+
+def current_body(session_id: str, entries: List[bytes]) -> bytes:
+    """Caminho atual: corpo montado com as mensagens já no JSON da API."""
+    messages = [to_wire(raw) for raw in entries]
+    return fast_json.dumps({"session_id": session_id})[:-1] + b',"messages":[' + b",".join(messages) + b"]}"
+
+
+def build_entries(count: int, encoding: str) -> List[bytes]:
+    start = datetime.now().replace(microsecond=0) - timedelta(hours=1)
+    entries = []
+    for i in range(count):
+        content, sender = (QUESTION, "user") if i % 2 == 0 else (ANSWER * 3, "assistant")
+        entries.append(encode_message(content, sender, start + timedelta(seconds=i, milliseconds=123),
+                                      encoding=encoding, compression_threshold=512))
+    return entries
+
+
+def measure(name: str, build, entries: List[bytes], requests: int) -> float:
+    start = time.process_time()
+    for _ in range(requests):
+        build("bench-session", entries)
+    cpu = time.process_time() - start
+    print(f"  {name:<10} cpu/requisição={cpu * 1e6 / requests:8.1f} µs")
+    return cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do corpo do histórico")
+    parser.add_argument("--requests", type=int, default=500, help="Requisições simuladas")
+    parser.add_argument("--messages", type=int, default=40, help="Mensagens por sessão")
+    args = parser.parse_args()
+
+    print(f"📊 {args.requests} requisições de histórico com {args.messages} mensagens "
+          f"(orjson: {'sim' if fast_json.orjson is not None else 'não'})")
+    if fast_json.orjson is None:
+        print("⚠️  orjson não instalado (pip install -e .): medindo o fallback com json, mais lento")
+    for encoding in ("compact", "json"):
+        entries = build_entries(args.messages, encoding)
+        assert json.loads(previous_body("s", entries)) == json.loads(current_body("s", entries))
+        print(f"MESSAGE_ENCODING={encoding}")
+        previous = measure("anterior", previous_body, entries, args.requests)
+        current = measure("atual", current_body, entries, args.requests)
+        print(f"  ✅ CPU {previous / current:.1f}x menor por requisição")
+
+
+if __name__ == "__main__":
+    main()
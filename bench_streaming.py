@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark do enquadramento SSE de /chat/stream.
+
+Compara o formato anterior (um chunk por palavra, com uuid4, timestamp e
+json.dumps completos a cada chunk) com o atual (moldura pré-montada e frames
+de ~SSE_FRAME_CHARS caracteres). Mede apenas a CPU de montagem dos frames,
+sem rede e sem as pausas entre frames.
+
+Usage: python bench_streaming.py [--answers 200] [--frame-chars 64]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+from sub_crew.sse import ChunkEnvelope, split_frames
+
+PARAGRAPH = (
+    "De acordo com o artigo 1.348 do Código Civil, compete ao síndico convocar a assembleia "
+    "dos condôminos, representar o condomínio ativa e passivamente, prestar contas à assembleia "
+    "anualmente e sempre que exigidas, e cuidar da conservação e guarda das partes comuns.\n\n"
+)
+
+
+def legacy_frames(text: str):
+    """Formato anterior: um chunk completo por palavra."""
+    words = text.split()
+    for i, word in enumerate(words):
+        chunk = {
+            "id": str(uuid.uuid4()),
+            "object": "text_completion.chunk",
+            "created": int(datetime.now().timestamp()),
+            "model": "sindico-pro-crew",
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": {"content": word + (" " if i < len(words) - 1 else "")},
+                    "finish_reason": None
+                }
+            ]
+        }
+        yield f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+
+
+def current_frames(text: str, frame_chars: int):
+    """Formato atual: moldura montada uma vez e frames agrupados."""
+    envelope = ChunkEnvelope()
+    for frame in split_frames(text, frame_chars):
+        yield envelope.content(frame)
+    yield envelope.final
+
+
+def measure(name: str, frames_for, answers: list):
+    frames = 0
+    total_bytes = 0
+    start = time.process_time()
+    for answer in answers:
+        for frame in frames_for(answer):
+            frames += 1
+            total_bytes += len(frame)
+    cpu = time.process_time() - start
+    text_kb = sum(len(a.encode("utf-8")) for a in answers) / 1024
+    print(f"{name:<10} frames={frames:>7}  bytes={total_bytes:>9}  "
+          f"cpu={cpu * 1000:8.1f} ms  cpu/KB de resposta={cpu * 1e6 / text_kb:7.1f} µs")
+    return cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do enquadramento SSE")
+    parser.add_argument("--answers", type=int, default=200, help="Respostas simuladas")
+    parser.add_argument("--paragraphs", type=int, default=6, help="Parágrafos por resposta")
+    parser.add_argument("--frame-chars", type=int, default=int(os.getenv("SSE_FRAME_CHARS", "64")))
+    args = parser.parse_args()
+
+    answers = [PARAGRAPH * args.paragraphs] * args.answers
+    print(f"📊 {args.answers} respostas de {len(answers[0])} caracteres")
+    legacy = measure("anterior", legacy_frames, answers)
+    current = measure("atual", lambda text: current_frames(text, args.frame_chars), answers)
+    print(f"✅ CPU {legacy / current:.1f}x menor por KB transmitido")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,20 +2,43 @@
 """
 API FastAPI para o chatbot especializado em questões condominiais brasileiras.
 """
+import os
 import uuid
 from datetime import datetime
-from typing import List, Dict, Optional
-from fastapi import FastAPI, HTTPException, Depends
+from typing import List, Dict, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+from starlette.requests import HTTPConnection
 import uvicorn
 import asyncio
+import base64
 import json
+import math
+import time
 
+from sub_crew.conversation import (
+    CONTEXT_MESSAGES,
+    SessionContext,
+    prepare_context_for_crew,
+    extract_response_from_result,
+    run_chat_turn
+)
 from sub_crew.crew import SubCrew
+from sub_crew import fast_json
+from sub_crew.http_cache import json_response, not_modified, version_etag
+from sub_crew.jobs import create_job_queue
+from sub_crew.llm_governor import get_llm_governor
+from sub_crew.llm_resilience import get_llm_caller
 from sub_crew.memory import ChatMessage
 from sub_crew.memory_factory import memory
+from sub_crew.metrics import metrics
+from sub_crew.progress import ProgressTracker, events_until
+from sub_crew import run_control
+from sub_crew.rate_limit import RateLimitExceeded, client_address, create_rate_limiter
+from sub_crew.run_control import RunCancelled, RunControl, RunTimeout, run_in_scope
+from sub_crew.sse import HEARTBEAT_FRAME, SSE_HEADERS, ChunkEnvelope, error_frame, heartbeats_until, split_frames
 
 # Configuração da API
 app = FastAPI(
@@ -33,7 +56,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Instância global do sistema de memória (configurada automaticamente)
+# Fila de jobs de chat processados pelos workers (sub_crew.worker)
+job_queue = create_job_queue(memory.redis_client, memory.key_prefix)
+
+# Limite de perguntas e execuções simultâneas por usuário (None se desativado)
+rate_limiter = create_rate_limiter(memory.redis_client, memory.key_prefix)
+# Proxies confiáveis na frente da API (ex.: load balancer); o IP dos usuários
+# anônimos vem do X-Forwarded-For que eles acrescentam
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "0"))
+
+# Streaming SSE: heartbeat durante o crew, tamanho e intervalo dos frames da resposta
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_FRAME_CHARS = int(os.getenv("SSE_FRAME_CHARS", "64"))
+SSE_FRAME_INTERVAL = float(os.getenv("SSE_FRAME_INTERVAL", "0.05"))
+# Eventos "progress" (etapa do crew, delegações, ferramentas) antes da resposta
+SSE_PROGRESS_EVENTS = os.getenv("SSE_PROGRESS_EVENTS", "true").lower() == "true"
+
+# Intervalo (segundos) entre verificações de desconexão do cliente durante o crew
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "1"))
+
+# Prazo de cada execução do crew (segundos): padrão e máximo aceito no cabeçalho X-Request-Timeout
+REQUEST_TIMEOUT_DEFAULT = float(os.getenv("REQUEST_TIMEOUT_DEFAULT", "120"))
+REQUEST_TIMEOUT_MAX = float(os.getenv("REQUEST_TIMEOUT_MAX", "300"))
+
+# Tamanho das páginas de sessões e de histórico (padrão e máximo)
+SESSIONS_PAGE_DEFAULT = 20
+SESSIONS_PAGE_MAX = 100
+HISTORY_PAGE_DEFAULT = 50
+HISTORY_PAGE_MAX = 200
+
+# Perguntas por lote e execuções simultâneas de um mesmo lote (POST /chat/batch)
+BATCH_MAX_QUESTIONS = int(os.getenv("CHAT_BATCH_MAX_QUESTIONS", "100"))
+BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "4"))
 
 # Modelos Pydantic
 class ChatMessageRequest(BaseModel):
@@ -63,6 +117,55 @@ class ConversationHistory(BaseModel):
     session_id: str
     messages: List[ChatMessageRequest]
 
+_session_list = TypeAdapter(List[SessionInfo])
+
+class SessionPage(BaseModel):
+    sessions: List[SessionInfo]
+    next_cursor: Optional[str] = None  # None na última página
+
+class HistoryPage(BaseModel):
+    session_id: str
+    messages: List[ChatMessageRequest]  # Da mais recente para a mais antiga
+    total_messages: int
+    next_cursor: Optional[str] = None  # None na última página
+
+class BatchQuestion(BaseModel):
+    message: str
+    session_id: Optional[str] = None
+
+class BatchChatRequest(BaseModel):
+    questions: List[BatchQuestion]
+    user_id: Optional[str] = None
+
+class WebSocketChatMessage(BaseModel):
+    message: str = Field(min_length=1)
+    timeout: Optional[float] = Field(default=None, gt=0)  # Prazo da rodada em segundos
+
+class ChatJobResponse(BaseModel):
+    job_id: str
+    status: str  # "queued", "running", "completed" ou "failed"
+    session_id: str
+    created_at: datetime
+    updated_at: datetime
+    user_id: Optional[str] = None
+    message: Optional[str] = None  # Resposta do assistente quando concluído
+    error: Optional[str] = None
+
+@app.on_event("startup")
+async def start_background_tasks():
+    # Migrar mensagens gravadas em outra codificação sem bloquear a inicialização
+    if os.getenv("MESSAGE_ENCODING_MIGRATE", "false").lower() in ("true", "1", "yes"):
+        memory.start_encoding_migration()
+    
+    # Descarregar sessões inativas para o disco periodicamente
+    if memory.offload_store is not None:
+        memory.start_offloader(float(os.getenv("MEMORY_OFFLOAD_INTERVAL", "600")))
+
+@app.on_event("shutdown")
+def stop_background_tasks():
+    # Gravar as mensagens ainda no buffer de write-behind
+    memory.close()
+
 # Dependência para obter o crew
 def get_crew():
     return SubCrew()
@@ -81,45 +184,27 @@ async def root():
 @app.post("/chat", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
+    http_request: Request,
     crew: SubCrew = Depends(get_crew)
 ):
     """
     Endpoint principal para conversar com o chatbot.
     Mantém contexto da conversa através do session_id e user_id.
     """
+    control = RunControl(timeout=_request_timeout(http_request))
+    rate_key = _rate_limit_key(request, http_request)
+    lease_id = _acquire_run_slot(rate_key)
     try:
         # Gerar session_id se não fornecido
         session_id = request.session_id or str(uuid.uuid4())
         user_id = request.user_id
         
-        # Adicionar mensagem do usuário ao histórico
-        user_message = ChatMessage(
-            content=request.message,
-            sender="user",
-            timestamp=datetime.now()
+        # Executar rodada completa (pergunta, crew e resposta no histórico),
+        # cancelada se o cliente desconectar ou o prazo acabar
+        response_text = await _run_until_disconnect(
+            http_request, "chat", control,
+            run_chat_turn, crew, memory, request.message, session_id, user_id
         )
-        memory.add_message(session_id, user_message, user_id)
-        
-        # Obter histórico da conversa
-        conversation_history = memory.get_conversation(session_id, user_id)
-        
-        # Preparar contexto para o crew
-        context = _prepare_context_for_crew(conversation_history, request.message)
-        
-        # Executar crew com contexto
-        crew_instance = crew.crew()
-        result = crew_instance.kickoff(inputs=context)
-        
-        # Extrair resposta do resultado
-        response_text = _extract_response_from_result(result)
-        
-        # Adicionar resposta do assistente ao histórico
-        assistant_message = ChatMessage(
-            content=response_text,
-            sender="assistant",
-            timestamp=datetime.now()
-        )
-        memory.add_message(session_id, assistant_message, user_id)
         
         # Gerar ID único para a mensagem
         message_id = str(uuid.uuid4())
@@ -132,21 +217,32 @@ async def chat(
             user_id=user_id
         )
         
+    except RunTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e)) from e
+    except RunCancelled as e:
+        # Cliente já desconectou; código no padrão do nginx
+        raise HTTPException(status_code=499, detail=str(e)) from e
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Erro ao processar mensagem: {str(e)}"
         ) from e
+    finally:
+        _release_run_slot(rate_key, lease_id)
 
 @app.post("/chat/stream")
 async def chat_stream(
     request: ChatRequest,
+    http_request: Request,
     crew: SubCrew = Depends(get_crew)
 ):
     """
     Endpoint para streaming de respostas do chatbot.
     Retorna resposta em tempo real conforme é gerada.
     """
+    control = RunControl(timeout=_request_timeout(http_request))
+    rate_key = _rate_limit_key(request, http_request)
+    lease_id = _acquire_run_slot(rate_key)
     try:
         # Gerar session_id se não fornecido
         session_id = request.session_id or str(uuid.uuid4())
@@ -160,67 +256,35 @@ async def chat_stream(
         )
         memory.add_message(session_id, user_message, user_id)
         
-        # Obter histórico da conversa
-        conversation_history = memory.get_conversation(session_id, user_id)
+        # Obter apenas o trecho do histórico usado no contexto
+        conversation_history = memory.get_recent_messages(session_id, CONTEXT_MESSAGES, user_id)
         
         # Preparar contexto para o crew
-        context = _prepare_context_for_crew(conversation_history, request.message)
+        context = prepare_context_for_crew(conversation_history, request.message)
         
         # Função para gerar resposta em streaming
         async def generate_stream():
+            envelope = ChunkEnvelope()
+            events, tracker = _progress_tracker(SSE_PROGRESS_EVENTS)
+            # Executar crew com contexto fora do event loop, com eventos de
+            # progresso e heartbeats enquanto a resposta não fica pronta
+            crew_task = asyncio.ensure_future(_run_until_disconnect(
+                http_request, "stream", control,
+                lambda: tracker.run(crew.crew().kickoff, inputs=context)
+            ))
             try:
-                # Executar crew com contexto
-                crew_instance = crew.crew()
-                result = crew_instance.kickoff(inputs=context)
+                async for frame in heartbeats_until(crew_task, SSE_HEARTBEAT_SECONDS, events):
+                    if frame is HEARTBEAT_FRAME:
+                        metrics.incr("chat.stream.heartbeats")
+                    else:
+                        metrics.incr("chat.stream.progress_events")
+                    yield frame
                 
                 # Extrair resposta do resultado
-                response_text = _extract_response_from_result(result)
+                response_text = extract_response_from_result(crew_task.result())
                 
-                # Simular streaming palavra por palavra
-                words = response_text.split()
-                full_response = ""
-                
-                for i, word in enumerate(words):
-                    full_response += word
-                    if i < len(words) - 1:
-                        full_response += " "
-                    
-                    # Enviar chunk no formato do AI SDK
-                    chunk = {
-                        "id": str(uuid.uuid4()),
-                        "object": "text_completion.chunk",
-                        "created": int(datetime.now().timestamp()),
-                        "model": "sindico-pro-crew",
-                        "choices": [
-                            {
-                                "index": 0,
-                                "delta": {"content": word + (" " if i < len(words) - 1 else "")},
-                                "finish_reason": None
-                            }
-                        ]
-                    }
-                    
-                    yield f"data: {json.dumps(chunk)}\n\n"
-                    await asyncio.sleep(0.05)  # Pequeno delay para simular streaming
-                
-                # Enviar chunk final
-                final_chunk = {
-                    "id": str(uuid.uuid4()),
-                    "object": "text_completion.chunk",
-                    "created": int(datetime.now().timestamp()),
-                    "model": "sindico-pro-crew",
-                    "choices": [
-                        {
-                            "index": 0,
-                            "delta": {},
-                            "finish_reason": "stop"
-                        }
-                    ]
-                }
-                yield f"data: {json.dumps(final_chunk)}\n\n"
-                yield "data: [DONE]\n\n"
-                
-                # Adicionar resposta completa ao histórico
+                # Resposta completa vai para o histórico antes do envio, para não
+                # se perder se o cliente sair no meio do streaming
                 assistant_message = ChatMessage(
                     content=response_text,
                     sender="assistant",
@@ -228,57 +292,287 @@ async def chat_stream(
                 )
                 memory.add_message(session_id, assistant_message, user_id)
                 
+                # Enviar a resposta em frames de alguns tokens; cada yield só
+                # continua depois que o servidor aceitou o frame anterior
+                for i, text in enumerate(split_frames(response_text, SSE_FRAME_CHARS)):
+                    if i:
+                        await asyncio.sleep(SSE_FRAME_INTERVAL)
+                    frame = envelope.content(text)
+                    metrics.incr("chat.stream.frames")
+                    metrics.incr("chat.stream.bytes", len(frame))
+                    yield frame
+                
+                yield envelope.final
+                
+            except RunTimeout as e:
+                yield error_frame(str(e), error_type="timeout")
             except Exception as e:
-                error_chunk = {
-                    "error": {
-                        "message": f"Erro ao processar mensagem: {str(e)}",
-                        "type": "server_error"
-                    }
-                }
-                yield f"data: {json.dumps(error_chunk)}\n\n"
+                yield error_frame(f"Erro ao processar mensagem: {str(e)}")
+            finally:
+                # Stream encerrado antes do crew terminar (cliente desconectou)
+                if not crew_task.done():
+                    _cancel_run(control, "stream", "client_disconnected")
+                    crew_task.cancel()
+                # Vaga de execução só é liberada ao final do streaming
+                _release_run_slot(rate_key, lease_id)
         
         return StreamingResponse(
             generate_stream(),
-            media_type="text/plain",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Content-Type": "text/plain; charset=utf-8"
-            }
+            media_type="text/event-stream",
+            headers=SSE_HEADERS
         )
         
     except Exception as e:
+        _release_run_slot(rate_key, lease_id)
         raise HTTPException(
             status_code=500,
             detail=f"Erro ao processar mensagem: {str(e)}"
         ) from e
 
+@app.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest, http_request: Request):
+    """
+    Responder várias perguntas em paralelo (ex.: FAQ de um novo condomínio).
+    
+    Retorna NDJSON em streaming, na ordem em que as respostas ficam prontas:
+    um registro "result" por pergunta distinta, com os índices (`indices`) das
+    perguntas do lote que ele responde, e um registro "end" ao final.
+    Perguntas iguais na mesma sessão (ou sem sessão) são executadas uma vez.
+    """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="Nenhuma pergunta enviada")
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo de {BATCH_MAX_QUESTIONS} perguntas por lote"
+        )
+    
+    # O lote consome um único token da taxa; cada pergunta ocupa uma vaga de execução
+    rate_key = _rate_limit_key(request, http_request)
+    _check_rate_limit(rate_key)
+    
+    groups = _group_batch_questions(request.questions)
+    metrics.incr("chat.batch.questions", len(request.questions))
+    metrics.incr("chat.batch.deduplicated", len(request.questions) - len(groups))
+    
+    timeout = _request_timeout(http_request)
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    session_locks = {}
+    # Um controle para o lote: desconectar cancela todas as perguntas em andamento
+    control = RunControl()
+    
+    async def answer(message: str, session_id: Optional[str], indices: List[int]) -> Dict:
+        session_id = session_id or str(uuid.uuid4())
+        # Perguntas da mesma sessão rodam em sequência para manter o histórico em ordem
+        async with session_locks.setdefault(session_id, asyncio.Lock()), semaphore:
+            record = {"type": "result", "indices": indices, "session_id": session_id}
+            start = time.monotonic()
+            try:
+                # O prazo vale para cada pergunta, a partir do momento em que ela
+                # obtém a vaga do usuário (a espera na fila não o consome)
+                lease_id = await _acquire_batch_slot(rate_key, control)
+                try:
+                    record["message"] = await _run_with_deadline(
+                        "batch", RunControl(timeout=timeout, parent=control),
+                        run_chat_turn, SubCrew(), memory, message, session_id, request.user_id
+                    )
+                finally:
+                    _release_run_slot(rate_key, lease_id)
+                record["status"] = "completed"
+            except Exception as e:
+                record["status"] = "failed"
+                record["error"] = f"Erro ao processar mensagem: {str(e)}"
+            metrics.observe("chat.batch.question_seconds", time.monotonic() - start, status=record["status"])
+            return record
+    
+    async def generate_results():
+        tasks = [asyncio.create_task(answer(*group)) for group in groups]
+        watcher = asyncio.create_task(_cancel_on_disconnect(http_request, control, "batch"))
+        totals = {"completed": 0, "failed": 0}
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                record = await next_result
+                totals[record["status"]] += 1
+                yield fast_json.dumps_line(record)
+            yield fast_json.dumps_line({
+                "type": "end",
+                "questions": len(request.questions),
+                "unique_questions": len(groups),
+                **totals
+            })
+        finally:
+            watcher.cancel()
+            # Conexão encerrada antes do fim: interromper as perguntas em andamento
+            # e não iniciar as restantes
+            if not all(task.done() for task in tasks):
+                _cancel_run(control, "batch", "client_disconnected")
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(generate_results(), media_type="application/x-ndjson")
+
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket, session_id: Optional[str] = None, user_id: Optional[str] = None):
+    """
+    Conversa contínua em uma sessão por WebSocket.
+    
+    Ao conectar, o servidor envia {"type": "session", "session_id"}. Cada
+    mensagem do cliente ({"message", "timeout"?}) é uma rodada, respondida com
+    eventos {"type": "progress", "data"} durante o crew, frames
+    {"type": "chunk", "content"} com a resposta e {"type": "done"} ao final, ou
+    {"type": "error", "error": {"message", "type"}}. Mensagens enviadas durante
+    uma rodada são respondidas em seguida, na ordem. As últimas mensagens da
+    sessão ficam em memória enquanto a conexão estiver aberta.
+    """
+    await websocket.accept()
+    session_id = session_id or str(uuid.uuid4())
+    rate_key = _client_rate_key(user_id, websocket)
+    crew = get_crew()
+    session = SessionContext(memory, session_id, user_id)
+    session.load()
+    metrics.incr("chat.ws.connections")
+    await websocket.send_json({"type": "session", "session_id": session_id})
+    
+    # Desconectar cancela a rodada em andamento (controle filho deste)
+    connection = RunControl()
+    incoming = asyncio.Queue()
+    
+    async def receive_messages():
+        try:
+            while True:
+                incoming.put_nowait(await websocket.receive_text())
+        except WebSocketDisconnect:
+            _cancel_run(connection, "ws", "client_disconnected")
+            incoming.put_nowait(None)
+    
+    reader = asyncio.create_task(receive_messages())
+    try:
+        while True:
+            text = await incoming.get()
+            if text is None:
+                break
+            await _websocket_turn(websocket, crew, session, rate_key, connection, text)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader.cancel()
+        _cancel_run(connection, "ws", "client_disconnected")
+
+@app.post("/chat/jobs", response_model=ChatJobResponse, status_code=202)
+async def create_chat_job(request: ChatRequest, http_request: Request):
+    """
+    Enfileirar uma pergunta para processamento assíncrono.
+    A resposta é obtida consultando GET /chat/jobs/{job_id}.
+    """
+    _check_rate_limit(_rate_limit_key(request, http_request))
+    try:
+        session_id = request.session_id or str(uuid.uuid4())
+        job = job_queue.enqueue(request.message, session_id, request.user_id)
+        return _job_to_response(job)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro ao enfileirar mensagem: {str(e)}"
+        ) from e
+
+@app.get("/chat/jobs/{job_id}", response_model=ChatJobResponse)
+async def get_chat_job(job_id: str, wait: float = Query(0, ge=0, le=30)):
+    """
+    Consultar o estado de um job de chat.
+    Com `wait`, aguarda até N segundos pela conclusão (long polling).
+    """
+    try:
+        job = job_queue.get_job(job_id)
+        deadline = asyncio.get_running_loop().time() + wait
+        while job and not job.finished and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.5)
+            job = job_queue.get_job(job_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro ao consultar job: {str(e)}"
+        ) from e
+
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Job não encontrado"
+        )
+    return _job_to_response(job)
+
 @app.get("/sessions/{session_id}/history", response_model=ConversationHistory)
-async def get_conversation_history(session_id: str, user_id: Optional[str] = None):
-    """Obter histórico de uma conversa específica"""
+async def get_conversation_history(session_id: str, http_request: Request, user_id: Optional[str] = None):
+    """
+    Obter histórico de uma conversa específica.
+    
+    A resposta traz um ETag com a versão da sessão; com `If-None-Match` igual
+    à versão atual, responde 304 sem ler o histórico.
+    """
     try:
-        conversation = memory.get_conversation(session_id, user_id)
-        if not conversation:
+        version = memory.get_session_version(session_id, user_id)
+        etag = version_etag("h", version) if version else None
+        if etag is not None:
+            unchanged = not_modified(http_request, etag, "history")
+            if unchanged is not None:
+                return unchanged
+        
+        # Mensagens já no JSON da resposta (ConversationHistory): o corpo é
+        # montado com os bytes, sem ChatMessage nem modelos Pydantic
+        messages = memory.get_conversation_wire(session_id, user_id)
+        if not messages:
             raise HTTPException(
                 status_code=404,
                 detail="Sessão não encontrada"
             )
         
-        # Converter ChatMessage para ChatMessageRequest
-        messages_request = []
-        for msg in conversation:
-            messages_request.append(ChatMessageRequest(
-                content=msg.content,
-                sender=msg.sender,
-                timestamp=msg.timestamp
-            ))
+        body = _wire_body({"session_id": session_id}, messages)
+        return json_response(http_request, body, etag)
+    except HTTPException:
+        # Re-raise HTTPException (404) sem modificar
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro ao obter histórico: {str(e)}"
+        ) from e
+
+@app.get("/sessions/{session_id}/messages", response_model=HistoryPage)
+async def get_history_page(
+    session_id: str,
+    http_request: Request,
+    user_id: Optional[str] = None,
+    limit: int = Query(HISTORY_PAGE_DEFAULT, ge=1, le=HISTORY_PAGE_MAX),
+    cursor: Optional[str] = None
+):
+    """
+    Histórico paginado, da mensagem mais recente para a mais antiga.
+    
+    Para a próxima página (mensagens mais antigas), envie o `next_cursor`
+    recebido em `cursor`. Mensagens novas não deslocam as páginas seguintes.
+    """
+    scope = f"{user_id or ''}:{session_id}"
+    before_seq, count_hint = _decode_page_cursor(cursor, scope, (int, int)) if cursor else (None, None)
+    try:
+        version = memory.get_session_version(session_id, user_id)
+        etag = version_etag("m", version, f"{limit}:{cursor or ''}") if version else None
+        if etag is not None:
+            unchanged = not_modified(http_request, etag, "history_page")
+            if unchanged is not None:
+                return unchanged
         
-        return ConversationHistory(
-            session_id=session_id,
-            messages=messages_request
+        messages, next_before, count = memory.get_history_page_wire(
+            session_id, user_id, limit, before_seq, count_hint
         )
+        if not count:
+            raise HTTPException(status_code=404, detail="Sessão não encontrada")
+        
+        body = _wire_body({
+            "session_id": session_id,
+            "total_messages": count,
+            "next_cursor": _encode_page_cursor(scope, [next_before, count]) if next_before is not None else None
+        }, messages)
+        return json_response(http_request, body, etag)
     except HTTPException:
-        # Re-raise HTTPException (404) sem modificar
         raise
     except Exception as e:
         raise HTTPException(
@@ -299,17 +593,92 @@ async def clear_conversation(session_id: str, user_id: Optional[str] = None):
         ) from e
 
 @app.get("/sessions", response_model=List[SessionInfo])
-async def list_sessions(user_id: Optional[str] = None):
-    """Listar todas as sessões ativas"""
+async def list_sessions(http_request: Request, user_id: Optional[str] = None):
+    """
+    Listar todas as sessões ativas.
+    
+    Com `user_id`, a resposta traz um ETag com a versão da lista de sessões
+    do usuário e `If-None-Match` igual a ela responde 304 sem listar.
+    """
+    try:
+        etag = None
+        if user_id:
+            version = memory.get_sessions_version(user_id)
+            etag = version_etag("s", version) if version else None
+        if etag is not None:
+            unchanged = not_modified(http_request, etag, "sessions")
+            if unchanged is not None:
+                return unchanged
+        
+        sessions = _session_list.validate_python(memory.list_sessions(user_id), from_attributes=True)
+        return json_response(http_request, _session_list.dump_json(sessions), etag)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro ao listar sessões: {str(e)}"
+        ) from e
+
+@app.get("/users/{user_id}/sessions", response_model=SessionPage)
+async def list_user_sessions_page(
+    user_id: str,
+    http_request: Request,
+    limit: int = Query(SESSIONS_PAGE_DEFAULT, ge=1, le=SESSIONS_PAGE_MAX),
+    cursor: Optional[str] = None
+):
+    """
+    Sessões do usuário paginadas, da atividade mais recente para a mais antiga.
+    
+    Para a próxima página, envie o `next_cursor` recebido em `cursor`.
+    """
+    after = _decode_page_cursor(cursor, user_id, (float, str)) if cursor else None
     try:
-        sessions = memory.list_sessions(user_id)
-        return sessions
+        version = memory.get_sessions_version(user_id)
+        etag = version_etag("s", version, f"{limit}:{cursor or ''}") if version else None
+        if etag is not None:
+            unchanged = not_modified(http_request, etag, "sessions_page")
+            if unchanged is not None:
+                return unchanged
+        
+        sessions, next_after = memory.list_sessions_page(
+            user_id, limit, tuple(after) if after else None
+        )
+        page = SessionPage(
+            sessions=_session_list.validate_python(sessions, from_attributes=True),
+            next_cursor=_encode_page_cursor(user_id, list(next_after)) if next_after else None
+        )
+        return json_response(http_request, page.model_dump_json().encode("utf-8"), etag)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Erro ao listar sessões: {str(e)}"
         ) from e
 
+@app.get("/users/{user_id}/export")
+async def export_user_conversations(
+    user_id: str,
+    cursor: Optional[str] = None,
+    batch_size: int = Query(100, ge=1, le=1000)
+):
+    """
+    Exportar todas as conversas de um usuário em NDJSON (um registro JSON por linha).
+    
+    Registros: "session", "message", "cursor" e "end". Para retomar uma
+    exportação interrompida, envie o último "cursor" recebido em `cursor`.
+    """
+    scan_cursor = _decode_export_cursor(cursor, user_id) if cursor else None
+    
+    def generate_export():
+        try:
+            for record in memory.export_user_sessions(user_id, scan_cursor, batch_size):
+                if record["type"] == "cursor":
+                    record = {"type": "cursor", "cursor": _encode_export_cursor(user_id, record["cursor"])}
+                yield fast_json.dumps_line(record)
+        except Exception as e:
+            # Resposta já iniciada: o erro vai como último registro
+            yield fast_json.dumps_line({"type": "error", "message": f"Erro na exportação: {str(e)}"})
+    
+    return StreamingResponse(generate_export(), media_type="application/x-ndjson")
+
 @app.get("/health")
 async def health_check(user_id: Optional[str] = None):
     """Verificação de saúde da API"""
@@ -332,44 +701,319 @@ async def memory_status(user_id: Optional[str] = None):
         health = memory.health_check()
         stats.update(health)
     
+    stats["jobs"] = job_queue.get_stats()
+    
     return stats
 
+@app.get("/llm/usage")
+async def llm_usage():
+    """Uso atual do LLM em relação ao orçamento global (RPM/TPM e concorrência)"""
+    governor = get_llm_governor()
+    caller = get_llm_caller()
+    try:
+        usage = {"enabled": False}
+        if governor is not None:
+            usage = {"enabled": True, **governor.get_usage()}
+        usage["resilience"] = caller.get_status() if caller is not None else None
+        return usage
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro ao obter uso do LLM: {str(e)}"
+        ) from e
+
+@app.get("/metrics")
+async def get_metrics():
+    """Métricas do processo (limites de requisição, etc.)"""
+    return metrics.snapshot()
+
 # Funções auxiliares
 
-def _prepare_context_for_crew(conversation_history: List[ChatMessage], current_message: str) -> Dict:
+def _rate_limit_key(request: ChatRequest, http_request: HTTPConnection) -> str:
+    """Identificar o usuário para o limitador (user_id ou IP do cliente)."""
+    return _client_rate_key(request.user_id, http_request)
+
+def _client_rate_key(user_id: Optional[str], connection: HTTPConnection) -> str:
+    if user_id:
+        return f"user:{user_id}"
+    client_host = client_address(
+        connection.client.host if connection.client else None,
+        connection.headers.get("x-forwarded-for"),
+        RATE_LIMIT_TRUSTED_PROXIES
+    )
+    return f"ip:{client_host or 'unknown'}"
+
+def _rate_limit_error(e: RateLimitExceeded) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+def _check_rate_limit(rate_key: str):
+    """Consumir um token do usuário ou responder 429."""
+    if rate_limiter is None:
+        return
+    try:
+        rate_limiter.check_rate(rate_key)
+    except RateLimitExceeded as e:
+        raise _rate_limit_error(e) from e
+
+def _acquire_run_slot(rate_key: str) -> Optional[str]:
+    """Reservar uma vaga de execução do crew para o usuário ou responder 429."""
+    if rate_limiter is None:
+        return None
+    try:
+        return rate_limiter.acquire(rate_key)
+    except RateLimitExceeded as e:
+        raise _rate_limit_error(e) from e
+
+def _release_run_slot(rate_key: str, lease_id: Optional[str]):
+    if rate_limiter is not None and lease_id is not None:
+        rate_limiter.release(rate_key, lease_id)
+
+async def _cancel_on_disconnect(http_request: Request, control: RunControl, endpoint: str):
+    """Cancelar a execução assim que o cliente desconectar."""
+    while not control.cancelled:
+        if await http_request.is_disconnected():
+            _cancel_run(control, endpoint, "client_disconnected")
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+def _cancel_run(control: RunControl, endpoint: str, reason: str):
+    if control.cancel(reason):
+        metrics.incr("chat.cancelled", endpoint=endpoint, reason=reason)
+
+def _progress_tracker(publish: bool = True) -> Tuple[Optional[asyncio.Queue], ProgressTracker]:
     """
-    Preparar contexto da conversa para o crew.
-    Inclui histórico e mensagem atual.
+    Tracker de progresso de uma execução do crew e a fila (no event loop atual)
+    em que ele publica os eventos; sem fila se `publish` for False (o tracker
+    ainda registra as métricas das etapas).
     """
-    # Construir contexto da conversa
-    context_messages = []
-    for msg in conversation_history[-10:]:  # Últimas 10 mensagens para contexto
-        role = "Usuário" if msg.sender == "user" else "Assistente"
-        context_messages.append(f"{role}: {msg.content}")
-    
-    # Adicionar mensagem atual
-    context_messages.append(f"Usuário: {current_message}")
+    if not publish:
+        return None, ProgressTracker()
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    return events, ProgressTracker(lambda event: loop.call_soon_threadsafe(events.put_nowait, event))
+
+async def _run_with_deadline(endpoint: str, control: RunControl, fn, *args, **kwargs):
+    """
+    Executar `fn` (crew) em uma thread com `control` ativo, aguardando no máximo até o prazo.
+
+    Se o prazo acabar, a requisição termina na hora; a thread para na próxima
+    verificação do controle (chamada ao LLM, fila do governador ou ferramenta).
+
+    Raises:
+        RunTimeout: Se o prazo se esgotou
+        RunCancelled: Se a execução foi cancelada
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(run_in_scope, control, fn, *args, **kwargs))
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), control.remaining())
+    except (RunTimeout, asyncio.TimeoutError) as e:
+        metrics.incr("chat.timeouts", endpoint=endpoint)
+        if isinstance(e, RunTimeout):
+            raise
+        raise RunTimeout(f"Prazo de {control.timeout:g}s da execução esgotado") from None
+    except asyncio.CancelledError:
+        _cancel_run(control, endpoint, "client_disconnected")
+        raise
+
+async def _run_until_disconnect(http_request: Request, endpoint: str, control: RunControl,
+                                fn, *args, **kwargs):
+    """
+    Executar `fn` (crew) em uma thread até o prazo, cancelando a execução se o
+    cliente desconectar.
+
+    Raises:
+        RunTimeout: Se o prazo se esgotou
+        RunCancelled: Se a execução foi cancelada
+    """
+    watcher = asyncio.create_task(_cancel_on_disconnect(http_request, control, endpoint))
+    try:
+        return await _run_with_deadline(endpoint, control, fn, *args, **kwargs)
+    finally:
+        watcher.cancel()
+
+def _request_timeout(http_request: Request) -> float:
+    """
+    Prazo da requisição em segundos: cabeçalho X-Request-Timeout ou o padrão,
+    limitado ao máximo do servidor.
+    """
+    value = http_request.headers.get("X-Request-Timeout")
+    if value is None:
+        return REQUEST_TIMEOUT_DEFAULT
+    try:
+        timeout = float(value)
+        if not timeout > 0:
+            raise ValueError(value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="X-Request-Timeout deve ser um número de segundos positivo") from e
+    return min(timeout, REQUEST_TIMEOUT_MAX)
+
+async def _websocket_turn(websocket: WebSocket, crew: SubCrew, session: SessionContext,
+                          rate_key: str, connection: RunControl, text: str):
+    """Responder uma mensagem recebida em /ws/chat."""
+    try:
+        request = WebSocketChatMessage.model_validate_json(text)
+    except ValidationError as e:
+        await _websocket_error(websocket, f"Mensagem inválida: {e.errors()[0]['msg']}", "invalid_request")
+        return
+    try:
+        lease_id = _acquire_run_slot(rate_key)
+    except HTTPException as e:
+        await _websocket_error(websocket, e.detail, "rate_limited")
+        return
     
-    # Construir contexto completo
-    conversation_context = "\n".join(context_messages)
+    timeout = min(request.timeout or REQUEST_TIMEOUT_DEFAULT, REQUEST_TIMEOUT_MAX)
+    control = RunControl(timeout=timeout, parent=connection)
+    crew_task = None
+    metrics.incr("chat.ws.turns")
+    try:
+        session.add(ChatMessage(content=request.message, sender="user", timestamp=datetime.now()))
+        context = prepare_context_for_crew(session.recent(), request.message)
+        
+        events, tracker = _progress_tracker()
+        crew_task = asyncio.ensure_future(_run_with_deadline(
+            "ws", control, lambda: tracker.run(crew.crew().kickoff, inputs=context)
+        ))
+        async for event in events_until(crew_task, events, None):
+            await websocket.send_json({"type": "progress", "data": event})
+        response_text = extract_response_from_result(crew_task.result())
+        
+        session.add(ChatMessage(content=response_text, sender="assistant", timestamp=datetime.now()))
+        for i, frame in enumerate(split_frames(response_text, SSE_FRAME_CHARS)):
+            if i:
+                await asyncio.sleep(SSE_FRAME_INTERVAL)
+            await websocket.send_json({"type": "chunk", "content": frame})
+        await websocket.send_json({"type": "done", "message_id": str(uuid.uuid4())})
     
-    return {
-        "question": current_message,
-        "conversation_history": conversation_context,
-        "current_year": str(datetime.now().year),
-        "context": f"Histórico da conversa:\n{conversation_context}\n\nPergunta atual: {current_message}"
-    }
+    except WebSocketDisconnect:
+        raise
+    except Exception as e:
+        # Cliente desconectou (a rodada foi cancelada); não há a quem responder
+        if connection.cancelled:
+            return
+        if isinstance(e, RunTimeout):
+            await _websocket_error(websocket, str(e), "timeout")
+        else:
+            await _websocket_error(websocket, f"Erro ao processar mensagem: {str(e)}", "server_error")
+    finally:
+        if crew_task is not None and not crew_task.done():
+            _cancel_run(control, "ws", "client_disconnected")
+            crew_task.cancel()
+        _release_run_slot(rate_key, lease_id)
+
+async def _websocket_error(websocket: WebSocket, message: str, error_type: str):
+    await websocket.send_json({"type": "error", "error": {"message": message, "type": error_type}})
+
+def _wait_run_slot(rate_key: str) -> Optional[str]:
+    """Reservar uma vaga de execução, aguardando enquanto o usuário estiver no limite."""
+    if rate_limiter is None:
+        return None
+    while True:
+        try:
+            return rate_limiter.acquire(rate_key, check_rate=False)
+        except RateLimitExceeded as e:
+            run_control.sleep(e.retry_after)
 
-def _extract_response_from_result(result) -> str:
+async def _acquire_batch_slot(rate_key: str, control: RunControl) -> Optional[str]:
     """
-    Extrair resposta do resultado do crew.
+    Aguardar uma vaga de execução para uma pergunta do lote; a espera só é
+    interrompida pelo cancelamento do lote (ex.: cliente desconectou).
     """
-    if hasattr(result, 'raw'):
-        return str(result.raw)
-    elif hasattr(result, 'output'):
-        return str(result.output)
-    else:
-        return str(result)
+    start = time.monotonic()
+    future = asyncio.ensure_future(asyncio.to_thread(run_in_scope, control, _wait_run_slot, rate_key))
+    try:
+        lease_id = await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # A vaga pode ser obtida depois do cancelamento: devolvê-la
+        def release_late_slot(done: asyncio.Future):
+            if not done.cancelled() and done.exception() is None:
+                _release_run_slot(rate_key, done.result())
+        future.add_done_callback(release_late_slot)
+        raise
+    metrics.observe("chat.batch.slot_wait_seconds", time.monotonic() - start)
+    return lease_id
+
+def _group_batch_questions(questions: List[BatchQuestion]) -> List[tuple]:
+    """
+    Agrupar perguntas repetidas do lote.
+
+    Perguntas com o mesmo texto (ignorando maiúsculas e espaços) e a mesma
+    sessão viram uma única execução.
+
+    Returns:
+        Lista de (mensagem, session_id, índices no lote), na ordem do lote
+    """
+    groups = {}
+    for index, question in enumerate(questions):
+        key = (" ".join(question.message.split()).casefold(), question.session_id)
+        if key in groups:
+            groups[key][2].append(index)
+        else:
+            groups[key] = (question.message, question.session_id, [index])
+    return list(groups.values())
+
+def _encode_export_cursor(user_id: str, scan_cursor: list) -> str:
+    payload = json.dumps({"u": user_id, "c": scan_cursor}).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+def _decode_export_cursor(token: str, user_id: str) -> list:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        if payload["u"] != user_id:
+            raise ValueError("cursor de outro usuário")
+        node, scan_cursor = payload["c"]
+        return [node, int(scan_cursor)]
+    except Exception as e:
+        raise HTTPException(status_code=400, detail="Cursor de exportação inválido") from e
+
+def _wire_body(fields: Dict, messages: List[bytes]) -> bytes:
+    """Objeto JSON com `fields` e "messages" montado com mensagens já serializadas."""
+    return fast_json.dumps(fields)[:-1] + b',"messages":[' + b",".join(messages) + b"]}"
+
+def _encode_page_cursor(scope: str, position: list) -> str:
+    payload = json.dumps({"s": scope, "p": position}).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+def _decode_page_cursor(token: str, scope: str, types: Tuple[type, type]) -> list:
+    """
+    Posição guardada no cursor de paginação (válido só para a mesma sessão ou
+    usuário), com cada elemento convertido para o tipo esperado em `types`.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        if payload["s"] != scope:
+            raise ValueError("cursor de outra listagem")
+        return [_cursor_value(kind, value) for kind, value in zip(types, payload["p"], strict=True)]
+    except Exception as e:
+        raise HTTPException(status_code=400, detail="Cursor de paginação inválido") from e
+
+def _cursor_value(kind: type, value):
+    """Elemento da posição de um cursor: texto ou número finito e não negativo."""
+    if kind is str:
+        if not isinstance(value, str):
+            raise ValueError("posição inválida")
+        return value
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError("posição não numérica")
+    value = kind(value)
+    if not math.isfinite(value) or value < 0:
+        raise ValueError("posição fora do intervalo")
+    return value
+
+def _job_to_response(job) -> ChatJobResponse:
+    return ChatJobResponse(
+        job_id=job.job_id,
+        status=job.status,
+        session_id=job.session_id,
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+        user_id=job.user_id,
+        message=job.response,
+        error=job.error
+    )
 
 # Executar servidor se chamado diretamente
 if __name__ == "__main__":
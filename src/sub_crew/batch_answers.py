@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+"""
+Geração de respostas em lote, sem a API.
+
+Lê perguntas de um arquivo JSONL ({"id": ..., "question": ...} por linha),
+responde em um pool de processos ou threads, cada worker com o seu crew já
+montado (e o seu LLM, para medir os tokens de cada item), e grava um JSONL de
+resultados com latência e uso de tokens por item.
+Se a execução for interrompida, rodar de novo com o mesmo arquivo de saída
+continua de onde parou.
+
+Usage: batch perguntas.jsonl -o respostas.jsonl [--workers 4] [--mode process]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import warnings
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, Optional, Set
+
+from sub_crew.conversation import extract_response_from_result, prepare_context_for_crew
+
+warnings.filterwarnings("ignore", category=SyntaxWarning, module="pysbd")
+
+# Crew e LLM de cada worker (thread ou processo), criados uma vez no início do worker
+_worker_state = threading.local()
+
+
+def _init_worker():
+    from sub_crew.crew import SubCrew, create_llm
+
+    # LLM próprio: o uso acumulado não mistura chamadas de outros workers
+    _worker_state.llm = create_llm()
+    _worker_state.crew = SubCrew(agent_llm=_worker_state.llm).crew()
+
+
+def answer_question(item: Dict) -> Dict:
+    """
+    Responder um item com o crew do worker atual.
+
+    Returns:
+        Registro de resultado (com "answer" ou "error")
+    """
+    record = {"id": item["id"], "question": item["question"]}
+    start = time.perf_counter()
+    try:
+        usage_before = _token_usage(_worker_state.llm)
+        result = _worker_state.crew.kickoff(inputs=prepare_context_for_crew([], item["question"]))
+        record["answer"] = extract_response_from_result(result)
+        record["token_usage"] = _usage_delta(usage_before, _token_usage(_worker_state.llm))
+    except Exception as e:
+        record["error"] = str(e)
+    record["latency_seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def _token_usage(llm) -> Optional[Dict]:
+    """
+    Uso acumulado de tokens do LLM do worker, se disponível.
+
+    O CrewOutput.token_usage não serve por item: soma o uso acumulado do LLM
+    uma vez por agente, e o crew do worker é reutilizado entre itens.
+    """
+    summary = getattr(llm, "get_token_usage_summary", None)
+    if summary is None:
+        return None
+    usage = summary()
+    if hasattr(usage, "model_dump"):
+        return usage.model_dump()
+    return dict(vars(usage))
+
+
+def _usage_delta(before: Optional[Dict], after: Optional[Dict]) -> Optional[Dict]:
+    """Uso de tokens entre duas leituras do acumulado (um item)."""
+    if before is None or after is None:
+        return None
+    return {
+        key: value - before.get(key, 0)
+        for key, value in after.items()
+        if isinstance(value, (int, float))
+    }
+
+
+def read_questions(stream) -> Iterator[Dict]:
+    """
+    Ler perguntas do JSONL. Aceita "question" ou "message"; sem "id", o número
+    da linha identifica o item (então o arquivo não deve ser reordenado entre
+    uma execução e a retomada).
+    """
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        data = json.loads(line)
+        question = data.get("question") or data.get("message")
+        if not question:
+            raise ValueError(f"Linha {line_number} sem \"question\"")
+        yield {"id": data.get("id", line_number), "question": question}
+
+
+def completed_ids(output_path: str, retry_failed: bool = False) -> Set:
+    """
+    IDs já presentes no arquivo de saída de uma execução anterior.
+
+    Uma última linha incompleta (processo morto no meio da gravação) é
+    removida do arquivo para que os novos resultados comecem em linha nova.
+    Com `retry_failed`, as linhas de erro também são removidas (os itens
+    serão respondidos de novo), para que cada `id` tenha um único registro.
+    """
+    if not os.path.exists(output_path):
+        return set()
+
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+
+    done = set()
+    kept = []
+    for line in data[:end].splitlines(keepends=True):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            kept.append(line)
+            continue
+        if retry_failed and "error" in record:
+            continue
+        kept.append(line)
+        done.add(record["id"])
+
+    if len(kept) < len(data[:end].splitlines()):
+        # Arquivo novo trocado atomicamente: uma interrupção não perde respostas
+        partial_path = output_path + ".tmp"
+        with open(partial_path, "wb") as f:
+            f.writelines(kept)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(partial_path, output_path)
+    return done
+
+
+def run_batch(questions: Iterable[Dict], output_path: str, workers: int = 4, mode: str = "process",
+              retry_failed: bool = False) -> Dict:
+    """
+    Responder as perguntas e anexar os resultados a `output_path`.
+
+    Args:
+        questions: Itens com "id" e "question"
+        output_path: Arquivo JSONL de resultados (retomado se já existir)
+        workers: Processos ou threads respondendo em paralelo
+        mode: "process" (um processo por worker) ou "thread"
+        retry_failed: Responder de novo os itens que falharam na execução anterior
+
+    Returns:
+        Estatísticas da execução
+    """
+    done = completed_ids(output_path, retry_failed)
+    stats = {"skipped": 0, "answered": 0, "failed": 0, "tokens": 0}
+    executor_class = ProcessPoolExecutor if mode == "process" else ThreadPoolExecutor
+    start = time.monotonic()
+
+    with open(output_path, "a", encoding="utf-8") as output, \
+            executor_class(max_workers=workers, initializer=_init_worker) as executor:
+
+        def write(record: Dict):
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            # Cada resultado vai para o disco antes de ser contado como feito
+            output.flush()
+            if "error" in record:
+                stats["failed"] += 1
+            else:
+                stats["answered"] += 1
+                stats["tokens"] += (record.get("token_usage") or {}).get("total_tokens") or 0
+
+        pending = set()
+        try:
+            for item in questions:
+                if item["id"] in done:
+                    stats["skipped"] += 1
+                    continue
+                # Poucos itens em voo mantém a memória constante em arquivos grandes
+                if len(pending) >= workers * 2:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        write(future.result())
+                pending.add(executor.submit(answer_question, item))
+
+            for future in wait(pending).done:
+                write(future.result())
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    elapsed = time.monotonic() - start
+    stats["seconds"] = round(elapsed, 3)
+    stats["answers_per_minute"] = round(stats["answered"] * 60 / elapsed, 1) if elapsed else None
+    return stats
+
+
+def run():
+    """Responder um arquivo JSONL de perguntas (ou "-" para stdin)."""
+    parser = argparse.ArgumentParser(prog="batch", description="Responder perguntas em lote com o crew")
+    parser.add_argument("file", help="Arquivo JSONL de perguntas (\"-\" para stdin)")
+    parser.add_argument("-o", "--output", required=True, help="Arquivo JSONL de resultados")
+    parser.add_argument("--workers", type=int, default=4, help="Workers em paralelo")
+    parser.add_argument("--mode", choices=("process", "thread"), default="process",
+                        help="Pool de processos ou de threads")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Responder de novo itens que falharam na execução anterior")
+    args = parser.parse_args()
+
+    print(f"📝 Respondendo {args.file} com {args.workers} workers ({args.mode}) -> {args.output}")
+    stream = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+    try:
+        stats = run_batch(read_questions(stream), args.output, args.workers, args.mode, args.retry_failed)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    print(f"✅ Respondidas: {stats['answered']} ({stats['answers_per_minute']} por minuto)")
+    print(f"✅ Tokens: {stats['tokens']}")
+    print(f"⏭️ Já respondidas em execução anterior: {stats['skipped']}")
+    if stats["failed"]:
+        print(f"❌ Falhas: {stats['failed']} (use --retry-failed para tentar de novo)")
+
+
+if __name__ == "__main__":
+    run()
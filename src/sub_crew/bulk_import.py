@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+Importação em massa de conversas a partir de NDJSON.
+
+Aceita o formato de GET /users/{user_id}/export (registros "session" e
+"message"; os demais são ignorados) e grava direto nas chaves do Redis com
+pipelines, em várias conexões paralelas. Usado em migrações entre clusters
+e para popular ambientes de teste de carga.
+
+Usage: import_sessions arquivo.ndjson [--key-prefix novo_prefixo:] [--workers 8]
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from sub_crew.memory import SESSION_TTL, RedisConversationMemory
+from sub_crew.message_codec import encode_message
+from sub_crew.redis_connection import cluster_mode_from_env
+
+
+class SessionImporter:
+    """
+    Grava registros de conversa no Redis usando `workers` conexões.
+
+    Cada sessão é sempre tratada pelo mesmo worker, o que preserva a ordem
+    das mensagens sem coordenação entre threads.
+    """
+
+    def __init__(self, memory: RedisConversationMemory, workers: int = 8,
+                 batch_size: int = 1000, queue_size: int = 10000):
+        """
+        Inicializar importador.
+
+        Args:
+            memory: Memória de destino (define prefixo, codificação e compressão)
+            workers: Conexões/threads gravando em paralelo
+            batch_size: Mensagens por pipeline
+            queue_size: Registros pendentes por worker antes de pausar a leitura
+        """
+        self.memory = memory
+        self.workers = workers
+        self.batch_size = batch_size
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._lock = threading.Lock()
+        self._errors = []
+        self.stats = {"sessions": 0, "messages": 0, "skipped_sessions": 0, "invalid_records": 0}
+
+    def run(self, records: Iterable[Dict]) -> Dict:
+        """
+        Importar os registros e aguardar a gravação de todos.
+
+        Returns:
+            Estatísticas da importação
+        """
+        start = time.monotonic()
+        threads = [
+            threading.Thread(target=self._worker, args=(q,), name=f"import-{i}", daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for record in records:
+                if self._errors:
+                    break
+                if record.get("type") not in ("session", "message") or "session_id" not in record:
+                    if record.get("type") not in ("cursor", "end"):
+                        self._count("invalid_records")
+                    continue
+                session = f"{record.get('user_id') or ''}:{record['session_id']}"
+                self._queues[zlib.crc32(session.encode("utf-8")) % self.workers].put(record)
+        finally:
+            for q in self._queues:
+                q.put(None)
+            for thread in threads:
+                thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+
+        elapsed = time.monotonic() - start
+        self.stats["seconds"] = round(elapsed, 3)
+        self.stats["messages_per_second"] = round(self.stats["messages"] / elapsed, 1) if elapsed else None
+        return self.stats
+
+    def _count(self, name: str, value: int = 1):
+        with self._lock:
+            self.stats[name] += value
+
+    def _worker(self, records: queue.Queue):
+        memory = self.memory
+        pipe = memory.binary_client.pipeline(transaction=False)
+        pending = 0
+        touched = {}
+        current = None
+        skip = False
+        ttl = SESSION_TTL
+
+        def flush():
+            nonlocal pending
+            # TTL das listas só pode ser definido depois que elas existem
+            for keys, key_ttl in touched.items():
+                for key in keys:
+                    pipe.expire(key, key_ttl)
+            pipe.execute()
+            self._count("messages", pending)
+            pending = 0
+            touched.clear()
+
+        try:
+            for record in iter(records.get, None):
+                if self._errors:
+                    continue
+                session_id = record["session_id"]
+                user_id = record.get("user_id")
+                message_key = memory._get_key("messages", session_id, user_id)
+                count_key = memory._get_key("count", session_id, user_id)
+                activity_key = memory._get_key("activity", session_id, user_id)
+                version_key = memory._get_key("version", session_id, user_id)
+
+                if record["type"] == "session":
+                    current = message_key
+                    ttl = _remaining_ttl(record.get("last_activity"))
+                    skip = ttl <= 0
+                    if skip:
+                        # Já teria expirado no Redis de origem
+                        self._count("skipped_sessions")
+                        continue
+                    # Reimportar a mesma sessão a substitui (exportação retomada)
+                    pipe.delete(message_key)
+                    pipe.incr(version_key)
+                    pipe.expire(version_key, ttl)
+                    pipe.set(count_key, int(record.get("message_count") or 0), ex=ttl)
+                    pipe.set(activity_key, record["last_activity"], ex=ttl)
+                    if user_id:
+                        memory._touch_user_sessions(
+                            pipe, user_id, session_id,
+                            datetime.fromisoformat(record["last_activity"]).timestamp()
+                        )
+                    self._count("sessions")
+                    continue
+
+                if message_key == current and skip:
+                    continue
+
+                timestamp = datetime.fromisoformat(record["timestamp"])
+                pipe.lpush(message_key, encode_message(
+                    record["content"], record["sender"], timestamp,
+                    memory.message_encoding, memory.compression_threshold
+                ))
+                # Invalida caches de sessão das instâncias da API
+                pipe.incr(version_key)
+                if message_key != current:
+                    # Mensagem sem registro "session": contador e atividade incrementais
+                    pipe.incr(count_key)
+                    pipe.set(activity_key, timestamp.isoformat())
+                    pipe.expire(count_key, SESSION_TTL)
+                    pipe.expire(activity_key, SESSION_TTL)
+                    if user_id:
+                        memory._touch_user_sessions(pipe, user_id, session_id, timestamp.timestamp())
+                touched[(message_key, version_key)] = ttl if message_key == current else SESSION_TTL
+                pending += 1
+
+                if pending >= self.batch_size:
+                    flush()
+
+            if not self._errors:
+                flush()
+        except Exception as e:
+            with self._lock:
+                self._errors.append(e)
+            # Esvaziar a fila para não bloquear a leitura
+            for _ in iter(records.get, None):
+                pass
+
+
+def _remaining_ttl(last_activity: Optional[str]) -> int:
+    """TTL restante (segundos) de uma sessão com esta última atividade."""
+    if not last_activity:
+        return SESSION_TTL
+    age = time.time() - datetime.fromisoformat(last_activity).timestamp()
+    return int(SESSION_TTL - max(age, 0))
+
+
+def read_records(stream) -> Iterable[Dict]:
+    """Ler registros NDJSON, ignorando linhas em branco."""
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def run():
+    """
+    Importar conversas de um arquivo NDJSON (ou "-" para stdin).
+
+    Variáveis de ambiente: REDIS_URL, REDIS_DB, REDIS_KEY_PREFIX, REDIS_CLUSTER,
+    MESSAGE_ENCODING e MESSAGE_COMPRESSION_THRESHOLD (as mesmas da API).
+    """
+    parser = argparse.ArgumentParser(prog="import_sessions", description="Importar conversas de NDJSON para o Redis")
+    parser.add_argument("file", help="Arquivo NDJSON (\"-\" para stdin)")
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379"))
+    parser.add_argument("--db", type=int, default=int(os.getenv("REDIS_DB", "0")))
+    parser.add_argument("--key-prefix", default=os.getenv("REDIS_KEY_PREFIX", "sindico_pro:"),
+                        help="Prefixo das chaves no Redis de destino")
+    parser.add_argument("--cluster", action=argparse.BooleanOptionalAction, default=cluster_mode_from_env(),
+                        help="Destino é um Redis Cluster (chaves com hash tag por sessão)")
+    parser.add_argument("--workers", type=int, default=8, help="Conexões paralelas")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Mensagens por pipeline")
+    args = parser.parse_args()
+
+    memory = RedisConversationMemory(
+        redis_url=args.redis_url,
+        db=args.db,
+        key_prefix=args.key_prefix,
+        message_encoding=os.getenv("MESSAGE_ENCODING", "compact"),
+        compression_threshold=int(os.getenv("MESSAGE_COMPRESSION_THRESHOLD", "512")),
+        cluster_mode=args.cluster
+    )
+    importer = SessionImporter(memory, workers=args.workers, batch_size=args.batch_size)
+
+    print(f"📥 Importando conversas para {args.redis_url} (prefixo {args.key_prefix!r}, {args.workers} conexões)...")
+    stream = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+    try:
+        stats = importer.run(read_records(stream))
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    print(f"✅ Sessões importadas: {stats['sessions']}")
+    print(f"✅ Mensagens importadas: {stats['messages']} ({stats['messages_per_second']} msg/s)")
+    print(f"⚠️ Sessões expiradas ignoradas: {stats['skipped_sessions']}")
+    if stats["invalid_records"]:
+        print(f"⚠️ Registros inválidos ignorados: {stats['invalid_records']}")
+
+
+if __name__ == "__main__":
+    run()
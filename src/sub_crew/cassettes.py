@@ -0,0 +1,165 @@
+"""
+Gravação e reprodução (cassetes) do tráfego do crew com o LLM e com o
+WebsiteSearchTool.
+
+No modo "record", cada chamada real é anexada ao arquivo de cassete (JSONL)
+com a requisição, a resposta e a latência. No modo "replay", as respostas
+são servidas do arquivo, sem rede, com a latência original ou nenhuma, para
+que benchmarks da orquestração rodem sempre com as mesmas entradas.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, Optional
+
+from sub_crew import run_control
+from sub_crew.metrics import metrics
+
+CASSETTE_RECORD = "record"
+CASSETTE_REPLAY = "replay"
+
+
+class CassetteMiss(Exception):
+    """Chamada sem resposta gravada no cassete (modo replay)."""
+
+
+def interaction_key(kind: str, name: str, request: Any) -> str:
+    """Chave estável de uma chamada (tipo, modelo/ferramenta e requisição)."""
+    payload = json.dumps([kind, name, request], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    Arquivo JSONL de interações gravadas.
+
+    Chamadas idênticas repetidas durante a gravação são reproduzidas na
+    mesma ordem; depois da última, a última resposta é repetida.
+    """
+
+    def __init__(self, path: str, mode: str, replay_latency: bool = True):
+        """
+        Inicializar cassete.
+
+        Args:
+            path: Arquivo JSONL do cassete
+            mode: "record" (anexa chamadas reais) ou "replay" (serve do arquivo)
+            replay_latency: No replay, esperar a latência gravada de cada chamada
+        """
+        if mode not in (CASSETTE_RECORD, CASSETTE_REPLAY):
+            raise ValueError(f"Modo de cassete desconhecido: {mode}")
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self._lock = threading.Lock()
+        self._interactions = defaultdict(deque)
+        self._last = {}
+
+        if mode == CASSETTE_REPLAY:
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    interaction = json.loads(line)
+                    self._interactions[interaction["key"]].append(interaction)
+
+    def call(self, kind: str, name: str, request: Any, real_call: Callable[[], Any]) -> Any:
+        """
+        Executar (record) ou reproduzir (replay) uma chamada.
+
+        Args:
+            kind: "llm" ou "tool"
+            name: Modelo ou nome da ferramenta
+            request: Dados que identificam a chamada (mensagens, argumentos)
+            real_call: Chamada real, usada apenas na gravação
+
+        Raises:
+            CassetteMiss: No replay, se a chamada não foi gravada
+        """
+        key = interaction_key(kind, name, request)
+        if self.mode == CASSETTE_REPLAY:
+            return self._replay(kind, name, key)
+
+        start = time.perf_counter()
+        response = real_call()
+        self._record({
+            "key": key,
+            "kind": kind,
+            "name": name,
+            "request": request,
+            "response": response,
+            "latency": round(time.perf_counter() - start, 4)
+        })
+        metrics.incr("cassette.calls", kind=kind, result="recorded")
+        return response
+
+    def _record(self, interaction: Dict):
+        line = json.dumps(interaction, ensure_ascii=False, default=str) + "\n"
+        # Uma única escrita em modo append por interação: vários processos
+        # podem gravar no mesmo cassete sem misturar linhas
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+        finally:
+            os.close(fd)
+
+    def _replay(self, kind: str, name: str, key: str) -> Any:
+        with self._lock:
+            queue = self._interactions.get(key)
+            if queue:
+                interaction = self._last[key] = queue.popleft()
+            else:
+                interaction = self._last.get(key)
+
+        if interaction is None:
+            metrics.incr("cassette.calls", kind=kind, result="miss")
+            raise CassetteMiss(f"Chamada não gravada no cassete {self.path} ({kind} {name}, chave {key})")
+
+        metrics.incr("cassette.calls", kind=kind, result="replayed")
+        if self.replay_latency:
+            # Interrompida, como a chamada real, se a execução for cancelada ou expirar
+            run_control.sleep(interaction["latency"])
+        return interaction["response"]
+
+
+_cassette: Optional[Cassette] = None
+_cassette_initialized = False
+_cassette_lock = threading.Lock()
+
+
+def create_cassette() -> Optional[Cassette]:
+    """
+    Criar cassete a partir do ambiente.
+
+    Variáveis de ambiente:
+    - CREW_CASSETTE_MODE: "record", "replay" ou "off" (padrão: "off")
+    - CREW_CASSETTE_PATH: Arquivo do cassete (padrão: "cassettes/crew.jsonl")
+    - CREW_CASSETTE_LATENCY: No replay, "original" ou "zero" (padrão: "original")
+    """
+    mode = os.getenv("CREW_CASSETTE_MODE", "off").lower()
+    if mode in ("off", "false", "0", ""):
+        return None
+
+    return Cassette(
+        os.getenv("CREW_CASSETTE_PATH", "cassettes/crew.jsonl"),
+        mode,
+        replay_latency=os.getenv("CREW_CASSETTE_LATENCY", "original").lower() != "zero"
+    )
+
+
+def get_cassette() -> Optional[Cassette]:
+    """Obter o cassete global (criado na primeira chamada)."""
+    global _cassette, _cassette_initialized
+    if not _cassette_initialized:
+        with _cassette_lock:
+            if not _cassette_initialized:
+                _cassette = create_cassette()
+                _cassette_initialized = True
+    return _cassette
@@ -0,0 +1,349 @@
+"""
+Camadas em disco local para conversas:
+- Arquivo frio: mensagens antigas ficam em arquivos de segmento append-only e
+  um índice SQLite aponta, para cada sessão e número de sequência, o segmento
+  e o offset.
+- Sessões descarregadas: sessões inativas saem do Redis e ficam em SQLite,
+  uma linha por sessão com a lista de mensagens comprimida.
+"""
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import msgpack
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    session_key TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    archived_at REAL NOT NULL,
+    PRIMARY KEY (session_key, seq)
+);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+"""
+
+
+class ColdMessageArchive:
+    """
+    Arquivo de mensagens em segmentos append-only com índice SQLite.
+
+    As mensagens são gravadas exatamente como estão no Redis (bytes já
+    codificados), então a leitura usa o mesmo decodificador da memória.
+    """
+
+    def __init__(self, storage_path: str = "memory_data/archive", segment_max_bytes: int = 64 * 1024 * 1024):
+        """
+        Inicializar arquivo frio.
+
+        Args:
+            storage_path: Diretório dos segmentos e do índice
+            segment_max_bytes: Tamanho a partir do qual um novo segmento é aberto
+        """
+        self.storage_path = Path(storage_path)
+        self.storage_path.mkdir(parents=True, exist_ok=True)
+        self.segment_max_bytes = segment_max_bytes
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.storage_path / "index.db"),
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def _segment_path(self, segment_id: int) -> Path:
+        return self.storage_path / f"segment-{segment_id:06d}.log"
+
+    def append(self, session_key: str, entries: Iterable[Tuple[int, bytes]]):
+        """
+        Arquivar mensagens de uma sessão.
+
+        Args:
+            session_key: Identificador da sessão (chave de mensagens no Redis)
+            entries: Tuplas (sequência, mensagem codificada)
+        """
+        entries = list(entries)
+        if not entries:
+            return
+
+        with self._lock:
+            # BEGIN IMMEDIATE serializa gravações entre processos no mesmo host
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT id, size FROM segments ORDER BY id DESC LIMIT 1").fetchone()
+                if row is None or row[1] >= self.segment_max_bytes:
+                    segment_id = (row[0] + 1) if row else 1
+                    self._conn.execute("INSERT INTO segments (id, size) VALUES (?, 0)", (segment_id,))
+                else:
+                    segment_id = row[0]
+
+                now = time.time()
+                index_rows = []
+                with open(self._segment_path(segment_id), "ab") as segment:
+                    offset = segment.tell()
+                    for seq, data in entries:
+                        segment.write(data)
+                        index_rows.append((session_key, seq, segment_id, offset, len(data), now))
+                        offset += len(data)
+                    segment.flush()
+
+                # REPLACE: uma sessão recriada após expirar reaproveita as sequências
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO messages "
+                    "(session_key, seq, segment, offset, length, archived_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    index_rows
+                )
+                self._conn.execute("UPDATE segments SET size = ? WHERE id = ?", (offset, segment_id))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def read(self, session_key: str, before_seq: Optional[int] = None, limit: Optional[int] = None) -> List[Tuple[int, bytes]]:
+        """
+        Ler mensagens arquivadas de uma sessão em ordem cronológica.
+
+        Args:
+            session_key: Identificador da sessão
+            before_seq: Retornar apenas sequências menores que este valor
+            limit: Retornar apenas as N mensagens mais recentes
+        """
+        query = "SELECT seq, segment, offset, length FROM messages WHERE session_key = ?"
+        params: list = [session_key]
+        if before_seq is not None:
+            query += " AND seq < ?"
+            params.append(before_seq)
+        query += " ORDER BY seq DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        rows.reverse()
+        return self._read_rows(rows)
+
+    def iter_session(self, session_key: str, before_seq: Optional[int] = None,
+                     batch_size: int = 500) -> Iterator[Tuple[int, bytes]]:
+        """
+        Percorrer as mensagens arquivadas de uma sessão em ordem cronológica,
+        lendo `batch_size` por vez (memória constante).
+        """
+        last_seq = -1
+        while True:
+            query = "SELECT seq, segment, offset, length FROM messages WHERE session_key = ? AND seq > ?"
+            params: list = [session_key, last_seq]
+            if before_seq is not None:
+                query += " AND seq < ?"
+                params.append(before_seq)
+            query += " ORDER BY seq LIMIT ?"
+            params.append(batch_size)
+
+            with self._lock:
+                rows = self._conn.execute(query, params).fetchall()
+            if not rows:
+                return
+
+            yield from self._read_rows(rows)
+            last_seq = rows[-1][0]
+
+    def _read_rows(self, rows) -> List[Tuple[int, bytes]]:
+        entries = []
+        open_segments = {}
+        try:
+            for seq, segment_id, offset, length in rows:
+                segment = open_segments.get(segment_id)
+                if segment is None:
+                    segment = open_segments[segment_id] = open(self._segment_path(segment_id), "rb")
+                segment.seek(offset)
+                entries.append((seq, segment.read(length)))
+        finally:
+            for segment in open_segments.values():
+                segment.close()
+        return entries
+
+    def count(self, session_key: str) -> int:
+        """Número de mensagens arquivadas de uma sessão."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE session_key = ?", (session_key,)
+            ).fetchone()[0]
+
+    def delete_session(self, session_key: str):
+        """
+        Remover as mensagens arquivadas de uma sessão.
+        O espaço nos segmentos não é recuperado (append-only).
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE session_key = ?", (session_key,))
+
+    def session_keys(self) -> List[str]:
+        """Listar as sessões com mensagens arquivadas."""
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT session_key FROM messages").fetchall()
+        return [row[0] for row in rows]
+
+    def get_stats(self) -> dict:
+        """Estatísticas do arquivo frio."""
+        with self._lock:
+            messages, sessions = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT session_key) FROM messages"
+            ).fetchone()
+            segments, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM segments"
+            ).fetchone()
+        return {
+            "archived_messages": messages,
+            "archived_sessions": sessions,
+            "segments": segments,
+            "segment_bytes": size,
+            "storage_path": str(self.storage_path)
+        }
+
+
+OFFLOAD_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_key TEXT PRIMARY KEY,
+    blob BLOB NOT NULL,
+    message_count INTEGER NOT NULL,
+    raw_bytes INTEGER NOT NULL,
+    last_activity REAL NOT NULL,
+    offloaded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_last_activity ON sessions (last_activity);
+"""
+
+
+class OffloadedSessionStore:
+    """
+    Sessões inativas retiradas do Redis, uma linha SQLite por sessão.
+
+    A lista de mensagens é gravada como está no Redis (bytes já codificados,
+    da mais nova para a mais antiga), empacotada com msgpack e comprimida.
+    """
+
+    def __init__(self, storage_path: str = "memory_data/offload"):
+        """
+        Inicializar armazenamento de sessões descarregadas.
+
+        Args:
+            storage_path: Diretório do banco SQLite
+        """
+        self.storage_path = Path(storage_path)
+        self.storage_path.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.storage_path / "sessions.db"),
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(OFFLOAD_SCHEMA)
+
+    def put(self, session_key: str, entries: List[bytes], last_activity: float) -> int:
+        """
+        Gravar as mensagens de uma sessão.
+
+        Args:
+            session_key: Chave de mensagens da sessão no Redis
+            entries: Mensagens na ordem da lista do Redis
+            last_activity: Última atividade da sessão (epoch)
+
+        Returns:
+            Tamanho gravado em bytes
+        """
+        blob = zlib.compress(msgpack.packb(entries, use_bin_type=True), 6)
+        raw_bytes = sum(len(entry) for entry in entries)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions "
+                "(session_key, blob, message_count, raw_bytes, last_activity, offloaded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session_key, blob, len(entries), raw_bytes, last_activity, time.time())
+            )
+        return len(blob)
+
+    def take(self, session_key: str) -> Optional[List[bytes]]:
+        """
+        Retirar uma sessão do armazenamento (ler e apagar atomicamente).
+        Com reidratações simultâneas, apenas uma recebe as mensagens.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT blob FROM sessions WHERE session_key = ?", (session_key,)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute("DELETE FROM sessions WHERE session_key = ?", (session_key,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+        return msgpack.unpackb(zlib.decompress(row[0]), raw=False)
+
+    def peek(self, session_key: str) -> Optional[List[bytes]]:
+        """Ler uma sessão descarregada sem retirá-la do armazenamento."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT blob FROM sessions WHERE session_key = ?", (session_key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return msgpack.unpackb(zlib.decompress(row[0]), raw=False)
+
+    def contains(self, session_key: str) -> bool:
+        """Verificar se a sessão está descarregada."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM sessions WHERE session_key = ?", (session_key,)
+            ).fetchone() is not None
+
+    def delete(self, session_key: str):
+        """Remover uma sessão descarregada."""
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_key = ?", (session_key,))
+
+    def purge_inactive(self, before: float) -> int:
+        """
+        Remover sessões sem atividade desde `before` (epoch).
+
+        Returns:
+            Número de sessões removidas
+        """
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM sessions WHERE last_activity < ?", (before,)
+            ).rowcount
+
+    def get_stats(self) -> dict:
+        """Estatísticas das sessões descarregadas."""
+        with self._lock:
+            sessions, messages, raw_bytes, stored_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(message_count), 0), "
+                "COALESCE(SUM(raw_bytes), 0), COALESCE(SUM(LENGTH(blob)), 0) FROM sessions"
+            ).fetchone()
+        return {
+            "offloaded_sessions": sessions,
+            "offloaded_messages": messages,
+            "raw_bytes": raw_bytes,
+            "stored_bytes": stored_bytes,
+            "storage_path": str(self.storage_path)
+        }
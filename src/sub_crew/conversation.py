@@ -0,0 +1,154 @@
+"""
+Fluxo de uma rodada de conversa com o crew.
+Compartilhado entre a API e os workers que processam jobs em segundo plano.
+"""
+from collections import deque
+from datetime import datetime
+from typing import List, Dict, Optional
+
+from sub_crew.crew import SubCrew
+from sub_crew.memory import ChatMessage, RedisConversationMemory
+from sub_crew.metrics import metrics
+
+# Mensagens anteriores incluídas no contexto do crew
+CONTEXT_MESSAGES = 10
+
+
+def prepare_context_for_crew(conversation_history: List[ChatMessage], current_message: str) -> Dict:
+    """
+    Preparar contexto da conversa para o crew.
+    Inclui histórico e mensagem atual.
+    """
+    # Construir contexto da conversa
+    context_messages = []
+    for msg in conversation_history[-CONTEXT_MESSAGES:]:
+        role = "Usuário" if msg.sender == "user" else "Assistente"
+        context_messages.append(f"{role}: {msg.content}")
+
+    # Adicionar mensagem atual
+    context_messages.append(f"Usuário: {current_message}")
+
+    # Construir contexto completo
+    conversation_context = "\n".join(context_messages)
+
+    return {
+        "question": current_message,
+        "conversation_history": conversation_context,
+        "current_year": str(datetime.now().year),
+        "context": f"Histórico da conversa:\n{conversation_context}\n\nPergunta atual: {current_message}"
+    }
+
+
+def extract_response_from_result(result) -> str:
+    """
+    Extrair resposta do resultado do crew.
+    """
+    if hasattr(result, 'raw'):
+        return str(result.raw)
+    elif hasattr(result, 'output'):
+        return str(result.output)
+    else:
+        return str(result)
+
+
+def run_chat_turn(
+    crew: SubCrew,
+    memory: RedisConversationMemory,
+    message: str,
+    session_id: str,
+    user_id: Optional[str] = None,
+    save_user_message: bool = True
+) -> str:
+    """
+    Executar uma rodada completa: registrar a pergunta, rodar o crew
+    com o histórico e registrar a resposta do assistente.
+
+    Args:
+        crew: Instância do SubCrew usada para executar a rodada
+        memory: Sistema de memória da conversa
+        message: Pergunta do usuário
+        session_id: ID da sessão
+        user_id: ID do usuário (opcional)
+        save_user_message: Se False, assume que a pergunta já está no histórico
+            (ex.: job reprocessado após reinício de um worker)
+
+    Returns:
+        Texto da resposta do assistente
+    """
+    # Adicionar mensagem do usuário ao histórico
+    if save_user_message:
+        user_message = ChatMessage(
+            content=message,
+            sender="user",
+            timestamp=datetime.now()
+        )
+        memory.add_message(session_id, user_message, user_id)
+
+    # Obter apenas o trecho do histórico usado no contexto
+    conversation_history = memory.get_recent_messages(session_id, CONTEXT_MESSAGES, user_id)
+
+    # Preparar contexto e executar crew
+    context = prepare_context_for_crew(conversation_history, message)
+    result = crew.crew().kickoff(inputs=context)
+
+    # Extrair resposta do resultado
+    response_text = extract_response_from_result(result)
+
+    # Adicionar resposta do assistente ao histórico
+    assistant_message = ChatMessage(
+        content=response_text,
+        sender="assistant",
+        timestamp=datetime.now()
+    )
+    memory.add_message(session_id, assistant_message, user_id)
+
+    return response_text
+
+
+class SessionContext:
+    """
+    Últimas mensagens de uma sessão mantidas em memória durante uma conexão
+    (ex.: WebSocket), para montar o contexto do crew sem reler o histórico.
+
+    Cada gravação devolve a nova versão da sessão; se ela não for a seguinte
+    à conhecida, outra conexão alterou a sessão e o trecho é relido do Redis.
+    Com write-behind a gravação fica no buffer e não devolve versão: o trecho
+    segue apenas as mensagens desta conexão até a próxima releitura.
+    """
+
+    def __init__(self, memory: RedisConversationMemory, session_id: str,
+                 user_id: Optional[str] = None, size: int = CONTEXT_MESSAGES):
+        self.memory = memory
+        self.session_id = session_id
+        self.user_id = user_id
+        self.size = size
+        self.version = 0
+        self._messages = deque(maxlen=size)
+
+    def load(self):
+        """Ler a versão e as últimas mensagens da sessão."""
+        # Versão lida antes das mensagens: uma gravação entre as duas leituras
+        # só provoca uma releitura a mais na próxima mensagem
+        self.version = self.memory.get_session_version(self.session_id, self.user_id)
+        self._messages = deque(
+            self.memory.get_recent_messages(self.session_id, self.size, self.user_id),
+            maxlen=self.size
+        )
+
+    def add(self, message: ChatMessage):
+        """Gravar uma mensagem na sessão e no trecho em memória."""
+        version = self.memory.add_message(self.session_id, message, self.user_id)
+        if version is None:
+            self._messages.append(message)
+            metrics.incr("conversation.session_context", result="buffered")
+        elif version == self.version + 1:
+            self._messages.append(message)
+            self.version = version
+            metrics.incr("conversation.session_context", result="hit")
+        else:
+            metrics.incr("conversation.session_context", result="reload")
+            self.load()
+
+    def recent(self) -> List[ChatMessage]:
+        """Últimas mensagens (ordem cronológica)."""
+        return list(self._messages)
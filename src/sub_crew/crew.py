@@ -1,39 +1,119 @@
+import contextvars
 import os
-from crewai import Agent, Crew, Process, Task, LLM
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Optional
+
+from crewai import Agent, Crew, Process, Task
 from crewai.project import CrewBase, agent, crew, task
 from crewai_tools import (
   WebsiteSearchTool
 )
 
-llm = LLM(
-  model="gemini/gemini-1.5-flash", 
-  temperature=0,
-  api_key=os.getenv("GEMINI_API_KEY"),
-  provider="google"
-)
+from sub_crew.cassettes import get_cassette
+from sub_crew.llm import GovernedLLM
+from sub_crew.progress import report_step, report_task
+from sub_crew.run_control import call_controlled, remaining_time
+
+def create_llm() -> GovernedLLM:
+    """LLM dos agentes (cada instância acumula o próprio uso de tokens)."""
+    return GovernedLLM(
+        model="gemini/gemini-1.5-flash",
+        temperature=0,
+        api_key=os.getenv("GEMINI_API_KEY"),
+        provider="google"
+    )
+
+
+# LLM compartilhado pelos crews do processo
+llm = create_llm()
+
+class RecordedWebsiteSearchTool(WebsiteSearchTool):
+    """
+    WebsiteSearchTool cujos resultados passam pelo cassete, quando ativo,
+    e cujas buscas respeitam o cancelamento e o prazo da execução.
+    """
+
+    def _run(self, *args, **kwargs):
+        return call_controlled(self._recorded_run, *args, **kwargs)
+
+    def _recorded_run(self, *args, **kwargs):
+        cassette = get_cassette()
+        if cassette is None:
+            return super()._run(*args, **kwargs)
+        return cassette.call(
+            "tool", self.name, {"args": args, "kwargs": kwargs},
+            lambda: super(RecordedWebsiteSearchTool, self)._run(*args, **kwargs)
+        )
+
+
+class ScopedAgent(Agent):
+    """
+    Agent cujo limite de tempo (max_execution_time) é o prazo restante da
+    execução ativa, recalculado a cada tarefa, e mantém a execução ativa
+    (cancelamento e prazo) na thread em que a tarefa roda.
+    """
+
+    def execute_task(self, *args, **kwargs):
+        # Os agentes são memoizados e reutilizados entre execuções do mesmo
+        # SubCrew (worker, WebSocket): o limite vem do prazo da execução atual
+        self.max_execution_time = _max_execution_time()
+        return super().execute_task(*args, **kwargs)
+
+    def _execute_with_timeout(self, task_prompt: str, task: Task, timeout: int) -> str:
+        # O Agent original usa um ThreadPoolExecutor sem copiar o contexto e
+        # espera a thread terminar mesmo depois do timeout
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(
+            contextvars.copy_context().run, self._execute_without_timeout, task_prompt, task
+        )
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            raise TimeoutError(
+                f"Task '{task.description}' execution timed out after {timeout} seconds."
+            ) from None
+        finally:
+            executor.shutdown(wait=False)
+
+
+def _max_execution_time() -> Optional[int]:
+    """Tempo restante da requisição, para limitar a execução de cada agente."""
+    remaining = remaining_time()
+    return None if remaining is None else max(1, int(remaining))
+
 
 @CrewBase
 class SubCrew:
     agents_config = "config/agents.yaml"
     tasks_config = "config/tasks.yaml"
 
-    web_rag_tool = WebsiteSearchTool()
+    web_rag_tool = RecordedWebsiteSearchTool()
+
+    def __init__(self, agent_llm: Optional[GovernedLLM] = None):
+        """
+        Args:
+            agent_llm: LLM dos agentes deste crew (None usa o compartilhado do
+                processo); um LLM próprio permite medir os tokens de cada execução
+        """
+        self.agent_llm = agent_llm or llm
 
     @agent
     def sub(self) -> Agent:
-        return Agent(
+        return ScopedAgent(
             config=self.agents_config["sub"], # type: ignore[index]
             verbose=True,
-            llm=llm,
+            llm=self.agent_llm,
+            step_callback=report_step,
         )
 
     @agent
     def answering_questions_specialist(self) -> Agent:
-        return Agent(
+        return ScopedAgent(
             config=self.agents_config["answering_questions_specialist"], # type: ignore[index]
             tools=[self.web_rag_tool],
             verbose=True,
-            llm=llm,
+            llm=self.agent_llm,
+            step_callback=report_step,
         )
     
     @task
@@ -66,5 +146,6 @@ class SubCrew:
             process=Process.hierarchical,
             manager_agent=self.sub(),
             verbose=True,
-            llm=llm
+            llm=self.agent_llm,
+            task_callback=report_task
         )
\ No newline at end of file
@@ -0,0 +1,34 @@
+"""
+Serialização JSON rápida para os corpos montados à mão pela API (histórico
+a partir dos bytes gravados, registros NDJSON).
+
+Usa orjson (dependência do projeto); em instalações sem ele (ex.: plataforma
+sem wheel), json da biblioteca padrão com saída compacta e equivalente (UTF-8
+sem escapes, datetimes em ISO 8601), mais lento.
+"""
+import json
+from datetime import date, datetime
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # fallback sem o ganho de desempenho
+    orjson = None
+
+
+def _default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Objeto do tipo {type(value).__name__} não é serializável em JSON")
+
+
+def dumps(value: Any) -> bytes:
+    """Serializar `value` em JSON compacto (UTF-8)."""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def dumps_line(value: Any) -> bytes:
+    """Serializar `value` como uma linha NDJSON."""
+    return dumps(value) + b"\n"
@@ -0,0 +1,106 @@
+"""
+Respostas condicionais (ETag / If-None-Match) e comprimidas dos endpoints
+consultados por polling (histórico e lista de sessões).
+
+O ETag vem da versão da sessão (ou da lista de sessões do usuário) no Redis,
+incrementada a cada gravação: um GET da versão basta para responder 304 sem
+ler nem serializar o histórico.
+"""
+import gzip
+import zlib
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+
+from sub_crew.metrics import metrics
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional; sem ele as respostas usam gzip
+    brotli = None
+
+# Corpos menores que isso não compensam a compressão
+COMPRESSION_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def version_etag(kind: str, version: int, variant: str = "") -> str:
+    """
+    ETag fraco de uma versão (kind distingue histórico e lista de sessões;
+    variant, as páginas de uma mesma versão).
+    """
+    if variant:
+        return f'W/"{kind}{version}-{zlib.crc32(variant.encode("utf-8")):08x}"'
+    return f'W/"{kind}{version}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Comparação fraca: W/"x" e "x" são equivalentes
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def not_modified(request: Request, etag: str, endpoint: str) -> Optional[Response]:
+    """Resposta 304 se o cliente já tem a versão `etag`; None caso contrário."""
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        metrics.incr("http_cache.requests", endpoint=endpoint, result="not_modified")
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    metrics.incr("http_cache.requests", endpoint=endpoint, result="modified")
+    return None
+
+
+def _accepted_encodings(request: Request) -> Dict[str, float]:
+    encodings = {}
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = item.strip().partition(";")
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        encodings[name.strip().lower()] = quality
+    return encodings
+
+
+def json_response(request: Request, body: bytes, etag: Optional[str] = None,
+                  min_size: int = COMPRESSION_MIN_BYTES) -> Response:
+    """
+    Resposta JSON com ETag, comprimida com brotli ou gzip quando o cliente
+    aceita e o corpo tem pelo menos `min_size` bytes.
+    """
+    headers = {"Vary": "Accept-Encoding"}
+    if etag is not None:
+        headers["ETag"] = etag
+        headers["Cache-Control"] = "no-cache"
+
+    if len(body) >= min_size:
+        accepted = _accepted_encodings(request)
+        encoding = None
+        if brotli is not None and accepted.get("br", 0) > 0:
+            encoding = "br"
+            compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+        elif accepted.get("gzip", 0) > 0:
+            encoding = "gzip"
+            compressed = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+        if encoding is not None:
+            metrics.incr("http_cache.compressed_bytes", len(body), encoding=encoding, stage="raw")
+            metrics.incr("http_cache.compressed_bytes", len(compressed), encoding=encoding, stage="sent")
+            headers["Content-Encoding"] = encoding
+            body = compressed
+
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,290 @@
+"""
+Fila de jobs de chat usando Redis Streams com consumer groups.
+Permite que a API apenas enfileire a pergunta e que workers separados
+executem o crew, escalando de forma independente.
+"""
+import os
+import uuid
+from datetime import datetime
+from typing import List, Dict, Optional, Tuple
+from dataclasses import dataclass
+
+import redis
+
+from sub_crew.redis_connection import is_cluster_client
+
+# Status possíveis de um job
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+FINISHED_STATUSES = (JOB_COMPLETED, JOB_FAILED)
+
+# Folga (segundos) entre o prazo de um job e o tempo sem ACK para reivindicá-lo:
+# o crew pode levar alguns segundos para parar depois do prazo
+CLAIM_IDLE_MARGIN = 5 * 60
+
+
+@dataclass
+class ChatJob:
+    job_id: str
+    message: str
+    session_id: str
+    status: str
+    created_at: datetime
+    updated_at: datetime
+    user_id: Optional[str] = None
+    response: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = 0
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "message": self.message,
+            "session_id": self.session_id,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+            "user_id": self.user_id,
+            "response": self.response,
+            "error": self.error,
+            "attempts": self.attempts
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(
+            job_id=data["job_id"],
+            message=data["message"],
+            session_id=data["session_id"],
+            status=data["status"],
+            created_at=datetime.fromisoformat(data["created_at"]),
+            updated_at=datetime.fromisoformat(data["updated_at"]),
+            user_id=data.get("user_id") or None,
+            response=data.get("response") or None,
+            error=data.get("error") or None,
+            attempts=int(data.get("attempts") or 0)
+        )
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+
+class ChatJobQueue:
+    """
+    Fila de jobs de chat sobre Redis Streams.
+
+    Cada job é uma entrada no stream (apenas com o job_id) e um hash com
+    o estado completo. Workers leem via consumer group; entradas pendentes
+    de workers que morreram são reivindicadas com XAUTOCLAIM, então os jobs
+    sobrevivem a reinícios.
+    """
+
+    def __init__(self,
+                 redis_client: redis.Redis,
+                 key_prefix: str = "sindico_pro:",
+                 group: str = "crew_workers",
+                 max_attempts: int = 3,
+                 claim_idle_ms: int = 20 * 60 * 1000,
+                 result_ttl: int = 24 * 60 * 60,
+                 stream_maxlen: int = 100000):
+        """
+        Inicializar fila de jobs.
+
+        Args:
+            redis_client: Cliente Redis (com decode_responses=True)
+            key_prefix: Prefixo para as chaves Redis
+            group: Nome do consumer group dos workers
+            max_attempts: Tentativas antes de marcar o job como falho
+            claim_idle_ms: Tempo sem ACK para considerar um job abandonado; deve
+                superar o prazo dos jobs mais CLAIM_IDLE_MARGIN, senão um job
+                ainda em execução é reivindicado e executado de novo
+            result_ttl: Tempo (segundos) que o resultado fica disponível
+            stream_maxlen: Tamanho máximo aproximado do stream
+        """
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.group = group
+        self.max_attempts = max_attempts
+        self.claim_idle_ms = claim_idle_ms
+        self.result_ttl = result_ttl
+        self.stream_maxlen = stream_maxlen
+        # Em cluster, stream e jobs compartilham o slot ({jobs}) para que as
+        # gravações de um job cheguem ao mesmo nó na ordem do pipeline
+        self.namespace = "{jobs}" if is_cluster_client(redis_client) else "jobs"
+        self.stream_key = f"{key_prefix}{self.namespace}:stream"
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.key_prefix}{self.namespace}:{job_id}"
+
+    def ensure_group(self):
+        """Criar o consumer group (e o stream) se ainda não existirem."""
+        try:
+            self.redis_client.xgroup_create(self.stream_key, self.group, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def enqueue(self, message: str, session_id: str, user_id: Optional[str] = None) -> ChatJob:
+        """
+        Enfileirar uma pergunta para ser processada por um worker.
+        """
+        now = datetime.now()
+        job = ChatJob(
+            job_id=str(uuid.uuid4()),
+            message=message,
+            session_id=session_id,
+            status=JOB_QUEUED,
+            created_at=now,
+            updated_at=now,
+            user_id=user_id
+        )
+
+        job_key = self._job_key(job.job_id)
+        mapping = {k: v for k, v in job.to_dict().items() if v is not None}
+
+        pipe = self.redis_client.pipeline()
+        pipe.hset(job_key, mapping=mapping)
+        pipe.expire(job_key, self.result_ttl)
+        pipe.xadd(self.stream_key, {"job_id": job.job_id},
+                  maxlen=self.stream_maxlen, approximate=True)
+        pipe.execute()
+
+        return job
+
+    def get_job(self, job_id: str) -> Optional[ChatJob]:
+        """Obter o estado atual de um job."""
+        data = self.redis_client.hgetall(self._job_key(job_id))
+        if not data:
+            return None
+        return ChatJob.from_dict(data)
+
+    def read_jobs(self, consumer: str, count: int = 1, block_ms: int = 5000) -> List[Tuple[str, str]]:
+        """
+        Ler jobs para um consumidor.
+
+        Primeiro reivindica entradas abandonadas por outros workers e,
+        se não houver, bloqueia esperando novas entradas.
+
+        Returns:
+            Lista de tuplas (entry_id, job_id)
+        """
+        _, claimed, *_ = self.redis_client.xautoclaim(
+            self.stream_key, self.group, consumer,
+            min_idle_time=self.claim_idle_ms, start_id="0-0", count=count
+        )
+        entries = [entry for entry in claimed if entry and entry[1]]
+
+        if not entries:
+            response = self.redis_client.xreadgroup(
+                self.group, consumer, {self.stream_key: ">"},
+                count=count, block=block_ms
+            )
+            for _, stream_entries in response or []:
+                entries.extend(stream_entries)
+
+        return [(entry_id, fields["job_id"]) for entry_id, fields in entries]
+
+    def start(self, entry_id: str, job_id: str) -> Optional[ChatJob]:
+        """
+        Marcar um job como em execução.
+
+        Returns:
+            O job atualizado, ou None se ele não deve ser executado
+            (expirado, já finalizado ou sem tentativas restantes).
+        """
+        job_key = self._job_key(job_id)
+        pipe = self.redis_client.pipeline()
+        pipe.hincrby(job_key, "attempts", 1)
+        pipe.hgetall(job_key)
+        attempts, data = pipe.execute()
+
+        if not data or "job_id" not in data:
+            # Hash expirou: descartar a entrada do stream
+            self.redis_client.delete(job_key)
+            self.redis_client.xack(self.stream_key, self.group, entry_id)
+            return None
+
+        job = ChatJob.from_dict(data)
+        if job.finished:
+            self.redis_client.xack(self.stream_key, self.group, entry_id)
+            return None
+
+        if attempts > self.max_attempts:
+            self.fail(entry_id, job_id, f"Número máximo de tentativas ({self.max_attempts}) excedido")
+            return None
+
+        job.status = JOB_RUNNING
+        job.updated_at = datetime.now()
+        self.redis_client.hset(job_key, mapping={
+            "status": JOB_RUNNING,
+            "updated_at": job.updated_at.isoformat()
+        })
+        return job
+
+    def mark_user_message_saved(self, job_id: str):
+        """Registrar que a pergunta do job já foi gravada no histórico."""
+        self.redis_client.hset(self._job_key(job_id), "user_message_saved", 1)
+
+    def user_message_saved(self, job_id: str) -> bool:
+        return bool(self.redis_client.hget(self._job_key(job_id), "user_message_saved"))
+
+    def complete(self, entry_id: str, job_id: str, response: str):
+        """Gravar o resultado do job e confirmar a entrada no stream."""
+        self._finish(entry_id, job_id, {"status": JOB_COMPLETED, "response": response})
+
+    def fail(self, entry_id: str, job_id: str, error: str):
+        """Marcar o job como falho e confirmar a entrada no stream."""
+        self._finish(entry_id, job_id, {"status": JOB_FAILED, "error": error})
+
+    def _finish(self, entry_id: str, job_id: str, fields: Dict):
+        job_key = self._job_key(job_id)
+        fields["updated_at"] = datetime.now().isoformat()
+
+        pipe = self.redis_client.pipeline()
+        pipe.hset(job_key, mapping=fields)
+        pipe.expire(job_key, self.result_ttl)
+        pipe.xack(self.stream_key, self.group, entry_id)
+        pipe.xdel(self.stream_key, entry_id)
+        pipe.execute()
+
+    def get_stats(self) -> Dict:
+        """Obter estatísticas da fila."""
+        try:
+            pending = self.redis_client.xpending(self.stream_key, self.group)
+            groups = self.redis_client.xinfo_groups(self.stream_key)
+            group_info = next((g for g in groups if g.get("name") == self.group), {})
+            return {
+                "stream_length": self.redis_client.xlen(self.stream_key),
+                "pending": pending.get("pending", 0),
+                "consumers": group_info.get("consumers", 0),
+                "lag": group_info.get("lag")
+            }
+        except redis.ResponseError as e:
+            return {"error": str(e)}
+
+
+def create_job_queue(redis_client: redis.Redis, key_prefix: str) -> ChatJobQueue:
+    """
+    Criar fila de jobs de chat.
+
+    Variáveis de ambiente:
+    - CHAT_JOBS_GROUP: Nome do consumer group (padrão: "crew_workers")
+    - CHAT_JOBS_MAX_ATTEMPTS: Tentativas por job (padrão: 3)
+    - CHAT_JOBS_CLAIM_IDLE_SECONDS: Tempo para reivindicar jobs abandonados (padrão: 1200);
+      precisa ser maior que CHAT_JOBS_TIMEOUT + CLAIM_IDLE_MARGIN
+    - CHAT_JOBS_RESULT_TTL: Tempo de retenção do resultado em segundos (padrão: 86400)
+    """
+    queue = ChatJobQueue(
+        redis_client,
+        key_prefix=key_prefix,
+        group=os.getenv("CHAT_JOBS_GROUP", "crew_workers"),
+        max_attempts=int(os.getenv("CHAT_JOBS_MAX_ATTEMPTS", "3")),
+        claim_idle_ms=int(os.getenv("CHAT_JOBS_CLAIM_IDLE_SECONDS", "1200")) * 1000,
+        result_ttl=int(os.getenv("CHAT_JOBS_RESULT_TTL", str(24 * 60 * 60)))
+    )
+    queue.ensure_group()
+    return queue
@@ -0,0 +1,51 @@
+"""
+LLM usado pelos agentes do crew.
+Toda chamada passa pelo executor resiliente (timeout, retries, hedging e
+circuit breaker) e cada tentativa pelo governador global de uso (RPM/TPM
+e concorrência).
+
+Com um cassete ativo (CREW_CASSETTE_MODE), as chamadas são gravadas em
+arquivo ou, no replay, respondidas pelo arquivo sem chegar ao provedor.
+"""
+from crewai import LLM
+
+from sub_crew.cassettes import get_cassette
+from sub_crew.llm_governor import estimate_tokens, get_llm_governor
+from sub_crew.llm_resilience import get_llm_caller
+from sub_crew.run_control import check_cancelled
+
+
+class GovernedLLM(LLM):
+    """
+    LLM do CrewAI cujas chamadas aguardam vaga no orçamento global
+    compartilhado entre réplicas antes de chegar ao provedor.
+    """
+
+    def call(self, messages, *args, **kwargs):
+        # Execução cancelada (ex.: cliente desconectou): não iniciar novas chamadas
+        check_cancelled()
+        cassette = get_cassette()
+        if cassette is None:
+            return self._resilient_call(messages, *args, **kwargs)
+        return cassette.call(
+            "llm", self.model, messages,
+            lambda: self._resilient_call(messages, *args, **kwargs)
+        )
+
+    def _resilient_call(self, messages, *args, **kwargs):
+        caller = get_llm_caller()
+        if caller is None:
+            return self._governed_call(messages, *args, **kwargs)
+        return caller.call(lambda: self._governed_call(messages, *args, **kwargs))
+
+    def _governed_call(self, messages, *args, **kwargs):
+        """Uma única chamada ao provedor, dentro do orçamento global."""
+        governor = get_llm_governor()
+        if governor is None:
+            return super().call(messages, *args, **kwargs)
+
+        prompt_tokens = estimate_tokens(messages)
+        with governor.slot(prompt_tokens) as slot:
+            response = super().call(messages, *args, **kwargs)
+            slot.record_completion(response, prompt_tokens)
+        return response
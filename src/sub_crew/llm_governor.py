@@ -0,0 +1,324 @@
+"""
+Controle global de uso do LLM compartilhado entre todas as réplicas.
+Semáforo distribuído e orçamento de requisições/tokens por minuto (RPM/TPM)
+no Redis, com fila justa (FIFO) para chamadas que chegam perto do limite.
+"""
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import redis
+
+from sub_crew import run_control
+from sub_crew.metrics import metrics
+from sub_crew.run_control import RunCancelled
+from sub_crew.redis_connection import cluster_mode_from_env, create_redis_client
+
+# KEYS: semáforo, janela de requisições, tokens por segundo, fila, heartbeats, contador de senhas
+# ARGV: waiter_id, max simultâneas, limite RPM, limite TPM, tokens estimados,
+#       duração do lease (ms), tempo para descartar waiters inativos (ms)
+# Retorna {concedido, motivo, espera sugerida em ms, posição na fila}
+ACQUIRE_SCRIPT = """
+local waiter = ARGV[1]
+local max_concurrent = tonumber(ARGV[2])
+local rpm_limit = tonumber(ARGV[3])
+local tpm_limit = tonumber(ARGV[4])
+local tokens = tonumber(ARGV[5])
+local lease_ttl = tonumber(ARGV[6])
+local stale_ms = tonumber(ARGV[7])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local now_s = tonumber(time[1])
+
+-- Limpar leases expirados, janela antiga e waiters abandonados
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - 60000)
+local stale = redis.call('ZRANGEBYSCORE', KEYS[5], '-inf', now - stale_ms)
+for _, w in ipairs(stale) do
+  redis.call('ZREM', KEYS[4], w)
+  redis.call('ZREM', KEYS[5], w)
+end
+
+-- Entrar na fila (uma única vez) e atualizar heartbeat
+if not redis.call('ZSCORE', KEYS[4], waiter) then
+  redis.call('ZADD', KEYS[4], redis.call('INCR', KEYS[6]), waiter)
+end
+redis.call('ZADD', KEYS[5], now, waiter)
+redis.call('PEXPIRE', KEYS[4], 120000)
+redis.call('PEXPIRE', KEYS[5], 120000)
+redis.call('PEXPIRE', KEYS[6], 120000)
+
+local position = redis.call('ZRANK', KEYS[4], waiter)
+if position > 0 then
+  return {0, 'queued', 0, position}
+end
+
+if redis.call('ZCARD', KEYS[1]) >= max_concurrent then
+  return {0, 'concurrency', 0, 0}
+end
+
+if redis.call('ZCARD', KEYS[2]) >= rpm_limit then
+  local oldest = redis.call('ZRANGE', KEYS[2], 0, 0, 'WITHSCORES')
+  return {0, 'rpm', tonumber(oldest[2]) + 60000 - now, 0}
+end
+
+local used = 0
+local buckets = redis.call('HGETALL', KEYS[3])
+for i = 1, #buckets, 2 do
+  local second = tonumber(buckets[i])
+  if second <= now_s - 60 then
+    redis.call('HDEL', KEYS[3], buckets[i])
+  else
+    used = used + tonumber(buckets[i + 1])
+  end
+end
+if used > 0 and used + tokens > tpm_limit then
+  return {0, 'tpm', 1000, 0}
+end
+
+redis.call('ZADD', KEYS[1], now + lease_ttl, waiter)
+redis.call('ZADD', KEYS[2], now, waiter)
+redis.call('HINCRBY', KEYS[3], now_s, tokens)
+redis.call('ZREM', KEYS[4], waiter)
+redis.call('ZREM', KEYS[5], waiter)
+redis.call('PEXPIRE', KEYS[1], lease_ttl)
+redis.call('PEXPIRE', KEYS[2], 60000)
+redis.call('PEXPIRE', KEYS[3], 120000)
+return {1, tostring(now_s), 0, 0}
+"""
+
+
+class LLMBudgetTimeout(Exception):
+    """Chamada ao LLM esperou demais por uma vaga no orçamento global."""
+
+
+def estimate_tokens(value) -> int:
+    """Estimar tokens de um prompt ou resposta (~4 caracteres por token)."""
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return max(1, len(value) // 4)
+    if isinstance(value, dict):
+        return estimate_tokens(value.get("content"))
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_tokens(item) for item in value)
+    return estimate_tokens(str(value))
+
+
+class LLMSlot:
+    """Vaga concedida pelo governador para uma chamada ao LLM."""
+
+    def __init__(self, governor: "LLMGovernor", waiter_id: str, grant_second: str, reserved_tokens: int):
+        self.governor = governor
+        self.waiter_id = waiter_id
+        self.grant_second = grant_second
+        self.reserved_tokens = reserved_tokens
+        self.used_tokens = reserved_tokens
+
+    def record_completion(self, response, prompt_tokens: int):
+        """Ajustar o consumo de tokens com o tamanho real da resposta."""
+        self.used_tokens = prompt_tokens + estimate_tokens(response)
+
+
+class LLMGovernor:
+    """
+    Governador distribuído de chamadas ao LLM.
+
+    Toda chamada entra em uma fila FIFO no Redis e só é liberada quando é a
+    primeira da fila e há vaga no semáforo e orçamento de RPM/TPM. Assim as
+    réplicas ficam abaixo da cota do provedor em vez de receber erros 429.
+    """
+
+    def __init__(self,
+                 redis_client: redis.Redis,
+                 key_prefix: str = "sindico_pro:",
+                 max_concurrent: int = 8,
+                 rpm_limit: int = 60,
+                 tpm_limit: int = 1000000,
+                 completion_tokens: int = 1024,
+                 lease_ttl: int = 120,
+                 max_wait: float = 120.0,
+                 poll_interval: float = 0.1):
+        """
+        Inicializar governador.
+
+        Args:
+            redis_client: Cliente Redis
+            key_prefix: Prefixo para as chaves Redis
+            max_concurrent: Chamadas simultâneas permitidas em todas as réplicas
+            rpm_limit: Requisições por minuto
+            tpm_limit: Tokens por minuto
+            completion_tokens: Tokens reservados para a resposta de cada chamada
+            lease_ttl: Duração máxima (segundos) de uma vaga no semáforo
+            max_wait: Tempo máximo (segundos) de espera na fila
+            poll_interval: Intervalo base (segundos) entre tentativas na fila
+        """
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.max_concurrent = max_concurrent
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.completion_tokens = completion_tokens
+        self.lease_ttl_ms = lease_ttl * 1000
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+
+        # Hash tag mantém todas as chaves no mesmo slot em Redis Cluster
+        base = f"{key_prefix}{{llm_governor}}:"
+        self.keys = [
+            f"{base}semaphore",
+            f"{base}requests",
+            f"{base}tokens",
+            f"{base}queue",
+            f"{base}heartbeats",
+            f"{base}ticket",
+        ]
+        self._acquire = self.redis_client.register_script(ACQUIRE_SCRIPT)
+
+    def acquire(self, prompt_tokens: int) -> LLMSlot:
+        """
+        Aguardar na fila até obter uma vaga para a chamada.
+
+        Raises:
+            LLMBudgetTimeout: Se a espera ultrapassar max_wait
+        """
+        waiter_id = str(uuid.uuid4())
+        reserved = prompt_tokens + self.completion_tokens
+        start = time.monotonic()
+        stale_ms = max(5000, int(self.poll_interval * 1000 * 20))
+
+        try:
+            while True:
+                # Execução cancelada ou sem prazo restante: sair da fila
+                run_control.check_cancelled()
+                granted, reason, wait_ms, _ = self._acquire(
+                    keys=self.keys,
+                    args=[waiter_id, self.max_concurrent, self.rpm_limit, self.tpm_limit,
+                          reserved, self.lease_ttl_ms, stale_ms]
+                )
+                waited = time.monotonic() - start
+                if granted:
+                    metrics.observe("llm_governor.wait_seconds", waited)
+                    return LLMSlot(self, waiter_id, reason, reserved)
+
+                if waited >= self.max_wait:
+                    self._leave_queue(waiter_id)
+                    metrics.incr("llm_governor.timeouts")
+                    raise LLMBudgetTimeout(
+                        f"Tempo de espera por orçamento do LLM excedido ({self.max_wait:g}s, motivo: {reason})"
+                    )
+
+                metrics.incr("llm_governor.throttled", reason=reason)
+                # Espera curta com jitter; limitada para manter o heartbeat da fila
+                delay = max(self.poll_interval, min(int(wait_ms), 1000) / 1000.0)
+                run_control.sleep(delay * random.uniform(0.8, 1.2))
+        except RunCancelled:
+            # Liberar a posição na fila para as demais chamadas
+            self._leave_queue(waiter_id)
+            metrics.incr("llm_governor.cancelled")
+            raise
+
+    def release(self, slot: LLMSlot):
+        """Liberar a vaga e corrigir o consumo de tokens reservado."""
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.zrem(self.keys[0], slot.waiter_id)
+            delta = slot.used_tokens - slot.reserved_tokens
+            if delta:
+                pipe.hincrby(self.keys[2], slot.grant_second, delta)
+            pipe.execute()
+        except Exception as e:
+            # O lease expira sozinho; apenas registrar
+            print(f"Erro ao liberar vaga do LLM no Redis: {e}")
+
+    def _leave_queue(self, waiter_id: str):
+        pipe = self.redis_client.pipeline()
+        pipe.zrem(self.keys[3], waiter_id)
+        pipe.zrem(self.keys[4], waiter_id)
+        pipe.execute()
+
+    @contextmanager
+    def slot(self, prompt_tokens: int):
+        """Context manager que obtém e libera uma vaga para a chamada."""
+        slot = self.acquire(prompt_tokens)
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    def get_usage(self) -> Dict:
+        """Obter uso atual em relação ao orçamento."""
+        now_ms = int(time.time() * 1000)
+        pipe = self.redis_client.pipeline()
+        pipe.zcount(self.keys[0], now_ms, "+inf")
+        pipe.zcount(self.keys[1], now_ms - 60000, "+inf")
+        pipe.hgetall(self.keys[2])
+        pipe.zcard(self.keys[3])
+        active, requests, buckets, queued = pipe.execute()
+
+        now_s = now_ms // 1000
+        tokens = sum(int(v) for k, v in buckets.items() if int(k) > now_s - 60)
+
+        return {
+            "concurrent": active,
+            "max_concurrent": self.max_concurrent,
+            "requests_per_minute": requests,
+            "rpm_limit": self.rpm_limit,
+            "tokens_per_minute": tokens,
+            "tpm_limit": self.tpm_limit,
+            "queued": queued
+        }
+
+
+_governor: Optional[LLMGovernor] = None
+_governor_initialized = False
+_governor_lock = threading.Lock()
+
+
+def create_llm_governor() -> Optional[LLMGovernor]:
+    """
+    Criar governador de chamadas ao LLM.
+
+    Variáveis de ambiente:
+    - LLM_GOVERNOR_ENABLED: "false" desativa o governador (padrão: "true")
+    - REDIS_URL / REDIS_DB / REDIS_KEY_PREFIX / REDIS_CLUSTER: Mesmo Redis da memória
+    - LLM_MAX_CONCURRENT: Chamadas simultâneas em todas as réplicas (padrão: 8)
+    - LLM_RPM_LIMIT: Requisições por minuto (padrão: 60)
+    - LLM_TPM_LIMIT: Tokens por minuto (padrão: 1000000)
+    - LLM_COMPLETION_TOKENS: Tokens reservados por resposta (padrão: 1024)
+    - LLM_GOVERNOR_MAX_WAIT: Espera máxima na fila em segundos (padrão: 120)
+    """
+    if os.getenv("LLM_GOVERNOR_ENABLED", "true").lower() in ("false", "0", "no"):
+        return None
+
+    redis_client = create_redis_client(
+        os.getenv("REDIS_URL", "redis://localhost:6379"),
+        db=int(os.getenv("REDIS_DB", "0")),
+        decode_responses=True,
+        cluster=cluster_mode_from_env()
+    )
+    return LLMGovernor(
+        redis_client,
+        key_prefix=os.getenv("REDIS_KEY_PREFIX", "sindico_pro:"),
+        max_concurrent=int(os.getenv("LLM_MAX_CONCURRENT", "8")),
+        rpm_limit=int(os.getenv("LLM_RPM_LIMIT", "60")),
+        tpm_limit=int(os.getenv("LLM_TPM_LIMIT", "1000000")),
+        completion_tokens=int(os.getenv("LLM_COMPLETION_TOKENS", "1024")),
+        max_wait=float(os.getenv("LLM_GOVERNOR_MAX_WAIT", "120"))
+    )
+
+
+def get_llm_governor() -> Optional[LLMGovernor]:
+    """Obter o governador global (criado na primeira chamada)."""
+    global _governor, _governor_initialized
+    if not _governor_initialized:
+        with _governor_lock:
+            if not _governor_initialized:
+                _governor = create_llm_governor()
+                _governor_initialized = True
+    return _governor
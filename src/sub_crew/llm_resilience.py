@@ -0,0 +1,339 @@
+"""
+Chamadas resilientes ao LLM: timeout por chamada, novas tentativas com
+jitter, requisições duplicadas (hedging) após o p95 de latência e circuit
+breaker para falhar rápido quando o provedor está degradado.
+"""
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Optional
+
+from sub_crew import run_control
+from sub_crew.metrics import metrics
+from sub_crew.run_control import CANCEL_POLL_SECONDS, RunCancelled
+
+# Estados do circuit breaker
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+# Erros do provedor que não adianta repetir (nomes das exceções do LiteLLM)
+NON_RETRYABLE_ERRORS = (
+    "AuthenticationError",
+    "BadRequestError",
+    "ContextWindowExceededError",
+    "NotFoundError",
+    "PermissionDeniedError",
+    "LLMBudgetTimeout",
+)
+
+
+class CircuitOpenError(Exception):
+    """Circuito aberto: o provedor do LLM está degradado."""
+
+
+class LLMCallTimeout(Exception):
+    """Chamada ao LLM excedeu o tempo limite."""
+
+
+def is_retryable(error: Exception) -> bool:
+    """Verificar se vale a pena repetir a chamada após este erro."""
+    if isinstance(error, (CircuitOpenError, RunCancelled)):
+        return False
+    return type(error).__name__ not in NON_RETRYABLE_ERRORS
+
+
+class LatencyTracker:
+    """Latências recentes das chamadas bem-sucedidas."""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por falhas consecutivas.
+
+    Após `failure_threshold` falhas seguidas o circuito abre e as chamadas
+    falham imediatamente; depois de `reset_timeout` segundos uma chamada de
+    teste é liberada (meio aberto) e, se der certo, o circuito fecha.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Raises:
+            CircuitOpenError: Se o circuito estiver aberto
+        """
+        with self._lock:
+            if self.state == CIRCUIT_OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    metrics.incr("llm.circuit_rejected")
+                    raise CircuitOpenError("Provedor do LLM indisponível no momento (circuito aberto)")
+                self._set_state(CIRCUIT_HALF_OPEN)
+
+            if self.state == CIRCUIT_HALF_OPEN:
+                if self._probe_in_flight:
+                    metrics.incr("llm.circuit_rejected")
+                    raise CircuitOpenError("Provedor do LLM em verificação (circuito meio aberto)")
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            if self.state != CIRCUIT_CLOSED:
+                self._set_state(CIRCUIT_CLOSED)
+
+    def release_probe(self):
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == CIRCUIT_HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(CIRCUIT_OPEN)
+
+    def _set_state(self, state: str):
+        self.state = state
+        metrics.incr("llm.circuit_transitions", state=state)
+        metrics.set_gauge("llm.circuit_open", 1 if state == CIRCUIT_OPEN else 0)
+
+
+class ResilientLLMCaller:
+    """
+    Executa chamadas ao LLM com timeout, retries, hedging e circuit breaker.
+    """
+
+    def __init__(self,
+                 timeout: float = 60.0,
+                 max_retries: int = 2,
+                 backoff_base: float = 1.0,
+                 backoff_max: float = 10.0,
+                 hedge_enabled: bool = False,
+                 hedge_percentile: float = 0.95,
+                 hedge_min_samples: int = 20,
+                 breaker: Optional[CircuitBreaker] = None,
+                 max_workers: int = 32):
+        """
+        Inicializar executor resiliente.
+
+        Args:
+            timeout: Tempo limite (segundos) de cada tentativa
+            max_retries: Novas tentativas após a primeira falha
+            backoff_base: Base (segundos) do backoff exponencial
+            backoff_max: Espera máxima (segundos) entre tentativas
+            hedge_enabled: Disparar requisição duplicada para chamadas lentas
+            hedge_percentile: Percentil de latência que dispara o hedge
+            hedge_min_samples: Amostras necessárias antes de usar hedge
+            breaker: Circuit breaker (None desativa)
+            max_workers: Threads disponíveis para as chamadas
+        """
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker
+        self.latencies = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-call")
+
+    def call(self, fn: Callable):
+        """
+        Executar `fn` (uma chamada ao LLM) com as políticas configuradas.
+        """
+        for attempt in range(self.max_retries + 1):
+            if self.breaker:
+                self.breaker.before_call()
+
+            start = time.monotonic()
+            try:
+                result = self._execute(fn)
+            except Exception as e:
+                if self.breaker and is_retryable(e):
+                    self.breaker.record_failure()
+                elif self.breaker:
+                    # Erro do pedido, não do provedor: apenas libera a chamada de teste
+                    self.breaker.release_probe()
+
+                metrics.incr("llm.calls", outcome=type(e).__name__)
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                metrics.incr("llm.retries")
+                run_control.sleep(self._backoff(attempt))
+                continue
+
+            elapsed = time.monotonic() - start
+            self.latencies.add(elapsed)
+            if self.breaker:
+                self.breaker.record_success()
+            metrics.incr("llm.calls", outcome="success")
+            metrics.observe("llm.latency_seconds", elapsed)
+            return result
+
+    def _backoff(self, attempt: int) -> float:
+        """Backoff exponencial com jitter completo."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge_enabled or len(self.latencies) < self.hedge_min_samples:
+            return None
+        return self.latencies.percentile(self.hedge_percentile)
+
+    def _execute(self, fn: Callable):
+        """Uma tentativa: chamada principal e, se demorar, uma duplicada."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        # As threads do executor enxergam a execução ativa (cancelamento e prazo)
+        context = contextvars.copy_context()
+        control = run_control.current_run()
+        if control is not None and control.deadline is not None:
+            deadline = min(deadline, control.deadline)
+        pending = {self._executor.submit(context.copy().run, fn)}
+        hedge_delay = self._hedge_delay()
+        hedge_futures = set()
+        first_error = None
+
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            wait_for = remaining
+            if hedge_delay is not None and not hedge_futures:
+                wait_for = min(remaining, hedge_delay)
+            if control is not None:
+                wait_for = min(wait_for, CANCEL_POLL_SECONDS)
+
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            if not done and control is not None and control.cancelled:
+                metrics.incr("llm.cancelled")
+                # A chamada em andamento é abandonada; o resultado é descartado
+                control.check()
+
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    if future in hedge_futures:
+                        metrics.incr("llm.hedge_wins")
+                    return future.result()
+                first_error = first_error or error
+
+            if not done and hedge_delay is not None and not hedge_futures:
+                if time.monotonic() - start < hedge_delay:
+                    continue
+                hedge_futures.add(self._executor.submit(context.copy().run, fn))
+                pending |= hedge_futures
+                metrics.incr("llm.hedges")
+                continue
+
+            if not pending and first_error is not None:
+                raise first_error
+
+        if first_error is not None:
+            raise first_error
+        if control is not None and control.expired:
+            # Prazo da requisição acabou antes do tempo limite da chamada
+            metrics.incr("llm.deadline_exceeded")
+            control.check()
+        metrics.incr("llm.timeouts")
+        # A thread da chamada continua até o provedor responder; o resultado é descartado
+        raise LLMCallTimeout(f"Chamada ao LLM excedeu {self.timeout:g}s")
+
+    def get_status(self) -> Dict:
+        """Estado atual para observabilidade."""
+        return {
+            "circuit_state": self.breaker.state if self.breaker else None,
+            "consecutive_failures": self.breaker.failures if self.breaker else 0,
+            "latency_p50": self.latencies.percentile(0.5),
+            "latency_p95": self.latencies.percentile(0.95),
+            "hedge_delay": self._hedge_delay(),
+            "timeout": self.timeout,
+            "max_retries": self.max_retries
+        }
+
+
+_caller: Optional[ResilientLLMCaller] = None
+_caller_initialized = False
+_caller_lock = threading.Lock()
+
+
+def create_llm_caller() -> Optional[ResilientLLMCaller]:
+    """
+    Criar executor resiliente de chamadas ao LLM.
+
+    Variáveis de ambiente:
+    - LLM_RESILIENCE_ENABLED: "false" desativa timeouts/retries/hedging (padrão: "true")
+    - LLM_CALL_TIMEOUT: Tempo limite por tentativa em segundos (padrão: 60)
+    - LLM_MAX_RETRIES: Novas tentativas após falha (padrão: 2)
+    - LLM_RETRY_BACKOFF: Base do backoff em segundos (padrão: 1)
+    - LLM_RETRY_BACKOFF_MAX: Espera máxima entre tentativas (padrão: 10)
+    - LLM_HEDGE_ENABLED: Ativar requisições duplicadas (padrão: "false")
+    - LLM_HEDGE_PERCENTILE: Percentil que dispara o hedge (padrão: 0.95)
+    - LLM_CIRCUIT_FAILURES: Falhas seguidas para abrir o circuito (padrão: 5, 0 desativa)
+    - LLM_CIRCUIT_RESET: Segundos até testar o provedor novamente (padrão: 30)
+    """
+    if os.getenv("LLM_RESILIENCE_ENABLED", "true").lower() in ("false", "0", "no"):
+        return None
+
+    failure_threshold = int(os.getenv("LLM_CIRCUIT_FAILURES", "5"))
+    breaker = None
+    if failure_threshold > 0:
+        breaker = CircuitBreaker(
+            failure_threshold=failure_threshold,
+            reset_timeout=float(os.getenv("LLM_CIRCUIT_RESET", "30"))
+        )
+
+    return ResilientLLMCaller(
+        timeout=float(os.getenv("LLM_CALL_TIMEOUT", "60")),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+        backoff_base=float(os.getenv("LLM_RETRY_BACKOFF", "1")),
+        backoff_max=float(os.getenv("LLM_RETRY_BACKOFF_MAX", "10")),
+        hedge_enabled=os.getenv("LLM_HEDGE_ENABLED", "false").lower() in ("true", "1", "yes"),
+        hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95")),
+        breaker=breaker
+    )
+
+
+def get_llm_caller() -> Optional[ResilientLLMCaller]:
+    """Obter o executor global (criado na primeira chamada)."""
+    global _caller, _caller_initialized
+    if not _caller_initialized:
+        with _caller_lock:
+            if not _caller_initialized:
+                _caller = create_llm_caller()
+                _caller_initialized = True
+    return _caller
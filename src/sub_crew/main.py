@@ -4,10 +4,14 @@ import warnings
 
 from datetime import datetime
 
+from sub_crew.conversation import prepare_context_for_crew
 from sub_crew.crew import SubCrew
 
 warnings.filterwarnings("ignore", category=SyntaxWarning, module="pysbd")
 
+# Pergunta usada quando nenhuma é informada (run, train e test)
+DEFAULT_QUESTION = "Eu preciso contratar um contador?"
+
 def run(question: str = None):
     """
     Run the crew with a specific question or use default.
@@ -18,7 +22,7 @@ def run(question: str = None):
     try:
         # Use provided question or default
         if question is None:
-            question = "Eu preciso contratar um contador?"
+            question = DEFAULT_QUESTION
         
         inputs = {
             "question": question,
@@ -37,10 +41,8 @@ def train():
     """
     Train the crew for a given number of iterations.
     """
-    inputs = {
-        "topic": "AI LLMs",
-        'current_year': str(datetime.now().year)
-    }
+    # Mesmas variáveis que a API passa ao crew, sem histórico
+    inputs = prepare_context_for_crew([], DEFAULT_QUESTION)
     try:
         SubCrew().crew().train(n_iterations=int(sys.argv[1]), filename=sys.argv[2], inputs=inputs)
 
@@ -61,10 +63,8 @@ def test():
     """
     Test the crew execution and returns the results.
     """
-    inputs = {
-        "topic": "AI LLMs",
-        "current_year": str(datetime.now().year)
-    }
+    # Mesmas variáveis que a API passa ao crew, sem histórico
+    inputs = prepare_context_for_crew([], DEFAULT_QUESTION)
     
     try:
         SubCrew().crew().test(n_iterations=int(sys.argv[1]), eval_llm=sys.argv[2], inputs=inputs)
@@ -95,6 +95,37 @@ def chat():
     except Exception as e:
         raise RuntimeError(f"An error occurred while running chat: {e}") from e
 
+def migrate_messages():
+    """
+    Regravar as mensagens gravadas em outra codificação com a atual (MESSAGE_ENCODING).
+    Usage: migrate_messages
+    """
+    from sub_crew.memory_factory import memory
+
+    print("🔄 Migrando codificação das mensagens no Redis...")
+    stats = memory.migrate_message_encoding()
+    print(f"✅ Sessões verificadas: {stats['sessions_scanned']}")
+    print(f"✅ Sessões migradas: {stats['sessions_migrated']}")
+    print(f"✅ Mensagens migradas: {stats['messages_migrated']}")
+
+def offload_sessions():
+    """
+    Descarregar para o disco as sessões inativas (MEMORY_OFFLOAD_IDLE_HOURS).
+    Usage: offload_sessions
+    """
+    from sub_crew.memory_factory import memory
+
+    if memory.offload_store is None:
+        print("⚠️ Defina MEMORY_OFFLOAD_IDLE_HOURS para ativar o descarregamento de sessões")
+        return
+
+    print("💾 Descarregando sessões inativas para o disco...")
+    stats = memory.offload_idle_sessions()
+    print(f"✅ Sessões verificadas: {stats['sessions_scanned']}")
+    print(f"✅ Sessões descarregadas: {stats['sessions_offloaded']}")
+    print(f"✅ Mensagens descarregadas: {stats['messages_offloaded']}")
+    print(f"✅ Bytes: {stats['bytes_raw']} no Redis -> {stats['bytes_stored']} em disco")
+
 if __name__ == "__main__":
     # Se executado diretamente, usar modo chat
     if len(sys.argv) > 1 and sys.argv[1] == "chat":
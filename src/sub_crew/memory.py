@@ -2,12 +2,37 @@
 Sistema de memória com Redis para gerenciar contexto de conversas do chatbot.
 Versão alternativa ao memory.py para ambientes de produção com alta concorrência.
 """
-import json
+import threading
+import time
+from collections import OrderedDict
 import redis
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
 from dataclasses import dataclass
 
+from .cold_storage import ColdMessageArchive, OffloadedSessionStore
+from .message_codec import (
+    ENCODING_COMPACT,
+    compression_stats,
+    decode_message,
+    encode_message,
+    stored_encoding,
+    to_wire
+)
+from .metrics import metrics
+from .redis_connection import create_redis_client, scan_batches, scan_keys
+from .session_cache import SessionTailCache
+from .write_behind import FlushError, WriteBehindBuffer
+
+# Sessões expiram após 30 dias sem atividade
+SESSION_TTL = 30 * 24 * 60 * 60
+
+# Blocos de LRANGE enviados por round trip na exportação
+EXPORT_PIPELINE_DEPTH = 8
+
+# Sessões gravadas recentemente lembradas para leitura no primário
+RECENT_WRITES_MAX = 10000
+
 # Definir as classes de dados
 @dataclass
 class ChatMessage:
@@ -63,7 +88,21 @@ class RedisConversationMemory:
     def __init__(self, 
                  redis_url: str = "redis://localhost:6379",
                  db: int = 0,
-                 key_prefix: str = "sindico_pro:"):
+                 key_prefix: str = "sindico_pro:",
+                 message_encoding: str = ENCODING_COMPACT,
+                 compression_threshold: int = 512,
+                 hot_window: int = 0,
+                 archive: Optional[ColdMessageArchive] = None,
+                 archive_batch: int = 20,
+                 offload_store: Optional[OffloadedSessionStore] = None,
+                 offload_idle_seconds: int = 24 * 60 * 60,
+                 cluster_mode: bool = False,
+                 replica_url: Optional[str] = None,
+                 read_your_writes_window: float = 5.0,
+                 tail_cache: Optional[SessionTailCache] = None,
+                 write_behind_interval: float = 0.0,
+                 write_behind_max_pending: int = 100,
+                 flush_on_read: bool = True):
         """
         Inicializar sistema de memória Redis.
         
@@ -71,83 +110,781 @@ class RedisConversationMemory:
             redis_url: URL de conexão do Redis
             db: Número do banco de dados Redis
             key_prefix: Prefixo para as chaves Redis
+            message_encoding: Formato de gravação das mensagens ("compact" ou "json",
+                o formato da API, servido no histórico sem conversão);
+                a leitura aceita ambos
+            compression_threshold: Tamanho (bytes) a partir do qual as mensagens
+                são comprimidas (0 desativa)
+            hot_window: Mensagens mantidas no Redis por sessão; as mais antigas
+                vão para o arquivo frio (0 mantém tudo no Redis)
+            archive: Arquivo frio das mensagens antigas (obrigatório com hot_window)
+            archive_batch: Mensagens excedentes acumuladas antes de arquivar,
+                para não arquivar a cada nova mensagem
+            offload_store: Armazenamento em disco das sessões inativas (None desativa)
+            offload_idle_seconds: Inatividade a partir da qual a sessão sai do Redis
+            cluster_mode: Conectar a um Redis Cluster; as chaves de cada sessão
+                usam hash tag para ficar no mesmo slot
+            replica_url: Endpoint de réplicas para as leituras (None lê do primário);
+                em cluster, as leituras vão para as réplicas de cada shard
+            read_your_writes_window: Segundos após uma gravação em que as leituras
+                da mesma sessão continuam no primário
+            tail_cache: Cache em processo das últimas mensagens (None desativa)
+            write_behind_interval: Espera máxima (segundos) das mensagens no buffer
+                de write-behind, gravadas em lote com as de outras requisições
+                (0 desativa; add_message grava antes de retornar)
+            write_behind_max_pending: Mensagens no buffer que disparam o flush
+            flush_on_read: Gravar as mensagens pendentes da sessão antes de lê-la
         """
         self.redis_url = redis_url
         self.db = db
         self.key_prefix = key_prefix
+        self.message_encoding = message_encoding
+        self.compression_threshold = compression_threshold
+        self.hot_window = hot_window if archive is not None else 0
+        self.archive = archive
+        self.archive_batch = archive_batch
+        self.offload_store = offload_store
+        self.offload_idle_seconds = offload_idle_seconds
+        self.cluster_mode = cluster_mode
+        self.replica_url = replica_url
+        self.read_your_writes_window = read_your_writes_window
+        self._recent_writes = OrderedDict()
+        self._recent_writes_lock = threading.Lock()
+        self.tail_cache = tail_cache
+        self.flush_on_read = flush_on_read
+        self.write_buffer = None
         
         # Conectar ao Redis (obrigatório)
         try:
-            self.redis_client = redis.from_url(redis_url, db=db, decode_responses=True)
+            self.redis_client = create_redis_client(redis_url, db, decode_responses=True, cluster=cluster_mode)
+            # Mensagens são binárias (msgpack), então usam um cliente sem decodificação
+            self.binary_client = create_redis_client(redis_url, db, decode_responses=False, cluster=cluster_mode)
             # Testar conexão
             self.redis_client.ping()
             print("✅ Conectado ao Redis com sucesso")
+            
+            # Clientes de leitura (réplicas); sem réplica, apontam para o primário
+            self.read_client = self.redis_client
+            self.binary_read_client = self.binary_client
+            if replica_url:
+                self.read_client = create_redis_client(
+                    replica_url, db, decode_responses=True, cluster=cluster_mode, read_from_replicas=True
+                )
+                self.binary_read_client = create_redis_client(
+                    replica_url, db, decode_responses=False, cluster=cluster_mode, read_from_replicas=True
+                )
+                self.read_client.ping()
+                print("✅ Leituras direcionadas às réplicas do Redis")
         except Exception as e:
             print(f"❌ ERRO: Não foi possível conectar ao Redis: {e}")
             print("   Certifique-se de que o Redis está rodando!")
             raise RuntimeError(f"Redis não disponível: {e}")
+        
+        # Gravações agrupadas de várias requisições (group commit)
+        if write_behind_interval > 0:
+            self.write_buffer = WriteBehindBuffer(
+                self._write_batch, interval=write_behind_interval, max_pending=write_behind_max_pending
+            )
     
     def _get_key(self, key_type: str, identifier: str, user_id: Optional[str] = None) -> str:
         """Gerar chave Redis com prefixo e user_id."""
-        if user_id:
-            return f"{self.key_prefix}{key_type}:{user_id}:{identifier}"
-        return f"{self.key_prefix}{key_type}:{identifier}"
+        session = f"{user_id}:{identifier}" if user_id else identifier
+        if self.cluster_mode:
+            # Hash tag: todas as chaves da sessão ficam no mesmo slot
+            return f"{self.key_prefix}{key_type}:{{{session}}}"
+        return f"{self.key_prefix}{key_type}:{session}"
+    
+    def _user_key(self, key_type: str, user_id: str) -> str:
+        """Gerar chave Redis de um usuário (ex.: versão da lista de sessões)."""
+        if self.cluster_mode:
+            return f"{self.key_prefix}{key_type}:{{{user_id}}}"
+        return f"{self.key_prefix}{key_type}:{user_id}"
+    
+    def _touch_user_sessions(self, pipe, user_id: str, session_id: str, last_activity: Optional[float]):
+        """
+        Enfileirar em `pipe` a atualização do índice de sessões do usuário
+        (sorted set por última atividade; None remove a sessão) e o incremento
+        da versão da lista de sessões.
+        """
+        sessions_key = self._user_key("sessions", user_id)
+        if last_activity is None:
+            pipe.zrem(sessions_key, session_id)
+        else:
+            pipe.zadd(sessions_key, {session_id: last_activity})
+        pipe.expire(sessions_key, SESSION_TTL)
+        pipe.expire(self._user_key("sessions_indexed", user_id), SESSION_TTL)
+        
+        sessions_version_key = self._user_key("sessions_version", user_id)
+        pipe.incr(sessions_version_key)
+        pipe.expire(sessions_version_key, SESSION_TTL)
+    
+    def _user_pipeline(self, session_pipe, user_id: Optional[str]):
+        """
+        Pipeline para as chaves do usuário junto com uma gravação na sessão: a
+        própria transação da sessão ou, no cluster (chaves em outro slot), uma
+        pipeline separada. None sem user_id.
+        """
+        if not user_id:
+            return None
+        return self.binary_client.pipeline(transaction=False) if self.cluster_mode else session_pipe
+    
+    def _key_pattern(self, key_type: str, user_id: Optional[str] = None) -> str:
+        """Padrão de SCAN para as chaves de um tipo (de um usuário ou de todos)."""
+        session = f"{user_id}:*" if user_id else "*"
+        if self.cluster_mode:
+            return f"{self.key_prefix}{key_type}:{{{session}"
+        return f"{self.key_prefix}{key_type}:{session}"
+    
+    def _parse_key(self, key, key_type: str) -> Tuple[Optional[str], str]:
+        """
+        Extrair (user_id, session_id) de uma chave gerada por _get_key.
+        """
+        if isinstance(key, bytes):
+            key = key.decode("utf-8")
+        session = key[len(f"{self.key_prefix}{key_type}:"):]
+        if self.cluster_mode:
+            session = session[1:-1]
+        parts = session.rsplit(":", 1)
+        if len(parts) == 2:
+            return parts[0], parts[1]
+        return None, parts[0]
     
-    def add_message(self, session_id: str, message: ChatMessage, user_id: Optional[str] = None):
+    def add_message(self, session_id: str, message: ChatMessage, user_id: Optional[str] = None) -> Optional[int]:
         """
         Adicionar mensagem a uma conversa.
+        
+        Returns:
+            Nova versão da sessão (None com write-behind: a gravação fica no
+            buffer e a versão só existe após o flush)
         """
+        now = datetime.now()
+        if self.write_buffer is not None:
+            self.write_buffer.add((user_id, session_id), (message, now))
+            return None
         
         try:
-            # Adicionar mensagem à lista
-            message_key = self._get_key("messages", session_id, user_id)
-            self.redis_client.lpush(message_key, json.dumps(message.to_dict()))
-            
-            # Atualizar contador de mensagens
-            count_key = self._get_key("count", session_id, user_id)
-            self.redis_client.incr(count_key)
-            
-            # Atualizar última atividade
-            activity_key = self._get_key("activity", session_id, user_id)
-            self.redis_client.set(activity_key, datetime.now().isoformat())
-            
-            # Definir TTL (expira em 30 dias)
-            ttl = 30 * 24 * 60 * 60  # 30 dias em segundos
-            self.redis_client.expire(message_key, ttl)
-            self.redis_client.expire(count_key, ttl)
-            self.redis_client.expire(activity_key, ttl)
+            # MULTI mantém lista e contador consistentes (sequência das mensagens)
+            pipe = self.binary_client.pipeline(transaction=True)
+            user_pipe = self._user_pipeline(pipe, user_id)
+            self._queue_message_write(pipe, user_pipe, session_id, message, user_id, now)
             
+            length, count, version = pipe.execute()[:3]
+            if user_pipe is not None and user_pipe is not pipe:
+                user_pipe.execute()
         except Exception as e:
             print(f"Erro ao adicionar mensagem no Redis: {e}")
             raise
+        
+        self._after_message_write(session_id, message, user_id, length, count, version)
+        return int(version)
+    
+    def _queue_message_write(self, pipe, user_pipe, session_id: str, message: ChatMessage,
+                             user_id: Optional[str], now: datetime):
+        """
+        Enfileirar em `pipe` a gravação de uma mensagem; os três primeiros
+        resultados são o tamanho da lista, a contagem e a versão da sessão.
+        """
+        message_key = self._get_key("messages", session_id, user_id)
+        count_key = self._get_key("count", session_id, user_id)
+        activity_key = self._get_key("activity", session_id, user_id)
+        version_key = self._get_key("version", session_id, user_id)
+        
+        # Adicionar mensagem à lista
+        pipe.lpush(message_key, self._encode_message(message))
+        
+        # Atualizar contador de mensagens e versão da sessão
+        pipe.incr(count_key)
+        pipe.incr(version_key)
+        
+        # Atualizar última atividade
+        pipe.set(activity_key, now.isoformat())
+        
+        # Definir TTL (expira em 30 dias)
+        pipe.expire(message_key, SESSION_TTL)
+        pipe.expire(count_key, SESSION_TTL)
+        pipe.expire(version_key, SESSION_TTL)
+        pipe.expire(activity_key, SESSION_TTL)
+        
+        # Lista de sessões do usuário mudou (contagem e última atividade)
+        if user_pipe is not None:
+            self._touch_user_sessions(user_pipe, user_id, session_id, now.timestamp())
+    
+    def _after_message_write(self, session_id: str, message: ChatMessage, user_id: Optional[str],
+                             length: int, count: int, version: int):
+        """Atualizar caches, reidratar e arquivar após gravar uma mensagem."""
+        message_key = self._get_key("messages", session_id, user_id)
+        self._mark_written(message_key)
+        if self.tail_cache is not None:
+            self.tail_cache.record_write(message_key, version, message, new_session=count == 1)
+        
+        # Lista estava vazia: a sessão pode ter sido descarregada para o disco
+        if length == 1 and self.offload_store is not None:
+            self._rehydrate(session_id, user_id)
+        
+        # Mover mensagens antigas para o arquivo frio
+        if self.hot_window and length > self.hot_window + self.archive_batch:
+            try:
+                self._archive_overflow(session_id, user_id)
+            except Exception as e:
+                # As mensagens continuam no Redis; serão arquivadas na próxima vez
+                print(f"Erro ao arquivar mensagens antigas: {e}")
+    
+    def _write_batch(self, batch: list):
+        """
+        Gravar um lote do buffer de write-behind em um único round trip: uma
+        transação com todas as sessões ou, no cluster, uma por sessão (slots
+        diferentes) e uma pipeline para as chaves dos usuários.
+        
+        Só o que não foi gravado volta ao buffer (FlushError com as sessões
+        restantes); falhas depois da gravação (caches, reidratação, arquivo
+        frio, índice do usuário no cluster) são registradas sem repetir a
+        gravação.
+        """
+        if not self.cluster_mode:
+            pipe = self.binary_client.pipeline(transaction=True)
+            positions = self._queue_batch(pipe, pipe, batch)
+            # Falha aqui: nada foi gravado e o lote inteiro volta ao buffer
+            self._finish_batch(positions, pipe.execute())
+            return
+        
+        user_pipe = self.binary_client.pipeline(transaction=False)
+        for i, group in enumerate(batch):
+            pipe = self.binary_client.pipeline(transaction=True)
+            positions = self._queue_batch(pipe, None, [group])
+            try:
+                results = pipe.execute()
+            except Exception as e:
+                self._execute_user_pipeline(user_pipe)
+                raise FlushError(f"Erro ao gravar mensagens pendentes: {e}", batch[i:]) from e
+            (user_id, session_id), writes = group
+            if user_id:
+                for _, now in writes:
+                    self._touch_user_sessions(user_pipe, user_id, session_id, now.timestamp())
+            self._finish_batch(positions, results)
+        self._execute_user_pipeline(user_pipe)
+    
+    def _queue_batch(self, pipe, user_pipe, batch: list) -> list:
+        """Enfileirar as mensagens de `batch` em `pipe`; retorna a posição de cada uma."""
+        positions = []
+        for (user_id, session_id), writes in batch:
+            for message, now in writes:
+                positions.append((len(pipe), session_id, user_id, message))
+                self._queue_message_write(pipe, user_pipe if user_id else None,
+                                          session_id, message, user_id, now)
+        return positions
+    
+    def _finish_batch(self, positions: list, results: list):
+        """Atualizações após gravar um lote, isoladas por mensagem."""
+        for index, session_id, user_id, message in positions:
+            length, count, version = results[index:index + 3]
+            try:
+                self._after_message_write(session_id, message, user_id, length, count, version)
+            except Exception as e:
+                # A mensagem já está no Redis; não pode voltar ao buffer
+                metrics.incr("memory.write_behind.post_write_errors")
+                print(f"Erro após gravar mensagem da sessão {session_id}: {e}")
+    
+    def _execute_user_pipeline(self, user_pipe):
+        """Atualizar o índice de sessões dos usuários (cluster) sem afetar as mensagens já gravadas."""
+        if not len(user_pipe):
+            return
+        try:
+            user_pipe.execute()
+        except Exception as e:
+            metrics.incr("memory.write_behind.post_write_errors")
+            print(f"Erro ao atualizar índice de sessões dos usuários: {e}")
+    
+    def flush_writes(self, session_id: Optional[str] = None, user_id: Optional[str] = None) -> int:
+        """
+        Gravar no Redis as mensagens pendentes no buffer de write-behind: as de
+        uma sessão, as de um usuário (só user_id) ou todas.
+        
+        Returns:
+            Número de mensagens gravadas
+        """
+        if self.write_buffer is None:
+            return 0
+        if session_id is not None:
+            return self.write_buffer.flush(lambda key: key == (user_id, session_id))
+        if user_id is not None:
+            return self.write_buffer.flush(lambda key: key[0] == user_id)
+        return self.write_buffer.flush()
+    
+    def _flush_for_read(self, session_id: Optional[str] = None, user_id: Optional[str] = None):
+        """Flush-on-read: a leitura vê as gravações pendentes deste processo."""
+        if self.write_buffer is None or not self.flush_on_read:
+            return
+        try:
+            self.flush_writes(session_id, user_id)
+        except Exception as e:
+            # As gravações continuam no buffer; a leitura segue sem elas
+            print(f"Erro ao gravar mensagens pendentes antes da leitura: {e}")
+    
+    def close(self):
+        """Gravar as mensagens pendentes e encerrar o buffer de write-behind."""
+        if self.write_buffer is not None:
+            self.write_buffer.close()
+    
+    def _archive_overflow(self, session_id: str, user_id: Optional[str] = None):
+        """
+        Arquivar as mensagens além da janela quente e removê-las do Redis.
+        
+        LPUSH só insere no início da lista, então o final (mensagens mais
+        antigas) é estável e pode ser lido e cortado sem bloquear novas
+        mensagens. Um lock por sessão evita arquivamentos simultâneos.
+        """
+        message_key = self._get_key("messages", session_id, user_id)
+        count_key = self._get_key("count", session_id, user_id)
+        lock_key = self._get_key("archive_lock", session_id, user_id)
+        
+        if not self.redis_client.set(lock_key, "1", nx=True, ex=60):
+            return
+        try:
+            pipe = self.binary_client.pipeline(transaction=True)
+            pipe.get(count_key)
+            pipe.llen(message_key)
+            count, length = pipe.execute()
+            
+            overflow = length - self.hot_window
+            if overflow <= 0:
+                return
+            
+            # Sequência da mensagem mais antiga da lista
+            first_seq = int(count or length) - length
+            entries = self.binary_client.lrange(message_key, -overflow, -1)
+            
+            # Lista vem da mais nova para a mais antiga
+            self.archive.append(message_key, [
+                (first_seq + overflow - 1 - i, entry) for i, entry in enumerate(entries)
+            ])
+            self.binary_client.ltrim(message_key, 0, -(overflow + 1))
+        finally:
+            self.redis_client.delete(lock_key)
     
     def get_conversation(self, session_id: str, user_id: Optional[str] = None) -> Optional[List[ChatMessage]]:
         """
         Obter histórico de uma conversa.
         """
+        try:
+            return self._decode_entries(self._conversation_entries(session_id, user_id))
+        except Exception as e:
+            print(f"Erro ao obter conversa do Redis: {e}")
+            return []
+    
+    def get_conversation_wire(self, session_id: str, user_id: Optional[str] = None) -> List[bytes]:
+        """
+        Obter histórico de uma conversa já no JSON das respostas da API (uma
+        mensagem por item, em ordem cronológica), sem criar ChatMessage.
+        """
+        try:
+            return self._wire_entries(self._conversation_entries(session_id, user_id))
+        except Exception as e:
+            print(f"Erro ao obter conversa do Redis: {e}")
+            return []
+    
+    def _conversation_entries(self, session_id: str, user_id: Optional[str] = None) -> List[bytes]:
+        """Mensagens gravadas de uma conversa (ordem cronológica), ainda codificadas."""
+        self._flush_for_read(session_id, user_id)
+        message_key = self._get_key("messages", session_id, user_id)
+        count_key = self._get_key("count", session_id, user_id)
+        
+        messages_data, count = self._read_pipeline(message_key, lambda pipe: (
+            pipe.lrange(message_key, 0, -1),
+            pipe.get(count_key)
+        ))
+        
+        if not messages_data:
+            if self.offload_store is not None and self._rehydrate(session_id, user_id):
+                return self._conversation_entries(session_id, user_id)
+            return []
+        
+        # Ordem reversa para cronológica
+        entries = list(reversed(messages_data))
+        
+        # Mensagens anteriores à janela quente vêm do arquivo frio
+        if self.archive is not None:
+            first_hot_seq = int(count or len(messages_data)) - len(messages_data)
+            if first_hot_seq > 0:
+                cold = self.archive.read(message_key, before_seq=first_hot_seq)
+                entries = [entry for _, entry in cold] + entries
+        
+        return entries
+    
+    def get_session_version(self, session_id: str, user_id: Optional[str] = None) -> int:
+        """
+        Versão atual da sessão (incrementada a cada gravação ou limpeza; 0 se
+        a sessão nunca foi gravada).
+        """
+        self._flush_for_read(session_id, user_id)
+        message_key = self._get_key("messages", session_id, user_id)
+        version_key = self._get_key("version", session_id, user_id)
+        return int(self._reader(message_key, binary=False).get(version_key) or 0)
+    
+    def get_sessions_version(self, user_id: str) -> int:
+        """
+        Versão da lista de sessões do usuário (incrementada quando uma sessão
+        dele recebe mensagens ou é limpa; 0 se nunca houve gravação).
+        """
+        self._flush_for_read(user_id=user_id)
+        return int(self._reader(binary=False).get(self._user_key("sessions_version", user_id)) or 0)
+    
+    def get_history_page(self, session_id: str, user_id: Optional[str] = None, limit: int = 50,
+                         before_seq: Optional[int] = None, count_hint: Optional[int] = None
+                         ) -> Tuple[List[ChatMessage], Optional[int], int]:
+        """
+        Ler uma página do histórico (ver _history_page_entries).
+        
+        Returns:
+            (mensagens da mais recente para a mais antiga, `before_seq` da
+            próxima página ou None se acabou, total de mensagens da sessão)
+        """
+        entries, next_before, count = self._history_page_entries(session_id, user_id, limit, before_seq, count_hint)
+        return self._decode_entries(entries), next_before, count
+    
+    def get_history_page_wire(self, session_id: str, user_id: Optional[str] = None, limit: int = 50,
+                              before_seq: Optional[int] = None, count_hint: Optional[int] = None
+                              ) -> Tuple[List[bytes], Optional[int], int]:
+        """Como get_history_page, com as mensagens no JSON das respostas da API."""
+        entries, next_before, count = self._history_page_entries(session_id, user_id, limit, before_seq, count_hint)
+        return self._wire_entries(entries), next_before, count
+    
+    def _history_page_entries(self, session_id: str, user_id: Optional[str], limit: int,
+                              before_seq: Optional[int], count_hint: Optional[int]
+                              ) -> Tuple[List[bytes], Optional[int], int]:
+        """
+        Ler uma página do histórico, da mensagem mais recente para a mais antiga,
+        só com o trecho necessário da lista (e do arquivo frio, se preciso).
+        
+        As posições são números de sequência (0 = primeira mensagem da sessão),
+        estáveis enquanto novas mensagens chegam.
+        
+        Args:
+            session_id: ID da sessão
+            user_id: ID do usuário (opcional)
+            limit: Mensagens por página
+            before_seq: Retornar mensagens com sequência menor que esta; None
+                para a página mais recente
+            count_hint: Total de mensagens quando `before_seq` foi obtido; se
+                não mudou, a página sai em um único round trip
+        
+        Returns:
+            (mensagens codificadas da mais recente para a mais antiga,
+            `before_seq` da próxima página ou None se acabou, total de
+            mensagens da sessão)
+        """
+        self._flush_for_read(session_id, user_id)
+        message_key = self._get_key("messages", session_id, user_id)
+        count_key = self._get_key("count", session_id, user_id)
+        count = count_hint
+        
+        for _ in range(3):
+            # Índice na lista (0 = mais recente) da sequência before_seq - 1
+            start = 0 if before_seq is None or count is None else max(0, count - before_seq)
+            entries, length, stored_count = self._read_pipeline(message_key, lambda pipe: (
+                pipe.lrange(message_key, start, start + limit - 1),
+                pipe.llen(message_key),
+                pipe.get(count_key)
+            ))
+            current_count = max(int(stored_count or 0), length)
+            if before_seq is None or current_count == count:
+                break
+            # Chegaram mensagens desde o cursor: recalcular o índice
+            count = current_count
+        
+        if not length and self.offload_store is not None and self._rehydrate(session_id, user_id):
+            return self._history_page_entries(session_id, user_id, limit, before_seq, None)
+        
+        count = current_count
+        before_seq = count if before_seq is None else min(before_seq, count)
+        # Descartar mensagens já entregues se a sessão mudou entre as tentativas
+        first_seq = count - 1 - start
+        entries = entries[max(0, first_seq - (before_seq - 1)):]
+        first_hot_seq = count - length
+        
+        # Página passa do início da janela quente: completar com o arquivo frio
+        if len(entries) < limit and self.archive is not None and first_hot_seq > 0:
+            cold = self.archive.read(
+                message_key,
+                before_seq=min(before_seq - len(entries), first_hot_seq),
+                limit=limit - len(entries)
+            )
+            entries = list(entries) + [entry for _, entry in reversed(cold)]
+        
+        oldest_seq = before_seq - len(entries)
+        floor = 0 if self.archive is not None else first_hot_seq
+        next_before = oldest_seq if len(entries) == limit and oldest_seq > floor else None
+        return entries, next_before, count
+    
+    def get_recent_messages(self, session_id: str, limit: int = 10, user_id: Optional[str] = None) -> List[ChatMessage]:
+        """
+        Obter apenas as últimas mensagens de uma conversa (ordem cronológica).
+        Lê somente o trecho necessário da lista, sem carregar o histórico completo.
+        Com o cache de sessões, uma sessão que este processo acabou de gravar
+        não é lida do Redis.
+        """
+        self._flush_for_read(session_id, user_id)
         try:
             message_key = self._get_key("messages", session_id, user_id)
-            messages_data = self.redis_client.lrange(message_key, 0, -1)
+            count_key = self._get_key("count", session_id, user_id)
+            version_key = self._get_key("version", session_id, user_id)
             
-            if not messages_data:
-                return []
+            if self.tail_cache is not None:
+                cached = self._get_cached_tail(message_key, version_key, limit)
+                if cached is not None:
+                    return cached
             
-            # Converter de JSON para ChatMessage (ordem reversa para cronológica)
-            messages = []
-            for msg_data in reversed(messages_data):
-                try:
-                    msg_dict = json.loads(msg_data)
-                    messages.append(ChatMessage.from_dict(msg_dict))
-                except Exception as e:
-                    print(f"Erro ao converter mensagem: {e}")
-                    continue
+            messages_data, length, count, version = self._read_pipeline(message_key, lambda pipe: (
+                pipe.lrange(message_key, 0, limit - 1),
+                pipe.llen(message_key),
+                pipe.get(count_key),
+                pipe.get(version_key)
+            ))
+            
+            if not messages_data and self.offload_store is not None and self._rehydrate(session_id, user_id):
+                return self.get_recent_messages(session_id, limit, user_id)
             
+            entries = list(reversed(messages_data))
+            
+            # Janela quente menor que o pedido: completar com o arquivo frio
+            if self.archive is not None and messages_data and len(entries) < limit:
+                first_hot_seq = int(count or length) - length
+                if first_hot_seq > 0:
+                    cold = self.archive.read(message_key, before_seq=first_hot_seq, limit=limit - len(entries))
+                    entries = [entry for _, entry in cold] + entries
+            
+            messages = self._decode_entries(entries)
+            if self.tail_cache is not None and messages:
+                self.tail_cache.put(message_key, int(version or 0), messages, complete=len(messages) < limit)
             return messages
             
         except Exception as e:
-            print(f"Erro ao obter conversa do Redis: {e}")
+            print(f"Erro ao obter mensagens recentes do Redis: {e}")
             return []
     
+    def _get_cached_tail(self, message_key: str, version_key: str, limit: int) -> Optional[List[ChatMessage]]:
+        """
+        Últimas mensagens a partir do cache, ou None se for preciso ler o Redis.
+        Entradas fora da janela de confiança do cache são validadas com um GET da versão.
+        """
+        entry = self.tail_cache.get(message_key)
+        if entry is None or not entry.covers(limit):
+            metrics.incr("memory.tail_cache", result="miss")
+            return None
+        
+        if not self.tail_cache.trusted(entry):
+            version = self._reader(message_key).get(version_key)
+            if not self.tail_cache.confirm(message_key, int(version or 0)):
+                return None
+        
+        metrics.incr("memory.tail_cache", result="hit")
+        return list(entry.messages)[-limit:]
+    
+    def _mark_written(self, message_key: str):
+        """Registrar gravação na sessão (leituras seguintes ficam no primário)."""
+        if self.replica_url is None:
+            return
+        now = time.monotonic()
+        with self._recent_writes_lock:
+            self._recent_writes[message_key] = now
+            self._recent_writes.move_to_end(message_key)
+            # Descartar gravações fora da janela (as mais antigas ficam no início)
+            while self._recent_writes:
+                _, written_at = next(iter(self._recent_writes.items()))
+                if now - written_at < self.read_your_writes_window and len(self._recent_writes) <= RECENT_WRITES_MAX:
+                    break
+                self._recent_writes.popitem(last=False)
+    
+    def _use_primary(self, message_key: Optional[str]) -> bool:
+        """Verificar se a leitura deve ir ao primário (read-your-writes)."""
+        if self.replica_url is None:
+            return True
+        if message_key is None:
+            return False
+        with self._recent_writes_lock:
+            written_at = self._recent_writes.get(message_key)
+        return written_at is not None and time.monotonic() - written_at < self.read_your_writes_window
+    
+    def _reader(self, message_key: Optional[str] = None, binary: bool = True):
+        """
+        Cliente para uma leitura: réplica, exceto para sessões que este processo
+        gravou há menos de `read_your_writes_window` segundos.
+        """
+        if self._use_primary(message_key):
+            if self.replica_url is not None:
+                metrics.incr("memory.reads", target="primary")
+            return self.binary_client if binary else self.redis_client
+        metrics.incr("memory.reads", target="replica")
+        return self.binary_read_client if binary else self.read_client
+    
+    def _read_pipeline(self, message_key: str, build: Callable) -> list:
+        """
+        Executar as leituras de `build(pipe)` em um único round trip, na réplica
+        quando possível; se a réplica estiver indisponível, usa o primário.
+        """
+        client = self._reader(message_key)
+        try:
+            # Em cluster, MULTI iria sempre ao primário do shard
+            pipe = client.pipeline(transaction=client is self.binary_client or not self.cluster_mode)
+            build(pipe)
+            return pipe.execute()
+        except (redis.ConnectionError, redis.TimeoutError):
+            if client is self.binary_client:
+                raise
+            metrics.incr("memory.replica_fallbacks")
+            pipe = self.binary_client.pipeline(transaction=True)
+            build(pipe)
+            return pipe.execute()
+    
+    def _rehydrate(self, session_id: str, user_id: Optional[str] = None) -> bool:
+        """
+        Trazer de volta ao Redis uma sessão descarregada para o disco.
+        
+        As mensagens restauradas vão para o final da lista (são anteriores a
+        qualquer mensagem gravada desde o descarregamento).
+        
+        Returns:
+            True se a sessão estava descarregada
+        """
+        message_key = self._get_key("messages", session_id, user_id)
+        activity_key = self._get_key("activity", session_id, user_id)
+        
+        start = time.perf_counter()
+        entries = self.offload_store.take(message_key)
+        if not entries:
+            return False
+        
+        try:
+            ttl_ms = self.binary_client.pttl(activity_key)
+            pipe = self.binary_client.pipeline(transaction=True)
+            pipe.rpush(message_key, *entries)
+            pipe.pexpire(message_key, ttl_ms if ttl_ms and ttl_ms > 0 else SESSION_TTL * 1000)
+            pipe.execute()
+            self._mark_written(message_key)
+        except Exception:
+            # Devolver ao disco para não perder o histórico
+            self.offload_store.put(message_key, entries, time.time())
+            raise
+        
+        metrics.incr("memory.offload_sessions", direction="rehydrate")
+        metrics.incr("memory.offload_messages", len(entries), direction="rehydrate")
+        metrics.incr("memory.offload_bytes", sum(len(entry) for entry in entries), direction="rehydrate")
+        metrics.observe("memory.rehydrate_seconds", time.perf_counter() - start)
+        return True
+    
+    def offload_idle_sessions(self, idle_seconds: Optional[int] = None, batch_size: int = 100) -> Dict:
+        """
+        Mover para o disco as mensagens das sessões inativas há `idle_seconds`.
+        
+        Contador e última atividade continuam no Redis (listagem de sessões e
+        TTL seguem funcionando); a sessão é reidratada no primeiro acesso.
+        """
+        stats = {"sessions_scanned": 0, "sessions_offloaded": 0, "messages_offloaded": 0,
+                 "bytes_raw": 0, "bytes_stored": 0}
+        if self.offload_store is None:
+            return stats
+        
+        idle_seconds = self.offload_idle_seconds if idle_seconds is None else idle_seconds
+        cutoff_timestamp = time.time() - idle_seconds
+        
+        for activity_key in scan_keys(self.redis_client, self._key_pattern("activity"), batch_size):
+            stats["sessions_scanned"] += 1
+            last_activity_str = self.redis_client.get(activity_key)
+            if not last_activity_str:
+                continue
+            last_activity = datetime.fromisoformat(last_activity_str).timestamp()
+            if last_activity >= cutoff_timestamp:
+                continue
+            
+            user_id, session_id = self._parse_key(activity_key, "activity")
+            result = self._offload_session(session_id, user_id, last_activity)
+            if result:
+                messages, raw_bytes, stored_bytes = result
+                stats["sessions_offloaded"] += 1
+                stats["messages_offloaded"] += messages
+                stats["bytes_raw"] += raw_bytes
+                stats["bytes_stored"] += stored_bytes
+        
+        return stats
+    
+    def _offload_session(self, session_id: str, user_id: Optional[str], last_activity: float):
+        """
+        Descarregar uma sessão; desiste se ela receber mensagens no meio do processo.
+        
+        Returns:
+            (mensagens, bytes originais, bytes gravados) ou None
+        """
+        message_key = self._get_key("messages", session_id, user_id)
+        activity_key = self._get_key("activity", session_id, user_id)
+        
+        with self.binary_client.pipeline(transaction=True) as pipe:
+            pipe.watch(message_key, activity_key)
+            entries = pipe.lrange(message_key, 0, -1)
+            if not entries:
+                pipe.unwatch()
+                return None
+            
+            stored_bytes = self.offload_store.put(message_key, entries, last_activity)
+            try:
+                pipe.multi()
+                pipe.delete(message_key)
+                pipe.execute()
+            except redis.WatchError:
+                # Sessão voltou a ser usada; continua no Redis
+                self.offload_store.delete(message_key)
+                return None
+        
+        raw_bytes = sum(len(entry) for entry in entries)
+        metrics.incr("memory.offload_sessions", direction="offload")
+        metrics.incr("memory.offload_messages", len(entries), direction="offload")
+        metrics.incr("memory.offload_bytes", raw_bytes, direction="offload")
+        return len(entries), raw_bytes, stored_bytes
+    
+    def start_offloader(self, interval: float = 600) -> threading.Thread:
+        """
+        Executar offload_idle_sessions periodicamente em uma thread em segundo plano.
+        """
+        def _run():
+            while True:
+                try:
+                    stats = self.offload_idle_sessions()
+                    if stats["sessions_offloaded"]:
+                        print(f"💾 Sessões inativas descarregadas para o disco: {stats}")
+                except Exception as e:
+                    print(f"Erro ao descarregar sessões inativas: {e}")
+                time.sleep(interval)
+        
+        thread = threading.Thread(target=_run, name="session-offloader", daemon=True)
+        thread.start()
+        return thread
+    
+    def _decode_entries(self, entries: List[bytes]) -> List[ChatMessage]:
+        """Decodificar mensagens gravadas, ignorando as inválidas."""
+        messages = []
+        for msg_data in entries:
+            try:
+                messages.append(ChatMessage(**decode_message(msg_data)))
+            except Exception as e:
+                print(f"Erro ao converter mensagem: {e}")
+                continue
+        return messages
+    
+    def _wire_entries(self, entries: List[bytes]) -> List[bytes]:
+        """Converter mensagens gravadas para o JSON da API, ignorando as inválidas."""
+        wire = []
+        for msg_data in entries:
+            try:
+                wire.append(to_wire(msg_data))
+            except Exception as e:
+                print(f"Erro ao converter mensagem: {e}")
+                continue
+        return wire
+    
+    def _encode_message(self, message: ChatMessage) -> bytes:
+        return encode_message(
+            message.content, message.sender, message.timestamp,
+            self.message_encoding, self.compression_threshold
+        )
+    
     def get_conversation_context(self, session_id: str, max_messages: int = 10, user_id: Optional[str] = None) -> str:
         """
         Obter contexto da conversa formatado para o crew.
@@ -171,12 +908,34 @@ class RedisConversationMemory:
         Limpar histórico de uma conversa.
         """
         try:
+            # Gravações pendentes da sessão não podem chegar depois da limpeza
+            self.flush_writes(session_id, user_id)
+            
             # Remover todas as chaves relacionadas à sessão
             message_key = self._get_key("messages", session_id, user_id)
             count_key = self._get_key("count", session_id, user_id)
             activity_key = self._get_key("activity", session_id, user_id)
             
-            self.redis_client.delete(message_key, count_key, activity_key)
+            # A versão não é apagada: continua crescendo se a sessão for recriada
+            version_key = self._get_key("version", session_id, user_id)
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.delete(message_key, count_key, activity_key)
+            pipe.incr(version_key)
+            pipe.expire(version_key, SESSION_TTL)
+            user_pipe = self._user_pipeline(pipe, user_id)
+            if user_pipe is not None:
+                self._touch_user_sessions(user_pipe, user_id, session_id, None)
+            pipe.execute()
+            if user_pipe is not None and user_pipe is not pipe:
+                user_pipe.execute()
+            self._mark_written(message_key)
+            if self.tail_cache is not None:
+                self.tail_cache.invalidate(message_key)
+            
+            if self.archive is not None:
+                self.archive.delete_session(message_key)
+            if self.offload_store is not None:
+                self.offload_store.delete(message_key)
             
         except Exception as e:
             print(f"Erro ao limpar conversa no Redis: {e}")
@@ -186,28 +945,22 @@ class RedisConversationMemory:
         """
         Listar todas as sessões ativas.
         """
+        self._flush_for_read(user_id=user_id)
         try:
-            # Buscar todas as chaves de atividade
-            if user_id:
-                activity_pattern = self._get_key("activity", f"{user_id}:*")
-            else:
-                activity_pattern = self._get_key("activity", "*")
-            activity_keys = self.redis_client.keys(activity_pattern)
+            # Buscar todas as chaves de atividade (SCAN em todos os nós)
+            activity_pattern = self._key_pattern("activity", user_id)
             
             sessions = []
-            for activity_key in activity_keys:
+            for activity_key in scan_keys(self._reader(binary=False), activity_pattern):
                 # Extrair session_id da chave
-                key_parts = activity_key.split(":")
-                if user_id:
-                    session_id = key_parts[-1]  # Última parte é o session_id
-                else:
-                    session_id = key_parts[-1]  # Última parte é o session_id
+                key_user_id, session_id = self._parse_key(activity_key, "activity")
                 
                 # Obter informações da sessão
-                count_key = self._get_key("count", session_id, user_id)
-                message_count = int(self.redis_client.get(count_key) or 0)
+                reader = self._reader(self._get_key("messages", session_id, key_user_id), binary=False)
+                count_key = self._get_key("count", session_id, key_user_id)
+                message_count = int(reader.get(count_key) or 0)
                 last_activity = datetime.fromisoformat(
-                    self.redis_client.get(activity_key) or datetime.now().isoformat()
+                    reader.get(activity_key) or datetime.now().isoformat()
                 )
                 
                 # Criar SessionInfo (usar last_activity como created_at para simplicidade)
@@ -225,16 +978,114 @@ class RedisConversationMemory:
             print(f"Erro ao listar sessões do Redis: {e}")
             return []
     
+    def list_sessions_page(self, user_id: str, limit: int = 20,
+                           after: Optional[Tuple[float, str]] = None
+                           ) -> Tuple[List[SessionInfo], Optional[Tuple[float, str]]]:
+        """
+        Listar uma página das sessões de um usuário, da mais recente para a mais
+        antiga, a partir do índice de sessões (sorted set por última atividade).
+        
+        Args:
+            user_id: ID do usuário
+            limit: Sessões por página
+            after: Posição (última atividade, session_id) da última sessão da
+                página anterior; None para a primeira página
+        
+        Returns:
+            (sessões, posição para a próxima página ou None se acabou). Sessões
+            que expiraram desde a última gravação saem do índice e da página,
+            que pode vir com menos de `limit` sessões.
+        """
+        self._flush_for_read(user_id=user_id)
+        self._ensure_session_index(user_id)
+        sessions_key = self._user_key("sessions", user_id)
+        reader = self._reader(binary=False)
+        
+        pipe = reader.pipeline(transaction=False)
+        if after is None:
+            pipe.zrevrange(sessions_key, 0, limit, withscores=True)
+        else:
+            score, last_session = after
+            # Empates na mesma atividade vêm em ordem decrescente de session_id
+            pipe.zrevrangebyscore(sessions_key, score, score, withscores=True)
+            pipe.zrevrangebyscore(sessions_key, f"({score}", "-inf", start=0, num=limit + 1, withscores=True)
+        results = pipe.execute()
+        if after is None:
+            candidates = results[0]
+        else:
+            candidates = [(member, member_score) for member, member_score in results[0]
+                          if member < last_session] + results[1]
+        
+        page = candidates[:limit]
+        next_after = (page[-1][1], page[-1][0]) if len(candidates) > limit else None
+        
+        pipe = reader.pipeline(transaction=False)
+        for session_id, _ in page:
+            pipe.get(self._get_key("count", session_id, user_id))
+            pipe.get(self._get_key("activity", session_id, user_id))
+        values = pipe.execute() if page else []
+        
+        sessions = []
+        expired = []
+        for i, (session_id, _) in enumerate(page):
+            message_count, last_activity = values[2 * i], values[2 * i + 1]
+            if not last_activity:
+                expired.append(session_id)
+                continue
+            last_activity = datetime.fromisoformat(last_activity)
+            sessions.append(SessionInfo(
+                session_id=session_id,
+                created_at=last_activity,  # Aproximação
+                message_count=int(message_count or 0),
+                last_activity=last_activity
+            ))
+        if expired:
+            self.redis_client.zrem(sessions_key, *expired)
+        
+        return sessions, next_after
+    
+    def _ensure_session_index(self, user_id: str):
+        """
+        Incluir no índice de sessões do usuário as sessões gravadas antes de o
+        índice existir (uma vez por usuário, enquanto ele estiver ativo).
+        """
+        indexed_key = self._user_key("sessions_indexed", user_id)
+        if self.redis_client.exists(indexed_key):
+            return
+        
+        sessions_key = self._user_key("sessions", user_id)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pending = 0
+        for activity_key in scan_keys(self.redis_client, self._key_pattern("activity", user_id)):
+            key_user_id, session_id = self._parse_key(activity_key, "activity")
+            if key_user_id != user_id:
+                continue
+            last_activity = self.redis_client.get(activity_key)
+            if not last_activity:
+                continue
+            # GT: não sobrescrever a atividade gravada por uma mensagem nova no meio do processo
+            pipe.zadd(sessions_key, {session_id: datetime.fromisoformat(last_activity).timestamp()}, gt=True)
+            pending += 1
+            if pending >= 100:
+                pipe.execute()
+                pending = 0
+        pipe.expire(sessions_key, SESSION_TTL)
+        pipe.set(indexed_key, 1, ex=SESSION_TTL)
+        pipe.execute()
+        metrics.incr("memory.session_index_rebuilds")
+    
     def get_session_info(self, session_id: str, user_id: Optional[str] = None) -> Optional[SessionInfo]:
         """
         Obter informações de uma sessão específica.
         """
+        self._flush_for_read(session_id, user_id)
         try:
             count_key = self._get_key("count", session_id, user_id)
             activity_key = self._get_key("activity", session_id, user_id)
+            reader = self._reader(self._get_key("messages", session_id, user_id), binary=False)
             
-            message_count = int(self.redis_client.get(count_key) or 0)
-            last_activity_str = self.redis_client.get(activity_key)
+            message_count = int(reader.get(count_key) or 0)
+            last_activity_str = reader.get(activity_key)
             
             if not last_activity_str:
                 return None
@@ -259,49 +1110,239 @@ class RedisConversationMemory:
         try:
             cutoff_timestamp = datetime.now().timestamp() - (days * 24 * 60 * 60)
             
-            # Buscar todas as chaves de atividade
-            if user_id:
-                activity_pattern = self._get_key("activity", f"{user_id}:*")
-            else:
-                activity_pattern = self._get_key("activity", "*")
-            activity_keys = self.redis_client.keys(activity_pattern)
+            # Buscar todas as chaves de atividade (SCAN em todos os nós)
+            activity_pattern = self._key_pattern("activity", user_id)
             
             sessions_to_remove = []
-            for activity_key in activity_keys:
+            for activity_key in scan_keys(self.redis_client, activity_pattern):
                 last_activity_str = self.redis_client.get(activity_key)
                 if last_activity_str:
                     last_activity = datetime.fromisoformat(last_activity_str)
                     if last_activity.timestamp() < cutoff_timestamp:
-                        session_id = activity_key.split(":")[-1]
-                        sessions_to_remove.append(session_id)
+                        sessions_to_remove.append(self._parse_key(activity_key, "activity"))
             
             # Remover sessões antigas
-            for session_id in sessions_to_remove:
-                self.clear_conversation(session_id, user_id)
+            for key_user_id, session_id in sessions_to_remove:
+                self.clear_conversation(session_id, key_user_id)
+            
+            # Remover sessões descarregadas que já expiraram
+            if self.offload_store is not None:
+                self.offload_store.purge_inactive(cutoff_timestamp)
+            
+            # Remover do arquivo frio sessões que já expiraram no Redis
+            if self.archive is not None:
+                for message_key in self.archive.session_keys():
+                    if self.binary_client.exists(message_key):
+                        continue
+                    if self.offload_store is not None and self.offload_store.contains(message_key):
+                        continue
+                    self.archive.delete_session(message_key)
                 
         except Exception as e:
             print(f"Erro ao limpar sessões antigas do Redis: {e}")
             raise
     
+    def migrate_message_encoding(self, batch_size: int = 100) -> Dict:
+        """
+        Regravar com a codificação atual (MESSAGE_ENCODING) as mensagens
+        gravadas em outra: JSON legado -> compacto, ou compacto (comprimido ou
+        não) -> JSON, o formato copiado direto para as respostas da API.
+        
+        Cada lista é reescrita atomicamente (WATCH/MULTI), preservando a ordem
+        e o TTL; listas alteradas durante a migração são tentadas novamente.
+        """
+        stats = {"sessions_scanned": 0, "sessions_migrated": 0, "messages_migrated": 0}
+        pattern = self._key_pattern("messages")
+        
+        for message_key in scan_keys(self.binary_client, pattern, batch_size):
+            stats["sessions_scanned"] += 1
+            for _ in range(5):
+                try:
+                    with self.binary_client.pipeline(transaction=True) as pipe:
+                        pipe.watch(message_key)
+                        entries = pipe.lrange(message_key, 0, -1)
+                        outdated = [stored_encoding(entry) != self.message_encoding for entry in entries]
+                        if not any(outdated):
+                            pipe.unwatch()
+                            break
+                        
+                        ttl_ms = pipe.pttl(message_key)
+                        migrated = [
+                            self._encode_message(ChatMessage(**decode_message(entry))) if stale else entry
+                            for entry, stale in zip(entries, outdated)
+                        ]
+                        
+                        pipe.multi()
+                        pipe.delete(message_key)
+                        pipe.rpush(message_key, *migrated)
+                        if ttl_ms and ttl_ms > 0:
+                            pipe.pexpire(message_key, ttl_ms)
+                        pipe.execute()
+                        
+                        stats["sessions_migrated"] += 1
+                        stats["messages_migrated"] += sum(outdated)
+                        break
+                except redis.WatchError:
+                    # Lista recebeu mensagens durante a migração; tentar novamente
+                    continue
+        
+        return stats
+    
+    def start_encoding_migration(self) -> threading.Thread:
+        """
+        Executar migrate_message_encoding em uma thread em segundo plano.
+        """
+        def _run():
+            try:
+                stats = self.migrate_message_encoding()
+                print(f"✅ Migração de codificação das mensagens concluída: {stats}")
+            except Exception as e:
+                print(f"Erro na migração de codificação das mensagens: {e}")
+        
+        thread = threading.Thread(target=_run, name="message-encoding-migration", daemon=True)
+        thread.start()
+        return thread
+    
+    def export_user_sessions(self, user_id: str, cursor: Optional[list] = None, batch_size: int = 100,
+                             chunk_size: int = 500) -> Iterator[Dict]:
+        """
+        Exportar as conversas de um usuário como registros, sessão por sessão.
+        
+        As sessões são encontradas com SCAN e as mensagens lidas em blocos de
+        `chunk_size` com LRANGE em pipeline, então a memória usada não depende
+        do volume exportado. Sessões no arquivo frio ou descarregadas para o
+        disco são lidas de lá, sem voltar ao Redis.
+        
+        Após cada lote do SCAN é emitido um registro "cursor" (estado do SCAN,
+        ver redis_connection.scan_batches); passar esse cursor retoma a exportação (sessões do lote seguinte podem se repetir,
+        identifique mensagens por session_id + seq).
+        
+        Registros: "session", "message", "cursor" e, ao final, "end".
+        """
+        self._flush_for_read(user_id=user_id)
+        activity_pattern = self._key_pattern("activity", user_id)
+        sessions = messages = 0
+        
+        for activity_keys, next_cursor in scan_batches(self._reader(binary=False), activity_pattern, batch_size, cursor):
+            # Ignorar chaves de outros usuários cujo ID começa com "{user_id}:"
+            session_ids = []
+            for activity_key in activity_keys:
+                key_user_id, session_id = self._parse_key(activity_key, "activity")
+                if key_user_id == user_id:
+                    session_ids.append(session_id)
+            
+            for record in self._export_sessions(session_ids, user_id, chunk_size):
+                if record["type"] == "session":
+                    sessions += 1
+                else:
+                    messages += 1
+                yield record
+            
+            if next_cursor is not None:
+                yield {"type": "cursor", "cursor": next_cursor}
+        
+        yield {"type": "end", "sessions": sessions, "messages": messages}
+    
+    def _export_sessions(self, session_ids: List[str], user_id: str, chunk_size: int) -> Iterator[Dict]:
+        """Registros de um lote de sessões (metadados lidos em um único round trip)."""
+        if not session_ids:
+            return
+        
+        # Em cluster as sessões estão em slots diferentes: sem MULTI entre elas
+        pipe = self._reader().pipeline(transaction=not self.cluster_mode)
+        for session_id in session_ids:
+            pipe.get(self._get_key("activity", session_id, user_id))
+            pipe.get(self._get_key("count", session_id, user_id))
+            pipe.llen(self._get_key("messages", session_id, user_id))
+        results = pipe.execute()
+        
+        for index, session_id in enumerate(session_ids):
+            last_activity, count, length = results[index * 3:index * 3 + 3]
+            if last_activity is None:
+                # Sessão expirou durante a exportação
+                continue
+            
+            message_key = self._get_key("messages", session_id, user_id)
+            offloaded = None
+            if length == 0 and self.offload_store is not None:
+                offloaded = self.offload_store.peek(message_key)
+                length = len(offloaded or [])
+            count = int(count or length)
+            first_hot_seq = count - length
+            
+            yield {
+                "type": "session",
+                "user_id": user_id,
+                "session_id": session_id,
+                "message_count": count,
+                "last_activity": last_activity.decode("utf-8")
+            }
+            
+            entries: Iterator[Tuple[int, bytes]] = iter(())
+            if self.archive is not None and first_hot_seq > 0:
+                entries = self.archive.iter_session(message_key, before_seq=first_hot_seq, batch_size=chunk_size)
+            for seq, raw in entries:
+                yield self._export_message(user_id, session_id, seq, raw)
+            
+            if offloaded:
+                hot = enumerate(reversed(offloaded))
+            else:
+                hot = self._iter_hot_entries(message_key, length, chunk_size)
+            for position, raw in hot:
+                yield self._export_message(user_id, session_id, first_hot_seq + position, raw)
+    
+    def _iter_hot_entries(self, message_key: str, length: int, chunk_size: int) -> Iterator[Tuple[int, bytes]]:
+        """
+        Percorrer as `length` mensagens mais antigas da lista em ordem cronológica.
+        
+        Os índices são negativos (a partir do final), que não mudam quando
+        novas mensagens entram no início da lista.
+        """
+        position = 0
+        while position < length:
+            pipe = self._reader(message_key).pipeline(transaction=False)
+            starts = []
+            for _ in range(EXPORT_PIPELINE_DEPTH):
+                if position >= length:
+                    break
+                end = min(position + chunk_size, length)
+                pipe.lrange(message_key, -end, -(position + 1))
+                starts.append(position)
+                position = end
+            
+            for start, chunk in zip(starts, pipe.execute()):
+                for offset, raw in enumerate(reversed(chunk)):
+                    yield start + offset, raw
+    
+    def _export_message(self, user_id: str, session_id: str, seq: int, raw: bytes) -> Dict:
+        message = decode_message(raw)
+        return {
+            "type": "message",
+            "user_id": user_id,
+            "session_id": session_id,
+            "seq": seq,
+            "sender": message["sender"],
+            "content": message["content"],
+            "timestamp": message["timestamp"].isoformat()
+        }
+    
     def get_stats(self, user_id: Optional[str] = None) -> Dict:
         """
         Obter estatísticas do sistema de memória.
         """
+        self._flush_for_read(user_id=user_id)
         try:
-            # Contar sessões ativas
-            if user_id:
-                activity_pattern = self._get_key("activity", f"{user_id}:*")
-            else:
-                activity_pattern = self._get_key("activity", "*")
-            activity_keys = self.redis_client.keys(activity_pattern)
+            # Contar sessões ativas (SCAN em todos os nós)
+            reader = self._reader(binary=False)
+            activity_keys = list(scan_keys(reader, self._key_pattern("activity", user_id)))
             total_sessions = len(activity_keys)
             
             # Contar total de mensagens
             total_messages = 0
             for activity_key in activity_keys:
-                session_id = activity_key.split(":")[-1]
-                count_key = self._get_key("count", session_id, user_id)
-                message_count = int(self.redis_client.get(count_key) or 0)
+                key_user_id, session_id = self._parse_key(activity_key, "activity")
+                count_key = self._get_key("count", session_id, key_user_id)
+                message_count = int(reader.get(count_key) or 0)
                 total_messages += message_count
             
             return {
@@ -310,6 +1351,14 @@ class RedisConversationMemory:
                 "storage_type": "redis",
                 "redis_url": self.redis_url,
                 "user_id": user_id,
+                "message_encoding": self.message_encoding,
+                "compression": compression_stats.to_dict(),
+                "hot_window": self.hot_window,
+                "archive": self.archive.get_stats() if self.archive is not None else None,
+                "read_replica": self.replica_url is not None,
+                "tail_cache": self.tail_cache.get_stats() if self.tail_cache is not None else None,
+                "offload": self.offload_store.get_stats() if self.offload_store is not None else None,
+                "write_behind": self.write_buffer.get_stats() if self.write_buffer is not None else None,
                 "last_cleanup": datetime.now().isoformat()
             }
             
@@ -2,7 +2,10 @@
 Sistema de memória Redis para o chatbot.
 """
 import os
+from .cold_storage import ColdMessageArchive, OffloadedSessionStore
 from .memory import RedisConversationMemory
+from .redis_connection import cluster_mode_from_env
+from .session_cache import SessionTailCache
 
 def create_memory() -> RedisConversationMemory:
     """
@@ -12,6 +15,32 @@ def create_memory() -> RedisConversationMemory:
     - REDIS_URL: URL do Redis (padrão: "redis://localhost:6379")
     - REDIS_DB: Número do banco Redis (padrão: 0)
     - REDIS_KEY_PREFIX: Prefixo das chaves (padrão: "sindico_pro:")
+    - REDIS_CLUSTER: "true" para Redis Cluster / MemoryDB em modo cluster (padrão: "false");
+      muda o formato das chaves, então dados existentes devem ser migrados com
+      exportação e import_sessions
+    - MESSAGE_ENCODING: Formato de gravação das mensagens, "compact" ou "json" (padrão: "compact")
+    - MESSAGE_COMPRESSION_THRESHOLD: Bytes a partir dos quais a mensagem é comprimida (padrão: 512, 0 desativa)
+    - REDIS_REPLICA_URL: Endpoint de réplicas para leituras de histórico e sessões
+      (padrão: vazio, tudo no primário; em cluster, pode ser o próprio endpoint do cluster)
+    - MEMORY_READ_YOUR_WRITES_SECONDS: Segundos após gravar em uma sessão em que as
+      leituras dela continuam no primário (padrão: 5)
+    - MEMORY_TAIL_CACHE_SESSIONS: Sessões no cache em processo das últimas mensagens
+      (padrão: 1000, 0 desativa)
+    - MEMORY_TAIL_CACHE_MESSAGES: Mensagens guardadas por sessão no cache (padrão: 20)
+    - MEMORY_TAIL_CACHE_TRUST_SECONDS: Segundos após uma confirmação em que o cache é usado
+      sem conferir a versão no Redis (padrão: 0, confere sempre)
+    - MEMORY_WRITE_BEHIND_MS: Espera máxima (ms) das mensagens no buffer de write-behind,
+      gravadas em lote com as de outras requisições (padrão: 0, grava antes de responder)
+    - MEMORY_WRITE_BEHIND_MAX_PENDING: Mensagens no buffer que disparam a gravação (padrão: 100)
+    - MEMORY_FLUSH_ON_READ: "false" para ler sem gravar antes as mensagens pendentes da
+      sessão (padrão: "true")
+    - MEMORY_HOT_WINDOW: Mensagens mantidas no Redis por sessão; as anteriores vão
+      para o arquivo frio em disco (padrão: 0, mantém tudo no Redis)
+    - MEMORY_ARCHIVE_BATCH: Mensagens excedentes acumuladas antes de arquivar (padrão: 20)
+    - MEMORY_STORAGE_PATH: Diretório do arquivo frio e das sessões descarregadas (padrão: "memory_data");
+      local a cada instância, então com várias instâncias deve ser um volume compartilhado
+    - MEMORY_OFFLOAD_IDLE_HOURS: Horas sem atividade para a sessão sair do Redis e ir
+      para o disco (padrão: 0, desativado)
     """
     
     print("🔴 Configurando memória Redis...")
@@ -19,11 +48,60 @@ def create_memory() -> RedisConversationMemory:
     redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
     redis_db = int(os.getenv("REDIS_DB", "0"))
     key_prefix = os.getenv("REDIS_KEY_PREFIX", "sindico_pro:")
+    message_encoding = os.getenv("MESSAGE_ENCODING", "compact")
+    compression_threshold = int(os.getenv("MESSAGE_COMPRESSION_THRESHOLD", "512"))
+    hot_window = int(os.getenv("MEMORY_HOT_WINDOW", "0"))
+    offload_idle_hours = float(os.getenv("MEMORY_OFFLOAD_IDLE_HOURS", "0"))
+    storage_path = os.getenv("MEMORY_STORAGE_PATH", "memory_data")
+    
+    archive = None
+    if hot_window > 0:
+        archive = ColdMessageArchive(os.path.join(storage_path, "archive"))
+        print(f"🧊 Arquivo frio ativo: {hot_window} mensagens por sessão no Redis")
+    
+    tail_cache = None
+    tail_cache_sessions = int(os.getenv("MEMORY_TAIL_CACHE_SESSIONS", "1000"))
+    if tail_cache_sessions > 0:
+        tail_cache = SessionTailCache(
+            max_sessions=tail_cache_sessions,
+            max_messages=int(os.getenv("MEMORY_TAIL_CACHE_MESSAGES", "20")),
+            trust_seconds=float(os.getenv("MEMORY_TAIL_CACHE_TRUST_SECONDS", "0"))
+        )
+    
+    write_behind_ms = float(os.getenv("MEMORY_WRITE_BEHIND_MS", "0"))
+    if write_behind_ms > 0:
+        print(f"📦 Write-behind ativo: mensagens gravadas em lote a cada {write_behind_ms:g} ms")
+    
+    offload_store = None
+    if offload_idle_hours > 0:
+        offload_store = OffloadedSessionStore(os.path.join(storage_path, "offload"))
+        print(f"💾 Sessões inativas há {offload_idle_hours:g}h serão descarregadas para o disco")
+    
+    cluster_mode = cluster_mode_from_env()
+    replica_url = os.getenv("REDIS_REPLICA_URL") or None
+    if (archive is not None or offload_store is not None) and (cluster_mode or replica_url):
+        # O armazenamento frio é local: outras instâncias não veem o que foi tirado do Redis
+        print(f"⚠️ MEMORY_HOT_WINDOW/MEMORY_OFFLOAD_IDLE_HOURS usam SQLite local em '{storage_path}': "
+              "com várias instâncias, use um volume compartilhado ou uma única instância")
     
     return RedisConversationMemory(
         redis_url=redis_url,
         db=redis_db,
-        key_prefix=key_prefix
+        key_prefix=key_prefix,
+        message_encoding=message_encoding,
+        compression_threshold=compression_threshold,
+        hot_window=hot_window,
+        archive=archive,
+        archive_batch=int(os.getenv("MEMORY_ARCHIVE_BATCH", "20")),
+        offload_store=offload_store,
+        offload_idle_seconds=int(offload_idle_hours * 60 * 60),
+        cluster_mode=cluster_mode,
+        replica_url=replica_url,
+        read_your_writes_window=float(os.getenv("MEMORY_READ_YOUR_WRITES_SECONDS", "5")),
+        tail_cache=tail_cache,
+        write_behind_interval=write_behind_ms / 1000,
+        write_behind_max_pending=int(os.getenv("MEMORY_WRITE_BEHIND_MAX_PENDING", "100")),
+        flush_on_read=os.getenv("MEMORY_FLUSH_ON_READ", "true").lower() == "true"
     )
 
 # Instância global configurada automaticamente
@@ -0,0 +1,252 @@
+"""
+Codificação das mensagens armazenadas no Redis.
+
+Formatos suportados na leitura:
+- JSON: {"content": ..., "sender": ..., "timestamp": "<ISO 8601>"}, o mesmo
+  formato de cada mensagem nas respostas da API; gravado compacto (sem
+  espaços), é copiado para o corpo do histórico sem ser decodificado
+- Compacto v1: byte de versão 0x01 + msgpack {"c": conteúdo, "s": remetente,
+  "t": epoch em milissegundos}, com remetente abreviado ("u"/"a")
+- Comprimido v2: byte de versão 0x02 + ID do dicionário + deflate (zlib) de
+  uma mensagem em qualquer um dos formatos acima, usando um dicionário
+  compartilhado com o vocabulário condominial
+"""
+import json
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, Union
+
+import msgpack
+
+from .fast_json import dumps
+
+ENCODING_JSON = "json"
+ENCODING_COMPACT = "compact"
+
+COMPACT_V1 = 0x01
+COMPRESSED_V2 = 0x02
+
+# Dicionário compartilhado para o deflate: trechos frequentes das respostas do
+# assistente. Os mais comuns ficam no final, onde o deflate os alcança com
+# distâncias menores. Nunca altere um dicionário publicado; crie um novo ID.
+DICTIONARY_V1 = (
+    "Recomendo consultar um advogado especializado em direito condominial. "
+    "Lei do Inquilinato (Lei nº 8.245/1991), Lei nº 4.591/1964, Código de Defesa do Consumidor, "
+    "NBR 5674 manutenção predial, NBR 16280 reforma, AVCB do Corpo de Bombeiros, seguro obrigatório, "
+    "FGTS, INSS, eSocial, RAIS, DIRF, CNPJ do condomínio, imposto de renda, folha de pagamento, "
+    "zelador, porteiro, funcionários, empresa terceirizada, administradora, prestação de serviços, "
+    "fundo de reserva, taxa condominial, cota condominial, rateio das despesas, inadimplência, "
+    "multa de 2%, juros de mora de 1% ao mês, cobrança judicial, protesto, boleto, "
+    "despesas ordinárias e extraordinárias, previsão orçamentária, prestação de contas, balancete, "
+    "conselho fiscal, subsíndico, mandato do síndico, destituição do síndico, eleição, procuração, "
+    "edital de convocação, ata da assembleia, quórum de dois terços, maioria simples, maioria absoluta, "
+    "assembleia geral ordinária, assembleia geral extraordinária, deliberação, votação, "
+    "áreas comuns, unidades autônomas, fração ideal, garagem, vagas, salão de festas, piscina, "
+    "obras, reformas, benfeitorias necessárias, úteis e voluptuárias, barulho, animais de estimação, "
+    "direitos e deveres dos condôminos, moradores, proprietários, inquilinos, locatários, "
+    "De acordo com o Código Civil (Lei nº 10.406/2002), artigos 1.331 a 1.358, "
+    "a convenção do condomínio e o regimento interno, o síndico é o representante legal do condomínio "
+    "e deve prestar contas à assembleia. É importante verificar o que dispõe a convenção. "
+    "Espero ter ajudado! Se tiver mais dúvidas, estou à disposição. "
+    "Olá! Ótima pergunta. Sim, Não, Além disso, Por isso, Portanto, Em resumo, "
+    "condomínio, condôminos, síndico, assembleia, convenção, regimento interno, "
+).encode("utf-8")
+
+DICTIONARIES = {1: DICTIONARY_V1}
+CURRENT_DICTIONARY_ID = 1
+
+
+class _CompressionStats:
+    """Estatísticas de compressão do processo (taxa e custo de CPU)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.compressed_messages = 0
+        self.skipped_messages = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compress_seconds = 0.0
+        self.decompressed_messages = 0
+        self.decompress_seconds = 0.0
+
+    def record_compress(self, bytes_in: int, bytes_out: int, seconds: float, used: bool):
+        with self._lock:
+            if used:
+                self.compressed_messages += 1
+                self.bytes_in += bytes_in
+                self.bytes_out += bytes_out
+            else:
+                self.skipped_messages += 1
+            self.compress_seconds += seconds
+
+    def record_decompress(self, seconds: float):
+        with self._lock:
+            self.decompressed_messages += 1
+            self.decompress_seconds += seconds
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "compressed_messages": self.compressed_messages,
+                "skipped_messages": self.skipped_messages,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "compression_ratio": round(self.bytes_in / self.bytes_out, 3) if self.bytes_out else None,
+                "compress_cpu_seconds": round(self.compress_seconds, 6),
+                "decompressed_messages": self.decompressed_messages,
+                "decompress_cpu_seconds": round(self.decompress_seconds, 6)
+            }
+
+
+compression_stats = _CompressionStats()
+
+_SENDER_CODES = {"user": "u", "assistant": "a"}
+_SENDER_NAMES = {code: name for name, code in _SENDER_CODES.items()}
+
+
+def _to_epoch_ms(timestamp: datetime) -> int:
+    return int(round(timestamp.timestamp() * 1000))
+
+
+def _from_epoch_ms(value: int) -> datetime:
+    return datetime.fromtimestamp(value / 1000)
+
+
+def compress_payload(raw: bytes, dictionary_id: int = CURRENT_DICTIONARY_ID) -> bytes:
+    """
+    Comprimir uma mensagem já codificada.
+    Retorna a mensagem original se a compressão não reduzir o tamanho.
+    """
+    start = time.process_time()
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS,
+                                  zdict=DICTIONARIES[dictionary_id])
+    compressed = bytes((COMPRESSED_V2, dictionary_id)) + compressor.compress(raw) + compressor.flush()
+    used = len(compressed) < len(raw)
+    compression_stats.record_compress(len(raw), len(compressed), time.process_time() - start, used)
+    return compressed if used else raw
+
+
+def decompress_payload(raw: bytes) -> bytes:
+    """Descomprimir uma mensagem no formato v2, retornando a mensagem interna."""
+    start = time.process_time()
+    dictionary = DICTIONARIES.get(raw[1])
+    if dictionary is None:
+        raise ValueError(f"Dicionário de compressão desconhecido: {raw[1]}")
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS, zdict=dictionary)
+    inner = decompressor.decompress(raw[2:]) + decompressor.flush()
+    compression_stats.record_decompress(time.process_time() - start)
+    return inner
+
+
+def encode_message(content: str, sender: str, timestamp: datetime,
+                   encoding: str = ENCODING_COMPACT, compression_threshold: int = 0) -> bytes:
+    """
+    Codificar uma mensagem para gravação no Redis.
+    
+    Mensagens com `compression_threshold` bytes ou mais são comprimidas
+    (0 desativa a compressão).
+    """
+    raw = _encode(content, sender, timestamp, encoding)
+    if compression_threshold and len(raw) >= compression_threshold:
+        return compress_payload(raw)
+    return raw
+
+
+def _encode(content: str, sender: str, timestamp: datetime, encoding: str) -> bytes:
+    if encoding == ENCODING_JSON:
+        return wire_message(content, sender, timestamp.isoformat())
+
+    if encoding != ENCODING_COMPACT:
+        raise ValueError(f"Codificação de mensagem desconhecida: {encoding}")
+
+    payload = msgpack.packb({
+        "c": content,
+        "s": _SENDER_CODES.get(sender, sender),
+        "t": _to_epoch_ms(timestamp)
+    }, use_bin_type=True)
+    return bytes((COMPACT_V1,)) + payload
+
+
+def decode_message(raw: Union[bytes, str]) -> Dict:
+    """
+    Decodificar uma mensagem gravada em qualquer formato suportado.
+
+    Returns:
+        Dicionário com "content", "sender" e "timestamp" (datetime)
+    """
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+
+    if is_legacy_json(raw):
+        data = json.loads(raw)
+        return {
+            "content": data["content"],
+            "sender": data["sender"],
+            "timestamp": datetime.fromisoformat(data["timestamp"])
+        }
+
+    version = raw[0]
+    if version == COMPRESSED_V2:
+        return decode_message(decompress_payload(raw))
+
+    if version == COMPACT_V1:
+        data = msgpack.unpackb(raw[1:], raw=False)
+        return {
+            "content": data["c"],
+            "sender": _SENDER_NAMES.get(data["s"], data["s"]),
+            "timestamp": _from_epoch_ms(data["t"])
+        }
+
+    raise ValueError(f"Versão de mensagem desconhecida: {version}")
+
+
+def wire_message(content: str, sender: str, timestamp: str) -> bytes:
+    """Mensagem no formato das respostas da API (JSON compacto)."""
+    return dumps({"content": content, "sender": sender, "timestamp": timestamp})
+
+
+def to_wire(raw: Union[bytes, str]) -> bytes:
+    """
+    Converter uma mensagem gravada em qualquer formato para o JSON das
+    respostas da API, sem criar objetos intermediários. Mensagens gravadas
+    em JSON são devolvidas como estão.
+    """
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+
+    if is_legacy_json(raw):
+        return raw
+
+    version = raw[0]
+    if version == COMPRESSED_V2:
+        return to_wire(decompress_payload(raw))
+
+    if version == COMPACT_V1:
+        data = msgpack.unpackb(raw[1:], raw=False)
+        return wire_message(
+            data["c"],
+            _SENDER_NAMES.get(data["s"], data["s"]),
+            _from_epoch_ms(data["t"]).isoformat()
+        )
+
+    raise ValueError(f"Versão de mensagem desconhecida: {version}")
+
+
+def stored_encoding(raw: bytes) -> str:
+    """
+    Codificação de uma mensagem gravada (ENCODING_JSON ou ENCODING_COMPACT).
+    Nas comprimidas, a da mensagem interna, lida sem descomprimir o resto.
+    """
+    if raw[:1] == bytes((COMPRESSED_V2,)):
+        dictionary = DICTIONARIES.get(raw[1])
+        if dictionary is None:
+            raise ValueError(f"Dicionário de compressão desconhecido: {raw[1]}")
+        raw = zlib.decompressobj(-zlib.MAX_WBITS, zdict=dictionary).decompress(raw[2:], 1)
+    return ENCODING_JSON if is_legacy_json(raw) else ENCODING_COMPACT
+
+
+def is_legacy_json(raw: bytes) -> bool:
+    """Verificar se a mensagem está no formato JSON legado."""
+    return raw[:1] == b"{"
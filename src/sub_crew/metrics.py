@@ -0,0 +1,66 @@
+"""
+Métricas simples em memória do processo (contadores, gauges e tempos).
+Expostas pelo endpoint GET /metrics da API.
+"""
+import threading
+from collections import defaultdict
+from typing import Dict
+
+
+def _metric_key(name: str, labels: Dict) -> str:
+    """Gerar chave da métrica no formato nome{label=valor,...}."""
+    if not labels:
+        return name
+    label_str = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{label_str}}}"
+
+
+class Metrics:
+    """
+    Registro de métricas thread-safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._timings = {}
+
+    def incr(self, name: str, value: float = 1, **labels):
+        """Incrementar um contador."""
+        key = _metric_key(name, labels)
+        with self._lock:
+            self._counters[key] += value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """Definir o valor atual de um gauge."""
+        key = _metric_key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """Registrar uma observação (ex.: latência em segundos)."""
+        key = _metric_key(name, labels)
+        with self._lock:
+            timing = self._timings.get(key)
+            if timing is None:
+                timing = self._timings[key] = {"count": 0, "sum": 0.0, "max": 0.0}
+            timing["count"] += 1
+            timing["sum"] += value
+            timing["max"] = max(timing["max"], value)
+
+    def snapshot(self) -> Dict:
+        """Obter cópia de todas as métricas."""
+        with self._lock:
+            timings = {}
+            for key, timing in self._timings.items():
+                timings[key] = dict(timing, avg=timing["sum"] / timing["count"])
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings": timings
+            }
+
+
+# Instância global
+metrics = Metrics()
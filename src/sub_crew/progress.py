@@ -0,0 +1,195 @@
+"""
+Progresso de uma execução do crew (etapas, delegações e ferramentas).
+
+Os callbacks de passo e de tarefa do CrewAI (report_step e report_task)
+repassam o que o crew está fazendo ao ProgressTracker ativo na thread do
+crew, que converte em eventos tipados para o cliente ("Analisando pergunta",
+"Pesquisando", "Redigindo resposta") e registra a duração de cada etapa nas
+métricas. Sem tracker ativo os callbacks não fazem nada.
+"""
+import asyncio
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from sub_crew.metrics import metrics
+
+# Tarefas do crew, na ordem de execução, e o rótulo mostrado ao usuário
+TASK_STAGES = {
+    "question_in_context": "Analisando pergunta",
+    "question_definition": "Definindo como responder",
+    "contextual_response": "Redigindo resposta"
+}
+
+TOOL_LABEL = "Pesquisando"
+DELEGATION_LABEL = "Consultando especialista"
+
+# Ferramentas que o gerente do crew hierárquico usa para acionar os agentes
+DELEGATION_TOOLS = ("delegate work to coworker", "ask question to coworker")
+
+
+def _coworker(tool_input: Any) -> Optional[str]:
+    """Agente acionado por uma delegação (o argumento da ferramenta é JSON)."""
+    if isinstance(tool_input, str):
+        try:
+            tool_input = json.loads(tool_input)
+        except ValueError:
+            return None
+    if isinstance(tool_input, dict):
+        coworker = tool_input.get("coworker")
+        return str(coworker) if coworker else None
+    return None
+
+
+class ProgressTracker:
+    """
+    Acompanha uma execução do crew e emite um evento por mudança de etapa,
+    delegação ou uso de ferramenta.
+
+    Os eventos são dicts com "type" (task_started, task_completed,
+    delegation ou tool_used), "stage", "label" e "elapsed" (segundos desde o
+    início da execução). `emit` é chamado na thread do crew.
+    """
+
+    def __init__(self, emit: Optional[Callable[[Dict], None]] = None,
+                 stages: Optional[List[str]] = None):
+        """
+        Inicializar tracker.
+
+        Args:
+            emit: Recebe cada evento (None para registrar apenas as métricas)
+            stages: Tarefas do crew na ordem de execução
+        """
+        self._emit = emit
+        self.stages = list(stages or TASK_STAGES)
+        self._lock = threading.Lock()
+        self._index = -1
+        self._started = 0.0
+        self._stage_started = 0.0
+
+    @property
+    def stage(self) -> Optional[str]:
+        """Tarefa em execução (None antes do início ou depois da última)."""
+        if 0 <= self._index < len(self.stages):
+            return self.stages[self._index]
+        return None
+
+    def _event(self, event_type: str, label: str, **fields) -> Dict:
+        event = {
+            "type": event_type,
+            "stage": self.stage,
+            "label": label,
+            "elapsed": round(time.monotonic() - self._started, 3)
+        }
+        event.update(fields)
+        if self._emit is not None:
+            self._emit(event)
+        return event
+
+    def _start_stage(self, index: int):
+        self._index = index
+        self._stage_started = time.monotonic()
+        if self.stage is not None:
+            self._event("task_started", TASK_STAGES.get(self.stage, self.stage))
+
+    def start(self):
+        """Marcar o início da execução (primeira tarefa)."""
+        with self._lock:
+            self._started = time.monotonic()
+            self._start_stage(0)
+
+    def on_step(self, step: Any):
+        """Passo de um agente (AgentAction com a ferramenta escolhida ou AgentFinish)."""
+        tool = getattr(step, "tool", None)
+        if not tool:
+            return
+        with self._lock:
+            if tool.strip().casefold() in DELEGATION_TOOLS:
+                metrics.incr("crew.delegations", stage=self.stage or "unknown")
+                self._event("delegation", DELEGATION_LABEL,
+                            coworker=_coworker(getattr(step, "tool_input", None)))
+            else:
+                metrics.incr("crew.tool_calls", tool=tool)
+                self._event("tool_used", TOOL_LABEL, tool=tool)
+
+    def on_task(self, output: Any):
+        """Tarefa concluída (TaskOutput); a próxima tarefa começa em seguida."""
+        with self._lock:
+            name = getattr(output, "name", None)
+            if name in self.stages:
+                self._index = self.stages.index(name)
+            stage = self.stage or "unknown"
+            duration = time.monotonic() - self._stage_started
+            metrics.observe("crew.task_seconds", duration, task=stage)
+            self._event("task_completed", TASK_STAGES.get(stage, stage), duration=round(duration, 3))
+            self._start_stage(self._index + 1)
+
+    def run(self, fn: Callable, *args, **kwargs):
+        """Executar `fn` (kickoff do crew) com este tracker ativo."""
+        with tracking(self):
+            self.start()
+            result = fn(*args, **kwargs)
+        metrics.observe("crew.run_seconds", time.monotonic() - self._started)
+        return result
+
+
+_current_tracker: contextvars.ContextVar[Optional[ProgressTracker]] = contextvars.ContextVar(
+    "current_progress_tracker", default=None
+)
+
+
+@contextmanager
+def tracking(tracker: ProgressTracker):
+    """Tornar `tracker` o tracker ativo dentro do bloco."""
+    token = _current_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current_tracker.reset(token)
+
+
+def report_step(step: Any):
+    """step_callback dos agentes."""
+    tracker = _current_tracker.get()
+    if tracker is not None:
+        tracker.on_step(step)
+
+
+def report_task(output: Any):
+    """task_callback do crew."""
+    tracker = _current_tracker.get()
+    if tracker is not None:
+        tracker.on_task(output)
+
+
+async def events_until(task: asyncio.Future, events: Optional[asyncio.Queue],
+                       interval: Optional[float]) -> AsyncIterator[Optional[Dict]]:
+    """
+    Entregar os eventos colocados em `events` até `task` terminar, inclusive
+    os que ainda estiverem na fila nesse momento. Produz None a cada
+    `interval` segundos sem eventos (para heartbeats). O resultado continua
+    disponível em task.result().
+    """
+    while True:
+        if events is None:
+            done, _ = await asyncio.wait({task}, timeout=interval)
+            if done:
+                return
+            yield None
+            continue
+
+        getter = asyncio.ensure_future(events.get())
+        done, _ = await asyncio.wait({task, getter}, timeout=interval,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if getter in done:
+            yield getter.result()
+            continue
+        getter.cancel()
+        if task in done:
+            while not events.empty():
+                yield events.get_nowait()
+            return
+        yield None
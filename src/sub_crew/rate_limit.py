@@ -0,0 +1,281 @@
+"""
+Limite de requisições por usuário com Redis.
+Token bucket para a taxa de perguntas e limite de execuções simultâneas
+do crew por usuário, ambos atômicos (scripts Lua) e válidos entre réplicas.
+"""
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import redis
+
+from sub_crew.metrics import metrics
+
+# Token bucket: KEYS[1] = hash do bucket
+# ARGV: capacidade, tokens por ms, custo, ttl (ms)
+# Retorna {permitido, tokens restantes, espera em ms}
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1])
+local ts = tonumber(bucket[2])
+if tokens == nil then
+  tokens = capacity
+  ts = now
+end
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+else
+  wait = math.ceil((cost - tokens) / rate)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], ttl)
+return {allowed, math.floor(tokens), wait}
+"""
+
+# Limite de concorrência: KEYS[1] = sorted set de leases (score = expiração em ms)
+# ARGV: máximo, lease_id, duração do lease (ms)
+# Retorna {permitido, execuções ativas}
+CONCURRENCY_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local lease_ttl = tonumber(ARGV[3])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+local active = redis.call('ZCARD', KEYS[1])
+if active >= limit then
+  return {0, active}
+end
+
+redis.call('ZADD', KEYS[1], now + lease_ttl, ARGV[2])
+redis.call('PEXPIRE', KEYS[1], lease_ttl)
+return {1, active + 1}
+"""
+
+DEFAULT_PLANS = {
+    "free": {"requests_per_minute": 6, "burst": 3, "max_concurrent": 1},
+    "pro": {"requests_per_minute": 30, "burst": 10, "max_concurrent": 3},
+    "internal": {"requests_per_minute": 600, "burst": 100, "max_concurrent": 20},
+}
+
+
+@dataclass
+class RateLimitPlan:
+    name: str
+    requests_per_minute: float
+    burst: int
+    max_concurrent: int
+
+    @classmethod
+    def from_dict(cls, name: str, data: dict):
+        return cls(
+            name=name,
+            requests_per_minute=float(data["requests_per_minute"]),
+            burst=int(data["burst"]),
+            max_concurrent=int(data["max_concurrent"])
+        )
+
+
+class RateLimitExceeded(Exception):
+    """Limite de requisições ou de execuções simultâneas atingido."""
+
+    def __init__(self, message: str, reason: str, retry_after: int):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RedisRateLimiter:
+    """
+    Limitador por usuário com token bucket e leases de concorrência no Redis.
+
+    O plano de cada usuário fica no hash `<prefixo>ratelimit:user_plans`
+    (user_id -> nome do plano); usuários sem plano usam o plano padrão.
+    """
+
+    def __init__(self,
+                 redis_client: redis.Redis,
+                 key_prefix: str = "sindico_pro:",
+                 plans: Optional[Dict[str, RateLimitPlan]] = None,
+                 default_plan: str = "free",
+                 lease_ttl: int = 15 * 60):
+        """
+        Inicializar limitador.
+
+        Args:
+            redis_client: Cliente Redis
+            key_prefix: Prefixo para as chaves Redis
+            plans: Planos disponíveis por nome
+            default_plan: Plano usado quando o usuário não tem plano definido
+            lease_ttl: Duração máxima (segundos) de um lease de execução,
+                para liberar vagas de processos que morreram
+        """
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.plans = plans or {
+            name: RateLimitPlan.from_dict(name, data) for name, data in DEFAULT_PLANS.items()
+        }
+        if default_plan not in self.plans:
+            raise ValueError(f"Plano padrão desconhecido: {default_plan}")
+        self.default_plan = default_plan
+        self.lease_ttl_ms = lease_ttl * 1000
+
+        self._token_bucket = self.redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+        self._concurrency = self.redis_client.register_script(CONCURRENCY_SCRIPT)
+
+    def _get_key(self, key_type: str, user_key: str) -> str:
+        return f"{self.key_prefix}ratelimit:{key_type}:{user_key}"
+
+    def get_plan(self, user_key: str) -> RateLimitPlan:
+        """Obter o plano do usuário."""
+        plan_name = self.redis_client.hget(f"{self.key_prefix}ratelimit:user_plans", user_key)
+        return self.plans.get(plan_name or self.default_plan, self.plans[self.default_plan])
+
+    def set_plan(self, user_key: str, plan_name: str):
+        """Associar um usuário a um plano."""
+        if plan_name not in self.plans:
+            raise ValueError(f"Plano desconhecido: {plan_name}")
+        self.redis_client.hset(f"{self.key_prefix}ratelimit:user_plans", user_key, plan_name)
+
+    def check_rate(self, user_key: str, plan: Optional[RateLimitPlan] = None):
+        """
+        Consumir um token do bucket do usuário.
+
+        Raises:
+            RateLimitExceeded: Se não houver tokens disponíveis
+        """
+        plan = plan or self.get_plan(user_key)
+        rate_per_ms = plan.requests_per_minute / 60000.0
+        # Bucket expira quando estaria cheio novamente
+        ttl_ms = int(plan.burst / rate_per_ms) + 1000
+
+        allowed, remaining, wait_ms = self._token_bucket(
+            keys=[self._get_key("bucket", user_key)],
+            args=[plan.burst, rate_per_ms, 1, ttl_ms]
+        )
+        if not allowed:
+            metrics.incr("rate_limit.rejected", reason="rate", plan=plan.name)
+            raise RateLimitExceeded(
+                "Muitas requisições. Aguarde antes de enviar outra pergunta.",
+                reason="rate",
+                retry_after=max(1, -(-int(wait_ms) // 1000))
+            )
+        metrics.incr("rate_limit.allowed", plan=plan.name)
+
+    def acquire(self, user_key: str, check_rate: bool = True) -> str:
+        """
+        Reservar uma vaga de execução para o usuário e verificar a taxa.
+
+        A vaga é verificada antes: uma requisição recusada por concorrência
+        não consome token do bucket.
+
+        Args:
+            user_key: Identificação do usuário
+            check_rate: Se False, apenas reserva a vaga (a taxa já foi
+                verificada, ex.: uma vez por lote de perguntas)
+
+        Returns:
+            ID do lease, a ser devolvido com release()
+
+        Raises:
+            RateLimitExceeded: Se a taxa ou o limite de concorrência forem excedidos
+        """
+        plan = self.get_plan(user_key)
+        lease_id = str(uuid.uuid4())
+        allowed, _ = self._concurrency(
+            keys=[self._get_key("running", user_key)],
+            args=[plan.max_concurrent, lease_id, self.lease_ttl_ms]
+        )
+        if not allowed:
+            metrics.incr("rate_limit.rejected", reason="concurrency", plan=plan.name)
+            raise RateLimitExceeded(
+                f"Limite de {plan.max_concurrent} pergunta(s) simultânea(s) atingido.",
+                reason="concurrency",
+                retry_after=1
+            )
+        if check_rate:
+            try:
+                self.check_rate(user_key, plan)
+            except RateLimitExceeded:
+                self.release(user_key, lease_id)
+                raise
+        metrics.incr("rate_limit.leases", plan=plan.name)
+        return lease_id
+
+    def release(self, user_key: str, lease_id: str):
+        """Liberar uma vaga de execução."""
+        try:
+            self.redis_client.zrem(self._get_key("running", user_key), lease_id)
+        except Exception as e:
+            # O lease expira sozinho; apenas registrar
+            print(f"Erro ao liberar lease de execução no Redis: {e}")
+
+    @contextmanager
+    def limit(self, user_key: str):
+        """Context manager que reserva e libera uma vaga de execução."""
+        lease_id = self.acquire(user_key)
+        try:
+            yield lease_id
+        finally:
+            self.release(user_key, lease_id)
+
+
+def client_address(peer: Optional[str], forwarded_for: Optional[str], trusted_proxies: int = 0) -> Optional[str]:
+    """
+    Endereço do cliente para o limite de requisições anônimas.
+
+    Com `trusted_proxies` proxies confiáveis na frente da API (ex.: 1 para o
+    load balancer), o cliente é o endereço que o proxy mais externo acrescentou
+    ao X-Forwarded-For; entradas anteriores podem ter sido forjadas pelo
+    cliente e são ignoradas. Sem proxies confiáveis, o cabeçalho é ignorado.
+    """
+    if trusted_proxies <= 0 or not forwarded_for:
+        return peer
+    chain = [address.strip() for address in forwarded_for.split(",") if address.strip()]
+    chain.append(peer or "unknown")
+    return chain[-(trusted_proxies + 1)] if len(chain) > trusted_proxies else chain[0]
+
+
+def create_rate_limiter(redis_client: redis.Redis, key_prefix: str) -> Optional[RedisRateLimiter]:
+    """
+    Criar limitador de requisições.
+
+    Variáveis de ambiente:
+    - RATE_LIMIT_ENABLED: "true" ativa o limitador (padrão: "false")
+    - RATE_LIMIT_PLANS: JSON com os planos, ex.:
+      {"free": {"requests_per_minute": 6, "burst": 3, "max_concurrent": 1}}
+    - RATE_LIMIT_DEFAULT_PLAN: Plano para usuários sem plano definido (padrão: "free")
+    - RATE_LIMIT_LEASE_TTL: Duração máxima de uma execução em segundos (padrão: 900)
+    """
+    if os.getenv("RATE_LIMIT_ENABLED", "false").lower() not in ("true", "1", "yes"):
+        return None
+
+    plans_data = json.loads(os.getenv("RATE_LIMIT_PLANS") or json.dumps(DEFAULT_PLANS))
+    plans = {name: RateLimitPlan.from_dict(name, data) for name, data in plans_data.items()}
+
+    return RedisRateLimiter(
+        redis_client,
+        key_prefix=key_prefix,
+        plans=plans,
+        default_plan=os.getenv("RATE_LIMIT_DEFAULT_PLAN", "free"),
+        lease_ttl=int(os.getenv("RATE_LIMIT_LEASE_TTL", "900"))
+    )
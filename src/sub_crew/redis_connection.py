@@ -0,0 +1,89 @@
+"""
+Conexões com o Redis em modo standalone ou Redis Cluster (MemoryDB em modo
+cluster) e varredura de chaves com SCAN em todos os nós.
+"""
+import os
+from typing import Iterator, List, Optional, Tuple
+
+import redis
+from redis.cluster import RedisCluster
+
+
+def cluster_mode_from_env() -> bool:
+    """REDIS_CLUSTER: "true" para endpoints de cluster (padrão: "false")."""
+    return os.getenv("REDIS_CLUSTER", "false").lower() in ("true", "1", "yes")
+
+
+def create_redis_client(redis_url: str, db: int = 0, decode_responses: bool = True, cluster: bool = False,
+                        read_from_replicas: bool = False):
+    """
+    Criar cliente Redis.
+
+    Args:
+        redis_url: URL de conexão (em cluster, qualquer nó ou o endpoint de configuração)
+        db: Número do banco (ignorado em cluster, que só tem o banco 0)
+        decode_responses: Decodificar respostas como texto
+        cluster: Usar o cliente de cluster (roteamento por slot)
+        read_from_replicas: Em cluster, enviar leituras às réplicas de cada shard
+    """
+    if cluster:
+        return RedisCluster.from_url(redis_url, decode_responses=decode_responses,
+                                     read_from_replicas=read_from_replicas)
+    return redis.from_url(redis_url, db=db, decode_responses=decode_responses)
+
+
+def is_cluster_client(client) -> bool:
+    """Verificar se o cliente está conectado a um Redis Cluster."""
+    return isinstance(client, RedisCluster)
+
+
+def scan_batches(client, match: str, count: int = 100,
+                 start: Optional[list] = None) -> Iterator[Tuple[List, Optional[list]]]:
+    """
+    Percorrer as chaves que casam com `match` em lotes de SCAN.
+    Em cluster, os nós primários são varridos um de cada vez.
+
+    Cada lote vem com o estado [nó, cursor] que retoma a varredura a partir
+    do lote seguinte (None após o último lote).
+
+    Args:
+        client: Cliente standalone ou de cluster
+        match: Padrão das chaves
+        count: Sugestão de chaves por lote
+        start: Estado recebido em um lote anterior
+
+    Raises:
+        ValueError: Se o estado aponta para um nó que não existe mais
+    """
+    if is_cluster_client(client):
+        nodes = sorted(node.name for node in client.get_primaries())
+    else:
+        nodes = [None]
+
+    node_index, cursor = 0, 0
+    if start:
+        node_name, cursor = start
+        if node_name not in nodes:
+            raise ValueError(f"Nó desconhecido no estado do SCAN: {node_name}")
+        node_index = nodes.index(node_name)
+
+    while node_index < len(nodes):
+        node_name = nodes[node_index]
+        if node_name is None:
+            cursor, keys = client.scan(cursor=cursor, match=match, count=count)
+        else:
+            cursors, keys = client.scan(
+                cursor=cursor, match=match, count=count,
+                target_nodes=client.get_node(node_name=node_name)
+            )
+            cursor = cursors[node_name]
+
+        if cursor == 0:
+            node_index += 1
+        yield keys, ([nodes[node_index], cursor] if node_index < len(nodes) else None)
+
+
+def scan_keys(client, match: str, count: int = 100) -> Iterator:
+    """Percorrer todas as chaves que casam com `match` (todos os nós em cluster)."""
+    for keys, _ in scan_batches(client, match, count):
+        yield from keys
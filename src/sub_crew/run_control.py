@@ -0,0 +1,188 @@
+"""
+Controle de uma execução do crew iniciada por uma requisição.
+
+A API cria um RunControl por execução e o torna ativo na thread do crew
+com run_in_scope(). As chamadas ao LLM, a fila do governador e as
+ferramentas consultam o controle ativo e interrompem a execução com
+RunCancelled quando ele é cancelado (ex.: cliente desconectou) ou com
+RunTimeout quando o prazo da requisição se esgota.
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+
+class RunCancelled(Exception):
+    """A execução do crew foi cancelada (ex.: cliente desconectou)."""
+
+
+class RunTimeout(RunCancelled):
+    """O prazo da execução se esgotou."""
+
+
+class RunControl:
+    """Sinal de cancelamento e prazo compartilhados entre a API e a thread do crew."""
+
+    def __init__(self, timeout: Optional[float] = None, parent: Optional["RunControl"] = None):
+        """
+        Inicializar controle.
+
+        Args:
+            timeout: Prazo (segundos a partir de agora); None para sem prazo
+            parent: Controle do qual este herda cancelamento e prazo
+                (ex.: o lote de uma pergunta do /chat/batch)
+        """
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._children = []
+        self.reason: Optional[str] = None
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+
+        if parent is not None:
+            if parent.deadline is not None and (self.deadline is None or parent.deadline < self.deadline):
+                self.deadline = parent.deadline
+                self.timeout = parent.timeout
+            with parent._lock:
+                parent._children.append(self)
+            if parent.cancelled:
+                self.cancel(parent.reason)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def remaining(self) -> Optional[float]:
+        """Segundos até o prazo (None se não houver prazo)."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def cancel(self, reason: str) -> bool:
+        """
+        Cancelar a execução (e as execuções filhas).
+
+        Returns:
+            True se este foi o primeiro cancelamento
+        """
+        with self._lock:
+            if self._cancelled.is_set():
+                return False
+            self.reason = reason
+            self._cancelled.set()
+            children = list(self._children)
+        for child in children:
+            child.cancel(reason)
+        return True
+
+    def check(self):
+        """
+        Raises:
+            RunCancelled: Se a execução foi cancelada
+            RunTimeout: Se o prazo se esgotou
+        """
+        if self._cancelled.is_set():
+            raise RunCancelled(f"Execução cancelada ({self.reason})")
+        if self.expired:
+            raise RunTimeout(f"Prazo de {self.timeout:g}s da execução esgotado")
+
+    def sleep(self, seconds: float):
+        """
+        Esperar `seconds`, interrompendo se a execução for cancelada ou o prazo acabar.
+
+        Raises:
+            RunCancelled: Se a execução foi cancelada durante a espera
+            RunTimeout: Se o prazo se esgotou durante a espera
+        """
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, remaining)
+        self._cancelled.wait(seconds)
+        self.check()
+
+
+_current_run: contextvars.ContextVar[Optional[RunControl]] = contextvars.ContextVar("current_run", default=None)
+
+
+def current_run() -> Optional[RunControl]:
+    """Controle da execução ativa no contexto atual (None fora de uma execução)."""
+    return _current_run.get()
+
+
+def check_cancelled():
+    """Interromper a execução ativa se ela foi cancelada."""
+    control = _current_run.get()
+    if control is not None:
+        control.check()
+
+
+def sleep(seconds: float):
+    """time.sleep que termina antes se a execução ativa for cancelada."""
+    control = _current_run.get()
+    if control is None:
+        time.sleep(seconds)
+    else:
+        control.sleep(seconds)
+
+
+@contextmanager
+def run_scope(control: RunControl):
+    """Tornar `control` a execução ativa dentro do bloco."""
+    token = _current_run.set(control)
+    try:
+        yield control
+    finally:
+        _current_run.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Segundos até o prazo da execução ativa (None sem execução ou sem prazo)."""
+    control = _current_run.get()
+    return control.remaining() if control is not None else None
+
+
+# Intervalo máximo entre verificações do controle enquanto uma chamada está em andamento
+CANCEL_POLL_SECONDS = 0.2
+
+_call_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="controlled-call")
+
+
+def call_controlled(fn: Callable, *args, **kwargs):
+    """
+    Executar `fn` (ex.: uma ferramenta) respeitando a execução ativa.
+
+    Sem execução ativa, `fn` roda na própria thread. Com ela, roda em outra
+    thread e é abandonada (o resultado é descartado) se a execução for
+    cancelada ou o prazo acabar antes de `fn` terminar.
+
+    Raises:
+        RunCancelled: Se a execução foi cancelada
+        RunTimeout: Se o prazo se esgotou
+    """
+    control = _current_run.get()
+    if control is None:
+        return fn(*args, **kwargs)
+
+    control.check()
+    future = _call_executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    while True:
+        remaining = control.remaining()
+        try:
+            return future.result(timeout=CANCEL_POLL_SECONDS if remaining is None
+                                 else min(CANCEL_POLL_SECONDS, remaining))
+        except FutureTimeout:
+            control.check()
+
+
+def run_in_scope(control: RunControl, fn: Callable, *args, **kwargs):
+    """Executar `fn` com `control` ativo (para uso com asyncio.to_thread)."""
+    with run_scope(control):
+        control.check()
+        return fn(*args, **kwargs)
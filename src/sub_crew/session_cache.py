@@ -0,0 +1,136 @@
+"""
+Cache em processo das últimas mensagens de cada sessão (LRU limitado).
+
+Cada entrada guarda a versão da sessão no Redis (contador incrementado a cada
+gravação). As gravações feitas por este processo retornam a nova versão e
+atualizam a entrada sem ler o Redis; se a versão pular, outra instância
+gravou na sessão e a entrada é descartada.
+
+Antes de usar uma entrada, a versão é conferida com um GET no Redis. Com
+`trust_seconds` maior que zero, entradas confirmadas há menos que isso são
+usadas sem a conferência: uma gravação de outra instância nesse intervalo
+não é vista até a próxima gravação ou conferência deste processo.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Deque, List, Optional
+
+from sub_crew.metrics import metrics
+
+@dataclass
+class CachedTail:
+    version: int
+    messages: Deque
+    # True se a entrada contém todas as mensagens da sessão
+    complete: bool
+    # Momento da última confirmação por gravação ou consulta da versão
+    confirmed_at: float = 0.0
+
+    def covers(self, limit: int) -> bool:
+        return self.complete or len(self.messages) >= limit
+
+
+class SessionTailCache:
+    """
+    LRU das últimas `max_messages` mensagens de até `max_sessions` sessões.
+    """
+
+    def __init__(self, max_sessions: int = 1000, max_messages: int = 20,
+                 trust_seconds: float = 0.0):
+        """
+        Args:
+            max_sessions: Sessões mantidas no cache
+            max_messages: Mensagens guardadas por sessão
+            trust_seconds: Segundos após uma confirmação em que a entrada é
+                usada sem conferir a versão no Redis (0 confere sempre)
+        """
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.trust_seconds = trust_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_key: str) -> Optional[CachedTail]:
+        with self._lock:
+            entry = self._entries.get(session_key)
+            if entry is not None:
+                self._entries.move_to_end(session_key)
+            return entry
+
+    def trusted(self, entry: CachedTail) -> bool:
+        """True se a entrada pode ser usada sem conferir a versão no Redis."""
+        return time.monotonic() - entry.confirmed_at < self.trust_seconds
+
+    def put(self, session_key: str, version: int, messages: List, complete: bool):
+        """Guardar as mensagens lidas do Redis na versão informada."""
+        entry = CachedTail(
+            version=version,
+            messages=deque(messages[-self.max_messages:], maxlen=self.max_messages),
+            complete=complete and len(messages) <= self.max_messages
+        )
+        with self._lock:
+            self._entries[session_key] = entry
+            self._entries.move_to_end(session_key)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+
+    def confirm(self, session_key: str, version: int) -> bool:
+        """
+        Validar a entrada com a versão atual do Redis.
+
+        Returns:
+            True se a entrada continua válida
+        """
+        with self._lock:
+            entry = self._entries.get(session_key)
+            if entry is None:
+                return False
+            if entry.version != version:
+                del self._entries[session_key]
+                metrics.incr("memory.tail_cache", result="stale")
+                return False
+            entry.confirmed_at = time.monotonic()
+            return True
+
+    def record_write(self, session_key: str, version: int, message, new_session: bool = False):
+        """
+        Aplicar uma gravação deste processo que levou a sessão para `version`.
+
+        Args:
+            new_session: A mensagem é a primeira da sessão
+        """
+        with self._lock:
+            entry = self._entries.get(session_key)
+            if entry is not None and entry.version == version - 1:
+                if len(entry.messages) == self.max_messages:
+                    # A mais antiga sai da janela
+                    entry.complete = False
+                entry.messages.append(message)
+                entry.version = version
+                entry.confirmed_at = time.monotonic()
+                self._entries.move_to_end(session_key)
+                return
+            if entry is not None:
+                # Outra instância gravou desde a última leitura
+                del self._entries[session_key]
+                metrics.incr("memory.tail_cache", result="stale")
+
+        if new_session:
+            # A entrada já é o histórico completo
+            self.put(session_key, version, [message], complete=True)
+            self.confirm(session_key, version)
+
+    def invalidate(self, session_key: str):
+        with self._lock:
+            self._entries.pop(session_key, None)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "max_sessions": self.max_sessions,
+                "max_messages": self.max_messages,
+                "trust_seconds": self.trust_seconds
+            }
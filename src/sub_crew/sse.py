@@ -0,0 +1,124 @@
+"""
+Transporte SSE (text/event-stream) das respostas do chat.
+
+Os chunks seguem o formato do AI SDK (choices[0].delta.content). A moldura
+JSON de cada resposta é montada uma vez; por chunk só o texto é serializado.
+Tokens são agrupados em frames por tamanho ou tempo. Enquanto o crew ainda
+não respondeu, eventos nomeados "progress" informam a etapa em andamento e
+comentários de heartbeat mantêm a conexão viva.
+"""
+import asyncio
+import json
+import re
+import time
+import uuid
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+from sub_crew.progress import events_until
+
+# Cabeçalhos para que proxies (nginx, load balancers) não armazenem o stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"
+}
+
+# Comentário SSE: ignorado pelos clientes, mas mantém a conexão ativa
+HEARTBEAT_FRAME = b": ping\n\n"
+
+DONE_FRAME = b"data: [DONE]\n\n"
+
+# Palavra seguida dos espaços/quebras de linha originais
+_TOKEN_PATTERN = re.compile(r"\S+\s*|\s+")
+
+
+class ChunkEnvelope:
+    """
+    Moldura dos chunks de uma resposta (mesmo id e timestamp em todos).
+    """
+
+    def __init__(self, model: str = "sindico-pro-crew"):
+        head = json.dumps({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "text_completion.chunk",
+            "created": int(time.time()),
+            "model": model
+        })[:-1]
+        self._prefix = f'data: {head}, "choices": [{{"index": 0, "delta": {{"content": '.encode("utf-8")
+        self._suffix = b'}, "finish_reason": null}]}\n\n'
+        self.final = (
+            f'data: {head}, "choices": [{{"index": 0, "delta": {{}}, "finish_reason": "stop"}}]}}\n\n'
+        ).encode("utf-8") + DONE_FRAME
+
+    def content(self, text: str) -> bytes:
+        """Frame com um trecho da resposta."""
+        return self._prefix + json.dumps(text, ensure_ascii=False).encode("utf-8") + self._suffix
+
+
+def progress_frame(event: Dict) -> bytes:
+    """Evento SSE nomeado com o progresso do crew (ignorado por quem só lê `data`)."""
+    return f"event: progress\ndata: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def error_frame(message: str, error_type: str = "server_error") -> bytes:
+    """Frame de erro (a resposta HTTP já foi iniciada)."""
+    payload = {"error": {"message": message, "type": error_type}}
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+class FrameCoalescer:
+    """
+    Agrupa tokens em frames de até `max_chars` caracteres ou `max_delay`
+    segundos desde o primeiro token pendente, o que vier antes.
+    """
+
+    def __init__(self, max_chars: int = 64, max_delay: float = 0.05):
+        self.max_chars = max_chars
+        self.max_delay = max_delay
+        self._pending = []
+        self._size = 0
+        self._started = 0.0
+
+    def add(self, token: str) -> Optional[str]:
+        """Adicionar um token; retorna um frame quando algum limite é atingido."""
+        if not self._pending:
+            self._started = time.monotonic()
+        self._pending.append(token)
+        self._size += len(token)
+        if self._size >= self.max_chars or time.monotonic() - self._started >= self.max_delay:
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[str]:
+        """Retornar o que estiver pendente (None se vazio)."""
+        if not self._pending:
+            return None
+        frame = "".join(self._pending)
+        self._pending.clear()
+        self._size = 0
+        return frame
+
+
+def split_frames(text: str, max_chars: int = 64) -> Iterator[str]:
+    """Dividir um texto pronto em frames de ~max_chars, sem cortar palavras."""
+    coalescer = FrameCoalescer(max_chars=max_chars, max_delay=float("inf"))
+    for match in _TOKEN_PATTERN.finditer(text):
+        frame = coalescer.add(match.group())
+        if frame is not None:
+            yield frame
+    frame = coalescer.flush()
+    if frame is not None:
+        yield frame
+
+
+async def heartbeats_until(task: asyncio.Future, interval: float,
+                           events: Optional[asyncio.Queue] = None) -> AsyncIterator[bytes]:
+    """
+    Emitir heartbeats a cada `interval` segundos sem atividade até `task` terminar.
+
+    Se `events` for informada, cada evento de progresso colocado na fila é
+    emitido como frame "progress" assim que chega. O resultado continua
+    disponível em task.result().
+    """
+    async for event in events_until(task, events, interval):
+        yield HEARTBEAT_FRAME if event is None else progress_frame(event)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Worker que processa jobs de chat enfileirados pela API (POST /chat/jobs).
+Pode ser executado em quantas instâncias forem necessárias; os jobs
+são distribuídos pelo consumer group do Redis Streams.
+"""
+import os
+import signal
+import socket
+import warnings
+from datetime import datetime
+
+from sub_crew.conversation import run_chat_turn
+from sub_crew.crew import SubCrew
+from sub_crew.jobs import CLAIM_IDLE_MARGIN, ChatJobQueue, create_job_queue
+from sub_crew.memory import ChatMessage
+from sub_crew.memory_factory import memory
+from sub_crew.run_control import RunControl, run_in_scope
+
+warnings.filterwarnings("ignore", category=SyntaxWarning, module="pysbd")
+
+
+class ChatWorker:
+    """
+    Consome jobs da fila e executa o crew para cada um.
+    """
+
+    def __init__(self, queue: ChatJobQueue, consumer: str, block_ms: int = 5000,
+                 job_timeout: float = 600.0):
+        # Um job que ainda roda não pode ficar ocioso tempo suficiente para
+        # ser reivindicado (XAUTOCLAIM) e executado por outro worker
+        min_claim_idle = job_timeout + CLAIM_IDLE_MARGIN
+        if queue.claim_idle_ms < min_claim_idle * 1000:
+            raise ValueError(
+                f"CHAT_JOBS_CLAIM_IDLE_SECONDS ({queue.claim_idle_ms / 1000:g}) deve ser pelo menos "
+                f"{min_claim_idle:g}: o prazo dos jobs ({job_timeout:g}s) mais {CLAIM_IDLE_MARGIN}s de folga"
+            )
+        self.queue = queue
+        self.consumer = consumer
+        self.block_ms = block_ms
+        # Prazo de cada job; ao expirar, o crew para e o job é marcado como falho
+        self.job_timeout = job_timeout
+        self.crew = SubCrew()
+        self._running = False
+
+    def stop(self, *_):
+        """Solicitar parada após o job atual."""
+        print(f"🛑 Worker {self.consumer} finalizando após o job atual...")
+        self._running = False
+
+    def process(self, entry_id: str, job_id: str):
+        """Processar um único job."""
+        job = self.queue.start(entry_id, job_id)
+        if job is None:
+            return
+
+        print(f"⚙️  Processando job {job.job_id} (sessão {job.session_id}, tentativa {job.attempts})")
+        try:
+            # Em uma nova tentativa, a pergunta pode já estar no histórico
+            if not self.queue.user_message_saved(job.job_id):
+                memory.add_message(
+                    job.session_id,
+                    ChatMessage(content=job.message, sender="user", timestamp=datetime.now()),
+                    job.user_id
+                )
+                self.queue.mark_user_message_saved(job.job_id)
+
+            response_text = run_in_scope(
+                RunControl(timeout=self.job_timeout), run_chat_turn,
+                self.crew, memory, job.message, job.session_id, job.user_id,
+                save_user_message=False
+            )
+            self.queue.complete(entry_id, job.job_id, response_text)
+            print(f"✅ Job {job.job_id} concluído")
+        except Exception as e:
+            print(f"❌ Erro ao processar job {job.job_id}: {e}")
+            self.queue.fail(entry_id, job.job_id, f"Erro ao processar mensagem: {str(e)}")
+
+    def run_forever(self):
+        """Loop principal do worker."""
+        self._running = True
+        print(f"👷 Worker {self.consumer} aguardando jobs em {self.queue.stream_key}")
+
+        while self._running:
+            try:
+                for entry_id, job_id in self.queue.read_jobs(self.consumer, block_ms=self.block_ms):
+                    self.process(entry_id, job_id)
+            except Exception as e:
+                print(f"Erro ao ler jobs do Redis: {e}")
+
+
+def run():
+    """
+    Iniciar um worker de jobs de chat.
+
+    Variáveis de ambiente:
+    - WORKER_NAME: Nome do consumidor (padrão: "<hostname>-<pid>")
+    - WORKER_BLOCK_MS: Tempo de espera por novos jobs em ms (padrão: 5000)
+    - CHAT_JOBS_TIMEOUT: Prazo de cada job em segundos (padrão: 600)
+    """
+    consumer = os.getenv("WORKER_NAME", f"{socket.gethostname()}-{os.getpid()}")
+    block_ms = int(os.getenv("WORKER_BLOCK_MS", "5000"))
+
+    queue = create_job_queue(memory.redis_client, memory.key_prefix)
+    worker = ChatWorker(queue, consumer, block_ms=block_ms,
+                        job_timeout=float(os.getenv("CHAT_JOBS_TIMEOUT", "600")))
+
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+
+    try:
+        worker.run_forever()
+    finally:
+        # Gravar as mensagens ainda no buffer de write-behind
+        memory.close()
+
+
+if __name__ == "__main__":
+    run()
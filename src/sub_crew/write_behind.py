@@ -0,0 +1,167 @@
+"""
+Buffer de write-behind (group commit) para as gravações de mensagens.
+
+As gravações de muitas requisições simultâneas ficam em filas por sessão e
+são enviadas juntas por uma thread: a cada `interval` segundos a partir da
+primeira gravação pendente, ou antes disso quando o buffer chega a
+`max_pending`. A ordem das gravações de uma mesma sessão é preservada (os
+flushes são serializados e cada sessão é uma fila FIFO), e um flush pode ser
+pedido para sessões específicas antes de uma leitura.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+from sub_crew.metrics import metrics
+
+# Lote enviado ao flush: (chave da sessão, gravações na ordem de chegada)
+Batch = List[Tuple[Hashable, List[Any]]]
+
+
+class FlushError(Exception):
+    """
+    Falha de um flush em que parte do lote já foi gravada; só `pending` (o
+    que não chegou a ser gravado) volta para o buffer.
+    """
+
+    def __init__(self, message: str, pending: Batch):
+        super().__init__(message)
+        self.pending = pending
+
+
+class WriteBehindBuffer:
+    """
+    Gravações pendentes agrupadas por sessão e enviadas em lote a `flush_fn`.
+
+    `flush_fn(batch)` executa o lote (ex.: uma pipeline do Redis). Se ela
+    falhar, as gravações voltam para o início das filas das sessões e são
+    tentadas de novo no próximo flush: todas, ou só as de FlushError.pending
+    quando parte do lote já foi gravada.
+    """
+
+    def __init__(self, flush_fn: Callable[[Batch], None], interval: float = 0.005,
+                 max_pending: int = 100):
+        """
+        Inicializar buffer e iniciar a thread de flush.
+
+        Args:
+            flush_fn: Executa um lote de gravações
+            interval: Espera máxima (segundos) de uma gravação no buffer
+            max_pending: Gravações pendentes que disparam o flush imediato
+        """
+        self._flush_fn = flush_fn
+        self.interval = interval
+        self.max_pending = max_pending
+        # Por sessão: [(momento da chegada, gravação)], em ordem de chegada
+        self._pending = OrderedDict()
+        self._size = 0
+        self._closed = False
+        # _lock protege as filas; _flush_lock serializa os flushes, para que
+        # gravações de uma sessão retiradas depois não passem à frente
+        self._lock = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, key: Hashable, item: Any):
+        """Enfileirar uma gravação na fila da sessão `key`."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Buffer de gravações encerrado")
+            self._pending.setdefault(key, []).append((time.monotonic(), item))
+            self._size += 1
+            if self._size == 1 or self._size >= self.max_pending:
+                self._lock.notify()
+
+    def flush(self, keys: Optional[Callable[[Hashable], bool]] = None, reason: str = "read") -> int:
+        """
+        Enviar as gravações pendentes (todas, ou só das sessões aceitas por
+        `keys`) e aguardar a conclusão.
+
+        Returns:
+            Número de gravações enviadas
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._size:
+                    return 0
+                if keys is None:
+                    batch = list(self._pending.items())
+                    self._pending.clear()
+                else:
+                    batch = [(key, self._pending.pop(key)) for key in list(self._pending) if keys(key)]
+                    if not batch:
+                        return 0
+                count = sum(len(entries) for _, entries in batch)
+                self._size -= count
+            self._execute(batch, count, reason)
+            return count
+
+    def _oldest(self) -> float:
+        """Chegada da gravação pendente mais antiga (chamar com _lock)."""
+        return min(entries[0][0] for entries in self._pending.values())
+
+    def _execute(self, batch: list, count: int, reason: str):
+        started = time.monotonic()
+        try:
+            self._flush_fn([(key, [item for _, item in entries]) for key, entries in batch])
+        except Exception as e:
+            if isinstance(e, FlushError):
+                # Requeue só do que não foi gravado (cada item na ordem original)
+                pending = {key: len(items) for key, items in e.pending}
+                batch = [(key, entries[len(entries) - pending[key]:])
+                         for key, entries in batch if pending.get(key)]
+            # Devolver ao início das filas, antes das gravações que chegaram depois
+            with self._lock:
+                for key, entries in reversed(batch):
+                    self._pending[key] = entries + self._pending.pop(key, [])
+                    self._pending.move_to_end(key, last=False)
+                    self._size += len(entries)
+            metrics.incr("memory.write_behind.errors")
+            raise
+        metrics.incr("memory.write_behind.flushes", reason=reason)
+        metrics.observe("memory.write_behind.batch_size", count)
+        metrics.observe("memory.write_behind.flush_seconds", time.monotonic() - started)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._size and not self._closed:
+                    self._lock.wait()
+                if self._closed:
+                    return
+                # Janela do group commit: aguardar mais gravações até o prazo
+                # da mais antiga ou até o buffer encher
+                while self._size and self._size < self.max_pending and not self._closed:
+                    remaining = self._oldest() + self.interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._lock.wait(remaining)
+                reason = "size" if self._size >= self.max_pending else "interval"
+            try:
+                self.flush(reason=reason)
+            except Exception as e:
+                print(f"Erro ao gravar mensagens pendentes no Redis: {e}")
+                # Evitar repetir sem pausa enquanto o Redis estiver indisponível
+                time.sleep(max(self.interval, 0.5))
+
+    def get_stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "max_pending": self.max_pending,
+            "pending": self._size
+        }
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """Parar a thread e gravar o que estiver pendente."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._lock.notify_all()
+        self._thread.join(timeout)
+        self.flush(reason="shutdown")
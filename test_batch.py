@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Script para testar o chat em lote (POST /chat/batch).
+Requer a API rodando:
+    python start_api.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+import requests
+import time
+from pathlib import Path
+
+# Adicionar o diretório src ao path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+def test_chat_batch():
+    """Testa a execução em lote com perguntas repetidas"""
+    
+    print("🧪 Testando chat em lote...")
+    print("=" * 60)
+    
+    payload = {
+        "questions": [
+            {"message": "Preciso contratar um contador?"},
+            {"message": "Como funciona a eleição do síndico?"},
+            {"message": "preciso contratar um contador? "},
+            {"message": "Qual o quórum para obras voluptuárias?", "session_id": "test_batch_session"}
+        ],
+        "user_id": "test_user_456"
+    }
+    
+    start = time.time()
+    try:
+        response = requests.post("http://localhost:8000/chat/batch", json=payload, stream=True)
+    except Exception as e:
+        print(f"❌ Erro de conexão: {e}")
+        return
+    
+    print(f"Status: {response.status_code}")
+    if response.status_code != 200:
+        print(f"❌ Erro: {response.text}")
+        return
+    
+    answered = set()
+    end = None
+    for line in response.iter_lines():
+        if not line:
+            continue
+        record = json.loads(line)
+        if record["type"] == "result":
+            answered.update(record["indices"])
+            print(f"  [{time.time() - start:.1f}s] perguntas {record['indices']}: {record['status']}")
+        elif record["type"] == "end":
+            end = record
+    
+    if end is None:
+        print("❌ Lote terminou sem o registro final")
+    elif answered == set(range(len(payload["questions"]))) and end["unique_questions"] == 3:
+        print(f"✅ {end['questions']} perguntas respondidas com {end['unique_questions']} execuções")
+    else:
+        print(f"❌ Resultado inesperado: {end}")
+    
+    print("\n🎉 Teste de lote concluído!")
+
+def test_retry_failed_output():
+    """Testa que --retry-failed não deixa registros repetidos por id na saída do batch"""
+    from sub_crew.batch_answers import completed_ids
+    
+    print("\n🔁 Testando --retry-failed no arquivo de saída...")
+    
+    records = [
+        {"id": 1, "question": "a", "answer": "ok"},
+        {"id": 2, "question": "b", "error": "timeout"},
+        {"id": 3, "question": "c", "answer": "ok"},
+        {"id": 2, "question": "b", "error": "timeout"}
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, "respostas.jsonl")
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+            # Última linha incompleta (processo interrompido)
+            f.write('{"id": 4, "quest')
+        
+        assert completed_ids(output_path) == {1, 2, 3}
+        assert completed_ids(output_path, retry_failed=True) == {1, 3}
+        
+        # Depois de responder o item 2 de novo, ele tem um único registro
+        with open(output_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"id": 2, "question": "b", "answer": "ok"}) + "\n")
+        with open(output_path, encoding="utf-8") as f:
+            ids = [json.loads(line)["id"] for line in f]
+    
+    if sorted(ids) == [1, 2, 3]:
+        print("✅ Um registro por id após o retry")
+    else:
+        print(f"❌ Registros repetidos na saída: {ids}")
+
+if __name__ == "__main__":
+    test_chat_batch()
+    test_retry_failed_output()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Script para testar a fila de jobs de chat (POST /chat/jobs).
+Requer a API e pelo menos um worker rodando:
+    python start_api.py
+    worker
+"""
+
+import requests
+import time
+
+def test_chat_jobs():
+    """Testa o enfileiramento e a consulta de jobs de chat"""
+    
+    print("🧪 Testando jobs de chat assíncronos...")
+    print("=" * 60)
+    
+    payload = {
+        "message": "Preciso de quórum especial para alterar a convenção?",
+        "session_id": "test_job_session_123",
+        "user_id": "test_user_456"
+    }
+    
+    # 1. Enfileirar o job
+    print("📝 Enfileirando pergunta...")
+    try:
+        response = requests.post("http://localhost:8000/chat/jobs", json=payload)
+        print(f"Status: {response.status_code}")
+        if response.status_code != 202:
+            print(f"❌ Erro ao enfileirar: {response.text}")
+            return
+        job = response.json()
+        print(f"✅ Job criado: {job['job_id']} ({job['status']})")
+    except Exception as e:
+        print(f"❌ Erro de conexão: {e}")
+        return
+    
+    print("\n" + "=" * 60)
+    
+    # 2. Aguardar o resultado com long polling
+    print("⏳ Aguardando resultado...")
+    start = time.time()
+    while time.time() - start < 180:
+        try:
+            response = requests.get(
+                f"http://localhost:8000/chat/jobs/{job['job_id']}",
+                params={"wait": 10}
+            )
+            job = response.json()
+        except Exception as e:
+            print(f"❌ Erro de conexão: {e}")
+            return
+        
+        print(f"  Status: {job['status']}")
+        if job["status"] in ("completed", "failed"):
+            break
+    
+    if job["status"] == "completed":
+        print(f"✅ Resposta em {time.time() - start:.1f}s:")
+        print(f"   {job['message'][:200]}")
+    else:
+        print(f"❌ Job não concluído: {job.get('error')}")
+    
+    # 3. Job inexistente deve retornar 404
+    response = requests.get("http://localhost:8000/chat/jobs/job-inexistente")
+    if response.status_code == 404:
+        print("✅ Job inexistente retorna 404")
+    else:
+        print(f"❌ Esperado 404, recebido {response.status_code}")
+    
+    print("\n🎉 Teste de jobs concluído!")
+
+if __name__ == "__main__":
+    test_chat_jobs()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Teste da codificação das mensagens gravadas no Redis (JSON legado vs compacta).
+"""
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+# Adicionar o diretório src ao path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from sub_crew.message_codec import decode_message, encode_message, stored_encoding
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+def test_compact_roundtrip():
+    """Testar ida e volta no formato compacto."""
+    print("📦 Testando formato compacto...")
+    
+    timestamp = datetime(2025, 3, 14, 9, 26, 53, 589000)
+    raw = encode_message("Qual o quórum para alterar a convenção?", "user", timestamp)
+    decoded = decode_message(raw)
+    
+    assert decoded["content"] == "Qual o quórum para alterar a convenção?"
+    assert decoded["sender"] == "user"
+    assert decoded["timestamp"] == timestamp
+    print(f"✅ Mensagem compacta: {len(raw)} bytes")
+    return True
+
+def test_legacy_json():
+    """Testar leitura de mensagens no formato JSON legado."""
+    print("\n📜 Testando leitura do formato legado...")
+    
+    legacy = json.dumps({
+        "content": "Olá!",
+        "sender": "assistant",
+        "timestamp": "2024-05-01T10:00:00.123456"
+    })
+    
+    for raw in (legacy, legacy.encode("utf-8")):
+        decoded = decode_message(raw)
+        assert decoded["content"] == "Olá!"
+        assert decoded["sender"] == "assistant"
+        assert decoded["timestamp"] == datetime(2024, 5, 1, 10, 0, 0, 123456)
+    
+    print("✅ JSON legado lido corretamente")
+    return True
+
+def test_size_reduction():
+    """Comparar tamanho do formato compacto com o JSON legado."""
+    print("\n📉 Comparando tamanhos...")
+    
+    timestamp = datetime.now()
+    content = "O síndico pode contratar um contador sem aprovação da assembleia?"
+    compact = encode_message(content, "user", timestamp)
+    legacy = encode_message(content, "user", timestamp, encoding="json")
+    
+    assert len(compact) < len(legacy)
+    print(f"✅ Compacto: {len(compact)} bytes | JSON: {len(legacy)} bytes")
+    return True
+
+def test_compression():
+    """Testar compressão transparente de mensagens longas."""
+    print("\n🗜️  Testando compressão...")
+    
+    content = (
+        "De acordo com o Código Civil (Lei nº 10.406/2002), o síndico é o representante legal "
+        "do condomínio e deve prestar contas à assembleia. É importante verificar o que dispõe "
+        "a convenção do condomínio e o regimento interno antes de convocar uma assembleia geral "
+        "extraordinária. Espero ter ajudado! Se tiver mais dúvidas, estou à disposição."
+    ) * 3
+    timestamp = datetime.now().replace(microsecond=0)
+    plain = encode_message(content, "assistant", timestamp)
+    compressed = encode_message(content, "assistant", timestamp, compression_threshold=512)
+    
+    assert compressed[0] == 0x02
+    assert len(compressed) < len(plain)
+    assert decode_message(compressed)["content"] == content
+    
+    # Mensagens curtas não são comprimidas
+    short = encode_message("Obrigado!", "user", timestamp, compression_threshold=512)
+    assert short[0] == 0x01
+    
+    print(f"✅ Comprimido: {len(compressed)} bytes | Original: {len(plain)} bytes")
+    return True
+
+def test_migrate_to_json():
+    """Testar migração de mensagens compactas para JSON (MESSAGE_ENCODING=json)."""
+    print("\n🔄 Testando migração compacto -> JSON...")
+    from sub_crew.memory import ChatMessage, RedisConversationMemory
+    
+    long_answer = (
+        "De acordo com o Código Civil (Lei nº 10.406/2002), o síndico é o representante legal "
+        "do condomínio e deve prestar contas à assembleia. Espero ter ajudado!"
+    ) * 5
+    compact = RedisConversationMemory(redis_url=REDIS_URL, key_prefix="test_codec:",
+                                      compression_threshold=512)
+    compact.clear_conversation("codec_session", "codec_user")
+    timestamp = datetime.now().replace(microsecond=0)
+    for content, sender in (("Posso trocar o porteiro?", "user"), (long_answer, "assistant")):
+        compact.add_message("codec_session", ChatMessage(content=content, sender=sender, timestamp=timestamp),
+                            "codec_user")
+    
+    memory = RedisConversationMemory(redis_url=REDIS_URL, key_prefix="test_codec:",
+                                     message_encoding="json", compression_threshold=0)
+    stats = memory.migrate_message_encoding()
+    assert stats["sessions_migrated"] == 1 and stats["messages_migrated"] == 2, stats
+    
+    message_key = memory._get_key("messages", "codec_session", "codec_user")
+    entries = memory.binary_client.lrange(message_key, 0, -1)
+    assert [stored_encoding(entry) for entry in entries] == ["json", "json"]
+    # A lista guarda a mais recente primeiro
+    assert [json.loads(entry)["content"] for entry in entries] == [long_answer, "Posso trocar o porteiro?"]
+    
+    # Já na codificação atual: nada a regravar
+    assert memory.migrate_message_encoding()["messages_migrated"] == 0
+    memory.clear_conversation("codec_session", "codec_user")
+    
+    print(f"✅ Migração concluída: {stats}")
+    return True
+
+def main():
+    """Função principal do teste."""
+    print("🧪 TESTE DE CODIFICAÇÃO DAS MENSAGENS")
+    print("=" * 50)
+    
+    test_compact_roundtrip()
+    test_legacy_json()
+    test_size_reduction()
+    test_compression()
+    test_migrate_to_json()
+    
+    print("\n🎉 Testes de codificação concluídos!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Teste do buffer de write-behind da memória Redis (gravação em lote).
+Requer Redis em REDIS_URL (padrão: redis://localhost:6379).
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Adicionar o diretório src ao path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from sub_crew.cold_storage import OffloadedSessionStore
+from sub_crew.memory import ChatMessage, RedisConversationMemory
+from sub_crew.write_behind import WriteBehindBuffer
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+
+class FailingOnceStore(OffloadedSessionStore):
+    """Armazenamento de sessões descarregadas cuja primeira leitura falha."""
+
+    def __init__(self, storage_path: str):
+        super().__init__(storage_path)
+        self.failed = False
+
+    def take(self, session_key: str):
+        if not self.failed:
+            self.failed = True
+            raise OSError("falha simulada no disco")
+        return super().take(session_key)
+
+
+def _message(content: str) -> ChatMessage:
+    return ChatMessage(content=content, sender="user", timestamp=datetime.now())
+
+
+def test_post_write_failure_not_repeated():
+    """Uma falha depois da gravação não pode gravar as mensagens de novo."""
+    print("🔁 Testando falha após a gravação do lote...")
+
+    with tempfile.TemporaryDirectory() as storage_path:
+        memory = RedisConversationMemory(
+            redis_url=REDIS_URL,
+            key_prefix="test_write_behind:",
+            offload_store=FailingOnceStore(storage_path),
+            write_behind_interval=60
+        )
+        sessions = ("wb_a", "wb_b")
+        for session_id in sessions:
+            memory.clear_conversation(session_id, "wb_user")
+            memory.add_message(session_id, _message(session_id), "wb_user")
+
+        # Primeira mensagem de cada sessão: a reidratação (após o EXEC) falha uma vez
+        memory.flush_writes()
+        assert len(memory.write_buffer) == 0, "Mensagens já gravadas voltaram ao buffer"
+
+        for session_id in sessions:
+            contents = [msg.content for msg in memory.get_conversation(session_id, "wb_user")]
+            count = memory.get_session_info(session_id, "wb_user").message_count
+            assert contents == [session_id], f"Mensagens duplicadas em {session_id}: {contents}"
+            assert count == 1, f"Contagem incorreta em {session_id}: {count}"
+            memory.clear_conversation(session_id, "wb_user")
+        memory.close()
+
+    print("✅ Cada mensagem gravada uma única vez")
+    return True
+
+
+def test_partial_flush_keeps_deadline():
+    """Um flush parcial não adia as gravações que continuam no buffer."""
+    print("\n⏱️  Testando prazo após flush parcial...")
+
+    flushed = []
+    buffer = WriteBehindBuffer(flushed.extend, interval=0.2)
+    buffer.add("a", 1)
+    time.sleep(0.1)
+    buffer.add("b", 2)
+    buffer.flush(lambda key: key == "b")
+
+    # "a" chegou há ~0,1 s: deve sair no prazo original (0,2 s), não 0,2 s depois do flush
+    time.sleep(0.2)
+    assert ("a", [1]) in flushed, f"Gravação pendente atrasada: {flushed}"
+    buffer.close()
+
+    print("✅ Prazo da gravação mais antiga mantido")
+    return True
+
+
+def main():
+    """Função principal do teste."""
+    print("🧪 TESTE DO WRITE-BEHIND")
+    print("=" * 60)
+
+    try:
+        test_post_write_failure_not_repeated()
+        test_partial_flush_keeps_deadline()
+        print("\n🎉 Testes de write-behind concluídos!")
+    except AssertionError as e:
+        print(f"\n❌ Falha: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()